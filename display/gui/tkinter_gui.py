@@ -260,7 +260,7 @@ class Viewport(object):
         # Save new calibration points and recalibrate image processor
         if len(self.cal_points) == 6:
             logging.debug("Saving new calibration points %s" % self.cal_points)
-            self.img_proc.scm.calibrate(self.cal_points)
+            self.img_proc.scm.calibrateAsync(list(self.cal_points))
 
     def addCalibrationColor(self, point):
         """Collects the color from clicked points and uses it to find
@@ -323,13 +323,23 @@ class Viewport(object):
         Args:
             None
         """
+        # Hidden viewports do not request a rendered frame
+        if not self.view.winfo_ismapped():
+            return
+
+        # Reuse the image processor's buffers for the displayed frame
+        buffers = self.img_proc.buffers
         frame = self.img_proc.last_frame
-        frame = cv.resize(frame, self.size)
+        size = tuple(self.size)
+        frame = cv.resize(frame, size,
+                          dst=buffers.get('viewport',
+                                          size[::-1] + frame.shape[2:]))
+        rgb_frame = buffers.get('viewport_rgb', size[::-1] + (3,))
         # Check frame dimensions if Gray or BGR and convert to RGB
         if len(frame.shape) == 2:
-            img = cv.cvtColor(frame, cv.COLOR_GRAY2RGB)
+            img = cv.cvtColor(frame, cv.COLOR_GRAY2RGB, dst=rgb_frame)
         else:
-            img = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
+            img = cv.cvtColor(frame, cv.COLOR_BGR2RGB, dst=rgb_frame)
 
         if self.cal_points:
             for cal_point in self.cal_points:
@@ -510,10 +520,12 @@ class ColorDialog(tkSimpleDialog.Dialog):
             self.colors.append([hue, sat, val])
 
     def apply(self):
+        from processors.image import detection
         for ref, color in zip(self.color_ranges, self.colors):
             ref[0] = color[0].get()
             ref[1] = color[1].get()
             ref[2] = color[2].get()
+        detection.stateChanged()
 
         logging.debug("Colors: %s" % self.color_ranges)
 
@@ -674,13 +686,17 @@ class BotFrame(tk.Frame):
         self.alert_frame.grid(row=1, column=1, sticky=(tk.S))
 
     def update(self):
-        """Updates the GUI bottom frame with the current calibration status.
+        """Updates the GUI bottom frame with the current calibration status,
+        including calibrations degraded by drift.
 
         Args:
             None
         """
         for index, img_proc in enumerate(self.image_processors):
-            if img_proc.cal_data.is_valid:
+            if img_proc.cal_data.is_valid and img_proc.cal_data.is_degraded:
+                self.string_caltext[index].set("Degraded")
+                self.label_calcolor[index].config(bg='orange')
+            elif img_proc.cal_data.is_valid:
                 self.string_caltext[index].set("Calibrated")
                 self.label_calcolor[index].config(bg='green')
             else:
@@ -938,14 +954,18 @@ class InfoBar(tk.Frame):
         frame.grid(row=0, column=1, sticky=(tk.W + tk.E))
 
     def update(self):
-        """Updates the GUI infobar with the current calibration status.
+        """Updates the GUI infobar with the current calibration status,
+        including calibrations degraded by drift.
 
         Args:
             None
         """
         pos = 0
         for img_proc in self.image_processors:
-            if img_proc.cal_data.is_valid:
+            if img_proc.cal_data.is_valid and img_proc.cal_data.is_degraded:
+                self.string_caltext[pos].set("Degraded")
+                self.label_calcolor[pos].config(bg='orange')
+            elif img_proc.cal_data.is_valid:
                 self.string_caltext[pos].set("Calibrated")
                 self.label_calcolor[pos].config(bg='green')
             else:
@@ -15,7 +15,8 @@ Functions:
 import Tkinter as tk
 import math
 import logging
-from datetime import datetime
+
+import numpy as np
 
 # TODO Cleanup this reference..
 PERSIST_TIME = 30  # Seconds # This seems reasonable.. right?
@@ -42,6 +43,7 @@ class TacticalDisplay(object):
         update()
         displayTarget()
         remapPosition()
+        remapPositions()
         getBoundingBox()
         drawBackground()
         clearTargetData()
@@ -178,16 +180,11 @@ class TacticalDisplay(object):
         else:
             # Draw track lines
             tgtTrack = self.tgtTracks[target]
-            if len(tgtTrack.target.filtered_positions) > 2:
-                # Remap track positions
-                track_pts = tgtTrack.target.filtered_positions
-                track_points = []
-                for point in track_pts:
-                    track_points.append(self.remapPosition(point))
-                # Flatten and add padding
-                track_points = flattenArray(track_points)
-                track_points = [
-                    coord + TacticalDisplay.PADDING for coord in track_points]
+            track_pts = tgtTrack.target.filtered_positions
+            if len(track_pts) > 2:
+                # Remap track positions, flattened and padded
+                track_points = (self.remapPositions(track_pts) +
+                                TacticalDisplay.PADDING).ravel().tolist()
 
                 if not tgtTrack.track:
                     tgtTrack.track = self.canvas.create_line(*track_points,
@@ -284,6 +281,26 @@ class TacticalDisplay(object):
                 float(pos[1]) / float(TacticalDisplay.MAX_RANGE) *
                 TacticalDisplay.HEIGHT]
 
+    def remapPositions(self, positions):
+        """Scales/remaps several positions to display accurately on the
+        tactical display.
+
+        Args:
+            positions: An N x 2 array of 2-D position coordinates.
+
+        Returns:
+            An N x 2 array of remapped 2-D position coordinates.
+        """
+        positions = np.asarray(positions, np.float64)
+        remapped = np.empty_like(positions)
+        remapped[:, 0] = (positions[:, 0] /
+                          float(TacticalDisplay.MAX_RANGE * 2) *
+                          TacticalDisplay.WIDTH + (TacticalDisplay.WIDTH / 2))
+        remapped[:, 1] = (TacticalDisplay.HEIGHT - positions[:, 1] /
+                          float(TacticalDisplay.MAX_RANGE) *
+                          TacticalDisplay.HEIGHT)
+        return remapped
+
     def getBoundingBox(self, width, height=None,
                        pos=[float(WIDTH) / 2.0, HEIGHT]):
         """Returns the corner coordinates of a specified bounding box in the
@@ -370,17 +387,13 @@ class TacticalDisplay(object):
             A list of expired targets.
         """
 
-        remove_list = []
+        # Find targets whose last update is older than persistance time
+        remove_list = self.data_proc.ttm.findExpiredTargets(PERSIST_TIME)
 
-        for tgtTrack in self.tgtTracks.itervalues():
-            # Check if last update is older than persistance time
-            update_interval = (
-                datetime.now() - tgtTrack.target.last_update).seconds
-
-            if update_interval > PERSIST_TIME:
-                # Delete from display and mark target for removal
-                tgtTrack.removeDisplayObjects(self.canvas)
-                remove_list.append(tgtTrack.target)
+        # Delete from display
+        for target in remove_list:
+            if target in self.tgtTracks:
+                self.tgtTracks[target].removeDisplayObjects(self.canvas)
 
         return remove_list
 
@@ -392,8 +405,8 @@ class TacticalDisplay(object):
         """
 
         for target in remove_list:
-            del self.tgtTracks[target]
-            self.data_proc.targets.remove(target)
+            self.tgtTracks.pop(target, None)
+            self.data_proc.ttm.removeTarget(target)
 
     def toggleRunningDogTest(self):
         """Toggles the "running dog test" status boolean.
@@ -0,0 +1,176 @@
+"""
+Associates detections with tracks by global nearest neighbor.
+
+The distance from every track to every detection is computed at once in a
+cost matrix. Pairs further apart than the gate of their track cannot be
+associated. The assignment that associates the most pairs with the smallest
+total distance is then found with the Hungarian method, so that nearby
+tracks do not swap detections depending on the order they are visited in.
+
+Tracks and detections are split into independent blocks whose members are
+only linked through gated pairs, and each block is solved on its own. With
+many tracks spread over the area the blocks stay small, so the cost of
+solving grows with the size of the largest block rather than the number of
+tracks.
+
+Functions:
+    associate()
+    buildCostMatrix()
+    findGatedBlocks()
+    solveAssignment()
+"""
+import numpy as np
+
+
+def associate(track_positions, gates, detections):
+    """Finds the global nearest neighbor assignment of detections to tracks.
+
+    Args:
+        track_positions: A T x 2 array of expected track positions.
+        gates: An array of the T maximum association distances.
+        detections: A D x 2 array of detected positions.
+
+    Returns:
+        A three-element tuple of the T x D cost matrix, a list of associated
+        (track, detection) index pairs and a list of unassociated detection
+        indices. Costs of pairs outside the gate are infinite.
+    """
+    cost = buildCostMatrix(track_positions, gates, detections)
+    matches = []
+    for rows, cols in findGatedBlocks(np.isfinite(cost)):
+        block = cost[np.ix_(rows, cols)]
+        for row, col in solveAssignment(block):
+            if np.isfinite(block[row, col]):
+                matches.append((rows[row], cols[col]))
+
+    matched = set(col for _, col in matches)
+    unmatched = [col for col in xrange(cost.shape[1]) if col not in matched]
+    return (cost, matches, unmatched)
+
+
+def buildCostMatrix(track_positions, gates, detections):
+    """Calculates the distance from every track to every detection.
+
+    Args:
+        track_positions: A T x 2 array of expected track positions.
+        gates: An array of the T maximum association distances.
+        detections: A D x 2 array of detected positions.
+
+    Returns:
+        A T x D array of distances, which are infinite outside the gate of
+        the track.
+    """
+    track_positions = np.asarray(track_positions, np.float64).reshape(-1, 2)
+    detections = np.asarray(detections, np.float64).reshape(-1, 2)
+    gates = np.asarray(gates, np.float64).reshape(-1, 1)
+
+    cost = np.hypot(
+        track_positions[:, np.newaxis, 0] - detections[np.newaxis, :, 0],
+        track_positions[:, np.newaxis, 1] - detections[np.newaxis, :, 1])
+    cost[cost >= gates] = np.inf
+    return cost
+
+
+def findGatedBlocks(gated):
+    """Splits tracks and detections into blocks that share no gated pairs.
+    Tracks and detections without any gated pair are left out.
+
+    Args:
+        gated: A T x D boolean array of pairs inside the gate.
+
+    Returns:
+        A list of blocks, each a two-element tuple of an array of track
+        indices and an array of detection indices.
+    """
+    track_free = gated.any(axis=1)
+    detection_free = gated.any(axis=0)
+    blocks = []
+    for start in np.flatnonzero(track_free):
+        if not track_free[start]:
+            continue
+
+        # Grow the block from a track until no new pairs are found
+        tracks = np.zeros(len(track_free), np.bool_)
+        tracks[start] = True
+        track_free[start] = False
+        new_tracks = tracks.copy()
+        detections = np.zeros(len(detection_free), np.bool_)
+        while new_tracks.any():
+            new_detections = gated[new_tracks].any(axis=0) & detection_free
+            detection_free &= ~new_detections
+            detections |= new_detections
+            new_tracks = gated[:, new_detections].any(axis=1) & track_free
+            track_free &= ~new_tracks
+            tracks |= new_tracks
+
+        blocks.append((np.flatnonzero(tracks), np.flatnonzero(detections)))
+    return blocks
+
+
+def solveAssignment(cost):
+    """Finds the assignment of rows to columns with the smallest total cost
+    using the Hungarian method. Every row is assigned if there are no more
+    rows than columns, otherwise every column is assigned.
+
+    Infinite costs are replaced with a cost larger than any assignment of
+    finite costs, so the most pairs with finite costs are assigned. Callers
+    should discard assigned pairs with infinite costs.
+
+    Args:
+        cost: An N x M array of costs.
+
+    Returns:
+        A list of assigned (row, column) index pairs.
+    """
+    cost = np.array(cost, np.float64)
+    if not cost.size:
+        return []
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    finite = np.isfinite(cost)
+    if not finite.all():
+        limit = cost[finite].max() if finite.any() else 0.0
+        cost[~finite] = (limit + 1.0) * (cost.shape[0] + 1)
+
+    # Shortest augmenting path with row and column potentials, using
+    # 1-based indices where column 0 holds the row being assigned
+    rows, cols = cost.shape
+    row_potentials = np.zeros(rows + 1)
+    col_potentials = np.zeros(cols + 1)
+    col_rows = np.zeros(cols + 1, np.intp)
+    previous = np.zeros(cols + 1, np.intp)
+    for row in xrange(1, rows + 1):
+        col_rows[0] = row
+        col = 0
+        slack = np.empty(cols + 1)
+        slack.fill(np.inf)
+        used = np.zeros(cols + 1, np.bool_)
+        while col_rows[col] != 0:
+            used[col] = True
+            free = ~used
+            reduced = (cost[col_rows[col] - 1] -
+                       row_potentials[col_rows[col]] - col_potentials[1:])
+            improved = free[1:] & (reduced < slack[1:])
+            slack[1:][improved] = reduced[improved]
+            previous[1:][improved] = col
+
+            candidates = np.where(free, slack, np.inf)
+            candidates[0] = np.inf
+            next_col = candidates.argmin()
+            delta = candidates[next_col]
+            row_potentials[col_rows[used]] += delta
+            col_potentials[used] -= delta
+            slack[free] -= delta
+            col = next_col
+
+        # Flip the assignments along the augmenting path
+        while col != 0:
+            col_rows[col] = col_rows[previous[col]]
+            col = previous[col]
+
+    pairs = [(col_rows[col] - 1, col - 1) for col in xrange(1, cols + 1)
+             if col_rows[col] != 0]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return sorted(pairs)
@@ -4,12 +4,31 @@ whether identified targets are unique or reference the same object. For
 instance, this functionality allows the system to recognize a target as a
 single object even while viewed by multiple image sources simultaneously.
 
+Detections are clustered by complete linkage: the two clusters whose
+furthest detections are closest are merged first, as long as every pair of
+detections in the merged cluster is closer than the merge radius. Detections
+are hashed into a grid of cells the size of the merge radius, so each
+detection is only compared with the detections in its own and the neighboring
+cells. Each cluster is reduced to the mean of its detections once clustering
+is finished. The clusters only depend on the set of detections, not on the
+order of the image processors.
+
+Image sources are read one after another, so their frames are captured at
+different times. Before clustering, each detection is moved to the capture
+time of the most recent frame using the velocity of the nearest track, so a
+moving target seen by several cameras is still merged into one position.
+
 Classes:
 TargetCorrelationModule
 """
 import math
 import numpy as np
 
+# Default distance within which detections reference the same object (feet)
+MERGE_RADIUS = 0.5
+# Default maximum time a detection is moved to align it (seconds)
+MAX_TIME_SKEW = 0.25
+
 
 class TargetCorrelationModule(object):
     """Analyzes detected targets from all system image processors and
@@ -17,55 +36,184 @@ class TargetCorrelationModule(object):
     object. This is done by comparing their relative proximity.
 
     Attributes:
-        image_processor: An ImageProcessor object.
+        data_processor: A DataProcessor object.
+        fusion_time: The capture time in seconds that the most recent unique
+            positions are aligned to, or None if it is not known.
 
     Methods:
         checkUnique()
+        alignPositions()
+        clusterPositions()
     """
-    def __init__(self, image_processor):
-        self.image_processor = image_processor
+    CONSTANTS_SET = False
+    MERGE_RADIUS = MERGE_RADIUS
+    MAX_TIME_SKEW = MAX_TIME_SKEW
+
+    def __init__(self, data_processor):
+        self.data_processor = data_processor
+        self.fusion_time = None
+
+        if not TargetCorrelationModule.CONSTANTS_SET and \
+                self.data_processor.config is not None:
+            TargetCorrelationModule.MERGE_RADIUS = \
+                self.data_processor.config.getfloat('correlation',
+                                                    'merge_radius')
+            TargetCorrelationModule.MAX_TIME_SKEW = \
+                self.data_processor.config.getfloat('correlation',
+                                                    'max_time_skew')
+            TargetCorrelationModule.CONSTANTS_SET = True
 
     def checkUnique(self, image_processors):
         """Reads in one or more ImageProcessor objects and determines whether
         identified targets in these image processors are unique or reference
         the same object.
 
-        Detections located within 0.5 feet of each other are assumed to
-        reference the same object. In this case, the two target postions are
-        averaged into a single coordinate and added to the unique positions
-        list. The unique positions list stores the coordinates of all targets
-        identified as unique across all image processors.
+        Detections located within the merge radius of each other are assumed
+        to reference the same object. In this case, the target positions are
+        averaged into a single coordinate. The returned positions are the
+        coordinates of all targets identified as unique across all image
+        processors, aligned to the capture time of the most recent frame.
 
         Args:
             image_processors: A list of ImageProcessor objects.
 
         Returns:
-            A list of 2-D coordinates.
+            An N x 2 array of global coordinates.
+        """
+        self.fusion_time = None
+
+        # Check for calibrated system condition
+        image_processors = [image_processor
+                            for image_processor in image_processors
+                            if image_processor.cal_data.is_valid and
+                            image_processor.valid_targets is not None]
+        if not image_processors:
+            return np.empty((0, 2))
+
+        # Align all detections to the most recent capture time
+        times = [image_processor.valid_time
+                 for image_processor in image_processors]
+        if None in times:
+            positions = [image_processor.valid_targets
+                         for image_processor in image_processors]
+        else:
+            self.fusion_time = max(times)
+            positions = [self.alignPositions(image_processor.valid_targets,
+                                             self.fusion_time - valid_time)
+                         for image_processor, valid_time
+                         in zip(image_processors, times)]
+
+        return self.clusterPositions(np.vstack(positions))
+
+    def alignPositions(self, positions, time_offset):
+        """Moves positions forward in time using the velocity of the nearest
+        track within the association gate. Positions without a nearby track
+        are not moved.
+
+        Args:
+            positions: An N x 2 array of global coordinates.
+            time_offset: The time in seconds to move the positions forward,
+                limited to MAX_TIME_SKEW.
+
+        Returns:
+            An N x 2 array of global coordinates.
         """
+        from track import TargetTrackModule
+
+        time_offset = min(time_offset, TargetCorrelationModule.MAX_TIME_SKEW)
+        targets = [target for target in self.data_processor.ttm.targets
+                   if target.kalman is not None]
+        if time_offset <= 0 or not targets or not len(positions):
+            return positions
+
+        track_positions = np.array([target.pos[0:2] for target in targets],
+                                   np.float64)
+        velocities = np.array([target.getVelocity() for target in targets],
+                              np.float64)
+
+        # Find the nearest track of each position
+        distances = np.hypot(
+            positions[:, np.newaxis, 0] - track_positions[np.newaxis, :, 0],
+            positions[:, np.newaxis, 1] - track_positions[np.newaxis, :, 1])
+        nearest = distances.argmin(axis=1)
+        tracked = (distances[np.arange(len(positions)), nearest] <
+                   TargetTrackModule.UNKNOWN_GATE)
+
+        return positions + (velocities[nearest] * time_offset *
+                            tracked[:, np.newaxis])
+
+    def clusterPositions(self, positions):
+        """Clusters positions closer than the merge radius and returns the
+        mean position of each cluster.
+
+        Clusters are merged by complete linkage, so no two positions of a
+        cluster are further apart than the merge radius. Ties are broken by
+        the sorted order of the positions, and clusters are ordered by their
+        smallest position, so the result does not depend on the order of the
+        positions.
+
+        Args:
+            positions: An N x 2 array of global coordinates.
+
+        Returns:
+            An M x 2 array of global coordinates.
+        """
+        radius = TargetCorrelationModule.MERGE_RADIUS
+        positions = np.asarray(positions, np.float64).reshape(-1, 2)
+        count = len(positions)
+        if count < 2:
+            return positions.copy()
+
+        # Sort the positions so that ties are broken the same way for any
+        # order of the input
+        positions = positions[np.lexsort((positions[:, 1], positions[:, 0]))]
+
+        # Hash each position into a grid cell the size of the merge radius
+        # and find the pairs of positions within the merge radius, comparing
+        # each position only with positions in the same or neighboring cells
+        cells = {}
+        keys = np.floor(positions / radius).astype(np.int64).tolist()
+        for i, key in enumerate(keys):
+            cells.setdefault(tuple(key), []).append(i)
+        points = positions.tolist()
+        links = {}
+        for i, (col, row) in enumerate(keys):
+            x, y = points[i]
+            for neighbor_col in (col - 1, col, col + 1):
+                for neighbor_row in (row - 1, row, row + 1):
+                    for j in cells.get((neighbor_col, neighbor_row), ()):
+                        if j <= i:
+                            continue
+                        distance = math.hypot(points[j][0] - x,
+                                              points[j][1] - y)
+                        if distance < radius:
+                            links[(i, j)] = distance
+
+        # Merge the closest pair of clusters until no pair is linked. The
+        # link of two clusters is the distance of their furthest positions,
+        # and is missing when any of their positions are not within the
+        # merge radius. Clusters are named by their smallest position.
+        labels = range(count)
+        while links:
+            first, second = min(links, key=lambda pair: (links[pair], pair))
+            del links[(first, second)]
+            merged = {}
+            for (i, j), distance in links.items():
+                if i in (first, second) or j in (first, second):
+                    del links[(i, j)]
+                    other = j if i in (first, second) else i
+                    merged.setdefault(other, []).append(distance)
+            for other, distances in merged.iteritems():
+                # Only clusters linked with both merged clusters stay linked
+                if len(distances) == 2:
+                    links[(min(first, other), max(first, other))] = \
+                        max(distances)
+            labels = [first if label == second else label
+                      for label in labels]
 
-        from data import distance
-
-        unique_positions = []
-        for image_processor in image_processors:
-            # Check for calibrated system condition
-            if not image_processor.cal_data.is_valid:
-                continue
-
-            # Compare all valid targets, looking for closely adjacent pairs
-            for position in image_processor.valid_targets:
-                position_matched = False
-                for i, unique_position in enumerate(unique_positions):
-                    # Targets located within 0.5 feet of each other have their
-                    # positions averaged into a single coordinate that is
-                    # then added to the unique positions list
-                    if distance(position, unique_position) < 0.5:
-                        unique_positions[i] = np.mean((position,
-                                                      unique_position), axis=0)
-                        position_matched = True
-                        break
-                # Targets distanced from other targets have their coordinates
-                # added to the unique positions list
-                if not position_matched:
-                    unique_positions.append(position)
-
-        return unique_positions
+        # Average the final positions of each cluster
+        _, labels = np.unique(labels, return_inverse=True)
+        sizes = np.bincount(labels).astype(np.float64)
+        return np.column_stack(
+            (np.bincount(labels, positions[:, 0]) / sizes,
+             np.bincount(labels, positions[:, 1]) / sizes))
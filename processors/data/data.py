@@ -8,7 +8,9 @@ finalized position list is then provided to the Target Track Module
 for track assignment and updating.
 
 Additional functionality converts image coordinates into the global
-reference frame and also removes image source distortion.
+reference frame and also removes image source distortion. Detections are
+undistorted point by point, so whole frames are only remapped when an
+undistorted image is requested.
 
 Classes:
     DataProcessor
@@ -16,7 +18,9 @@ Classes:
 Functions:
     distance()
     undistortImage()
+    undistortPoints()
     convertToGlobal()
+    convertPointsToGlobal()
 """
 import math
 import logging
@@ -27,6 +31,7 @@ from discrimination import TargetDisciminationModule
 from track import TargetTrackModule
 from target import Target
 from correlation import TargetCorrelationModule
+from prediction import predictAllFromSums
 
 AREA_THRESHOLD = 50
 DETECT_THRESHOLD = 0.75
@@ -57,6 +62,7 @@ class DataProcessor(object):
 
     Methods:
         process()
+        predictIntersections()
         clearTargetData()
         toggleActive()
     """
@@ -79,6 +85,9 @@ class DataProcessor(object):
         finalized position list is then provided to the Target Track Module
         for track assignment and updating.
 
+        Prediction line intersections of all targets in the alert zone are
+        then calculated together, using the zone distances of this cycle.
+
         NOTE: The is_active attribute must be True for processing to occur.
 
         Args:
@@ -103,8 +112,17 @@ class DataProcessor(object):
         logging.debug("-" * 20)
         logging.debug("UNIQUE POSITIONS: %s" % unique_positions)
 
+        # Snapshot the zone geometry for this cycle
+        zone_distances = self.tca.image_processors[0].scm. \
+            getCalibrationDistances()
+        Target.PREDICTION_RADIUS = zone_distances[2]
+        Target.SAFE_RADIUS = zone_distances[0]
+        self.ttm.zone_distances = zone_distances
+
         # Store finalized list of targets and assign/update tracks
-        self.ttm.processDetections(unique_positions)
+        self.ttm.processDetections(unique_positions.tolist(),
+                                   self.tcm.fusion_time)
+        self.predictIntersections(zone_distances)
 
         # TODO Clean reference up
         self.targets = self.ttm.targets
@@ -112,13 +130,41 @@ class DataProcessor(object):
         for target in self.ttm.targets:
             logging.debug("TARGET: %s" % target)
 
+    def predictIntersections(self, zone_distances):
+        """Calculates the prediction line intersections of all valid targets
+        updated this cycle that are located in the alert zone.
+
+        Args:
+            zone_distances: A list of the safe, alert and prediction zone
+                distances.
+        """
+        store = self.ttm.store
+        history = store.prediction_history
+        ranges = np.hypot(store.positions[:, 0], store.positions[:, 1])
+        alert = np.flatnonzero(store.active & store.updated & store.valid &
+                               (ranges > zone_distances[0]) &
+                               (ranges < zone_distances[1]))
+        if not len(alert):
+            return
+
+        intersects = predictAllFromSums(history.counts[alert],
+                                        history.sums[alert],
+                                        Target.PREDICTION_RADIUS,
+                                        Target.NUM_PREDICTION_VALS)
+        store.intersects[alert] = intersects
+
+        # Keep the first intersection of each target
+        initial = (np.isnan(store.initial_intersects[alert, 0]) &
+                   ~np.isnan(intersects[:, 0]))
+        store.initial_intersects[alert[initial]] = intersects[initial]
+
     def clearTargetData(self):
         """Erases all stored target data.
 
         Args:
             None
         """
-        del self.ttm.targets[:]
+        self.ttm.clearTargets()
         del self.targets[:]
 
     def toggleActive(self):
@@ -148,6 +194,8 @@ def undistortImage(imageProc, image):
     """Removes distortion from image by applying intrinsic matrix and
     distortion coefficients.
 
+    The distortion maps are calculated on first use.
+
     Note: ImageProcessor must have intrinsic parameters already loaded.
 
     Args:
@@ -157,7 +205,29 @@ def undistortImage(imageProc, image):
     Returns:
         An undistorted 8-bit image array.
     """
-    return cv2.remap(image, imageProc.map1, imageProc.map2, cv2.INTER_LINEAR)
+    map1, map2 = imageProc.scm.getDistortionMaps()
+    return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+
+def undistortPoints(imageProc, points):
+    """Removes distortion from image coordinates by applying the intrinsic
+    matrix and distortion coefficients.
+
+    Note: ImageProcessor must have intrinsic parameters already loaded.
+
+    Args:
+        imageProc: An ImageProcessor object.
+        points: An N x 2 array of distorted image coordinates.
+
+    Returns:
+        An N x 2 array of undistorted image coordinates.
+    """
+    cal_data = imageProc.cal_data
+    points = np.asarray(points, np.float64).reshape(-1, 1, 2)
+    if not len(points):
+        return points.reshape(-1, 2)
+    return cv2.undistortPoints(points, cal_data.intrinsic, cal_data.distortion,
+                               P=cal_data.intrinsic).reshape(-1, 2)
 
 
 def convertToGlobal(imageProc, coordinates):
@@ -171,29 +241,22 @@ def convertToGlobal(imageProc, coordinates):
     Returns:
         A 2-D global coordinate.
     """
-    # Convert to numpy array
-    coordinates = np.array(coordinates)
+    return convertPointsToGlobal(imageProc, [coordinates])[0].tolist()
 
-    imgPoint = np.ones((3, 1), np.float32)
-    imgPoint[0, 0] = coordinates[0]
-    imgPoint[1, 0] = coordinates[1]
 
-    # Convert to matrix to simplify the following linear algebra
-    imgPoint = np.matrix(imgPoint)
-    intrinsic = np.matrix(imageProc.cal_data.intrinsic)
-    rotation = np.matrix(imageProc.cal_data.rotation)
-    translation = np.matrix(imageProc.cal_data.translation)
+def convertPointsToGlobal(imageProc, points):
+    """Converts 2-D image coordinates to 2-D global coordinates using the
+    ground plane homography of the calibration data. Lens distortion is
+    removed from the coordinates first.
 
-    leftMat = np.linalg.inv(rotation) * np.linalg.inv(intrinsic) * imgPoint
-    rightMat = np.linalg.inv(rotation) * translation
-    s = rightMat[2, 0]
-    s /= leftMat[2, 0]
-
-    position = np.array(np.linalg.inv(rotation)*(s * np.linalg.inv(intrinsic)
-                                               * imgPoint - translation))[:2]
-
-    # Convert from numpy to list
-    from display.tactical.tactical import flattenArray
-    position = flattenArray(position.tolist())
+    Args:
+        imageProc: An ImageProcessor object.
+        points: An N x 2 array of image coordinates.
 
-    return position
+    Returns:
+        An N x 2 array of global coordinates.
+    """
+    homography = imageProc.cal_data.getGroundHomography()
+    points = undistortPoints(imageProc, points)
+    ground = np.dot(points, homography[:, :2].T) + homography[:, 2]
+    return ground[:, :2] / ground[:, 2:]
@@ -1,6 +1,12 @@
 """
-The target discrimination module analyzes detected contours from an image and
-filters them based on location and size.
+The target discrimination module analyzes detected objects from an image and
+filters them based on location and size. Objects are read from the BlobTable
+produced by the object detection module, so their areas and enclosing circles
+are not recomputed here. When the image source has a ground table, object
+positions and the zone test are read from it rather than computed. The tables
+are interpolated bilinearly at the sub-pixel object centers.
+
+All objects of a frame are filtered together with array operations.
 
 If a contour has a center coordinate outside the designated boundary area,
 these contours are removed from the pool of valid targets. Similarly, contours
@@ -8,6 +14,9 @@ that do not fall within a selected size range are also ignored.
 
 Classes:
     TargetDisciminationModule
+
+Functions:
+    sampleTable()
 """
 import math
 import cv2
@@ -18,6 +27,13 @@ import data
 MIN_AREA_THRESHOLD = 100
 MAX_AREA_THRESHOLD = 7500
 
+# Expected contour area model (EXPECTED_AREA_SCALE * distance ^
+# EXPECTED_AREA_POWER) and the accepted window around it
+EXPECTED_AREA_SCALE = 1903
+EXPECTED_AREA_POWER = -0.861
+EXPECTED_AREA_MIN = 0.4
+EXPECTED_AREA_MAX = 1.8
+
 ORIGIN = [0, 0]
 
 
@@ -52,50 +68,97 @@ class TargetDisciminationModule(object):
         large or small are also ignored.
 
         Args:
-            contour_data: An array containing vectors of contour points.
+            contour_data: A BlobTable object of detected objects.
             image_processor: An ImageProcessor object.
 
         Returns:
-            A list of 2-D coordinates.
+            An M x 2 array of global coordinates.
         """
-        from data import distance
-        from data import convertToGlobal
+        from data import convertPointsToGlobal
         from processors.image.calibration import SourceCalibrationModule
 
-        valid_targets = []
-        for contour in contour_data:
-            # Check for acceptable contour area
-            area = cv2.contourArea(contour)
-            if area > MIN_AREA_THRESHOLD and area < MAX_AREA_THRESHOLD:
-                # Check if object is within the demo area boundaries
-                center, radius = cv2.minEnclosingCircle(contour)
-
-               # Offset the value we use in the system based on config input
-                if (TargetDisciminationModule.TARGET_CENTER_OFFSET_OPTION
-                        == "BOTTOM"):
-                    center = np.array([center[0], center[1] + radius])
-                elif (TargetDisciminationModule.TARGET_CENTER_OFFSET_OPTION
-                        == "TOP"):
-                    center = np.array([center[0], center[1] - radius])
-
-                pos = convertToGlobal(image_processor, center)
-                position_in_demo_area = (math.fabs(pos[0]) * math.tan(0.5236)
-                                         < math.fabs(pos[1]))
-
-                # Limit the TCA to the zone boundary (with padding)
-                max_zone_distance = (SourceCalibrationModule.ZONE_DISTANCES[-1]
-                                     + 0.25)
-                if (distance(pos, ORIGIN) <= max_zone_distance
-                        and position_in_demo_area):
-                    # Calculate expected target contour area based on distance
-                    # from camera
-                    expected_contour = 1903 * math.pow(distance(pos, ORIGIN),
-                                                       -0.861)
-                    upper_area = 1.8 * expected_contour
-                    lower_area = 0.4 * expected_contour
-                    # Add to target list if size conditions satisfied
-                    if area > lower_area and area < upper_area:
-                        valid_targets.append(pos)
+        # Check for acceptable contour area
+        areas = contour_data.areas
+        sized = (areas > MIN_AREA_THRESHOLD) & (areas < MAX_AREA_THRESHOLD)
+        centers = contour_data.centers[sized]
+        radii = contour_data.radii[sized]
+
+        # Offset the value we use in the system based on config input
+        if TargetDisciminationModule.TARGET_CENTER_OFFSET_OPTION == "BOTTOM":
+            centers[:, 1] += radii
+        elif TargetDisciminationModule.TARGET_CENTER_OFFSET_OPTION == "TOP":
+            centers[:, 1] -= radii
+
+        ground_table, zone_table = image_processor.scm.getGroundTable()
+        if ground_table is not None:
+            # Interpolate the ground position and zone flag of each object
+            # center
+            height, width = zone_table.shape
+            xs = centers[:, 0]
+            ys = centers[:, 1]
+            in_image = ((xs >= 0) & (xs <= width - 1) &
+                        (ys >= 0) & (ys <= height - 1))
+            positions = sampleTable(ground_table, xs, ys)
+            in_zone = (sampleTable(zone_table, xs, ys) >= 0.5) & in_image
+        else:
+            # Project all object centers to the ground at once
+            positions = convertPointsToGlobal(image_processor, centers)
+
+            # Check if objects are within the demo area boundaries, limiting
+            # the TCA to the zone boundary (with padding)
+            max_zone_distance = (SourceCalibrationModule.ZONE_DISTANCES[-1]
+                                 + 0.25)
+            in_zone = ((np.abs(positions[:, 0]) * math.tan(0.5236) <
+                        np.abs(positions[:, 1])) &
+                       (np.hypot(positions[:, 0], positions[:, 1]) <=
+                        max_zone_distance))
+
+        # Calculate expected target contour area based on distance from
+        # camera, keeping objects whose area is within the expected window
+        areas = areas[sized]
+        with np.errstate(divide='ignore'):
+            expected_areas = EXPECTED_AREA_SCALE * np.power(
+                np.hypot(positions[:, 0], positions[:, 1]),
+                EXPECTED_AREA_POWER)
+        valid = (in_zone &
+                 (areas > EXPECTED_AREA_MIN * expected_areas) &
+                 (areas < EXPECTED_AREA_MAX * expected_areas))
+        valid_targets = positions[valid]
 
         image_processor.valid_targets = valid_targets
+        image_processor.valid_time = image_processor.frame_time
         return valid_targets
+
+
+def sampleTable(table, xs, ys):
+    """Samples a table of per-pixel values at sub-pixel image coordinates by
+    bilinear interpolation. Coordinates outside the image are clamped to its
+    edges.
+
+    Args:
+        table: An H x W or H x W x N array of per-pixel values.
+        xs: An array of M image x coordinates.
+        ys: An array of M image y coordinates.
+
+    Returns:
+        An array of M interpolated values, or an M x N array for an
+        H x W x N table.
+    """
+    height, width = table.shape[:2]
+    xs = np.clip(np.asarray(xs, np.float64), 0, width - 1)
+    ys = np.clip(np.asarray(ys, np.float64), 0, height - 1)
+    cols = np.floor(xs).astype(np.intp)
+    rows = np.floor(ys).astype(np.intp)
+    next_cols = np.minimum(cols + 1, width - 1)
+    next_rows = np.minimum(rows + 1, height - 1)
+    col_weights = xs - cols
+    row_weights = ys - rows
+    if table.ndim == 3:
+        col_weights = col_weights[:, np.newaxis]
+        row_weights = row_weights[:, np.newaxis]
+
+    top = ((1 - col_weights) * table[rows, cols] +
+           col_weights * table[rows, next_cols])
+    bottom = ((1 - col_weights) * table[next_rows, cols] +
+              col_weights * table[next_rows, next_cols])
+    return (1 - row_weights) * top + row_weights * bottom
@@ -0,0 +1,250 @@
+"""
+Provides the Kalman filters of all tracked targets as a single filter bank.
+
+The state vectors and covariances of every track are stacked in numpy arrays,
+one row per slot, so that all tracks updated in a cycle are corrected and
+predicted together. Each track holds the index of its slot. Slots of retired
+tracks are kept on a free list and handed to new tracks, and the arrays
+double in size when no slot is free.
+
+Every filter tracks a constant velocity state (x, y, x velocity, y velocity)
+from position measurements. Filters are propagated by the measured time
+between the updates of their track rather than a fixed time step, with the
+process noise scaled by the same interval, so velocities stay in feet per
+second however fast the system runs. The next state of a track is predicted
+one measured update interval ahead.
+
+Classes:
+    KalmanFilterBank
+"""
+import numpy as np
+
+# Number of slots allocated when a filter bank is created
+INITIAL_CAPACITY = 16
+
+
+class KalmanFilterBank(object):
+    """Stores and runs the Kalman filters of all tracks.
+
+    Attributes:
+        time_step: The nominal number of seconds between updates, used
+            before the interval of a track has been measured.
+        process_noise: The 4 x 4 process noise covariance matrix of one
+            nominal time step.
+        measurement_noise: The 2 x 2 measurement noise covariance matrix.
+        states: A N x 4 array of corrected states, one row per slot.
+        covariances: A N x 4 x 4 array of corrected error covariances.
+        predicted_states: A N x 4 array of predicted states.
+        predicted_covariances: A N x 4 x 4 array of predicted error
+            covariances.
+        active: A boolean array indicating which slots are in use.
+        times: An array of the time in seconds of the last update of each
+            slot, NaN before the first update.
+        intervals: An array of the last measured number of seconds between
+            the updates of each slot.
+
+    Methods:
+        allocate()
+        reset()
+        release()
+        clear()
+        grow()
+        update()
+        correct()
+        predict()
+    """
+    def __init__(self, time_step, process_noise, measurement_noise,
+                 capacity=INITIAL_CAPACITY):
+        self.time_step = time_step
+        self.process_noise = np.eye(4) * process_noise
+        self.measurement_noise = np.eye(2) * measurement_noise
+        self.states = np.zeros((capacity, 4))
+        self.covariances = np.zeros((capacity, 4, 4))
+        self.predicted_states = np.zeros((capacity, 4))
+        self.predicted_covariances = np.zeros((capacity, 4, 4))
+        self.active = np.zeros(capacity, np.bool_)
+        self.times = np.empty(capacity)
+        self.times.fill(np.nan)
+        self.intervals = np.empty(capacity)
+        self.intervals.fill(time_step)
+        self.__free = range(capacity - 1, -1, -1)
+
+    def allocate(self, pos, velocity=(0, 0)):
+        """Assigns a free slot to a new filter, growing the bank if none is
+        free.
+
+        Args:
+            pos: A two element list of the initial X and Y position.
+            velocity: A two element list of the initial X and Y velocity.
+
+        Returns:
+            The integer index of the slot.
+        """
+        if not self.__free:
+            self.grow()
+        slot = self.__free.pop()
+        self.active[slot] = True
+        self.times[slot] = np.nan
+        self.intervals[slot] = self.time_step
+        self.reset(slot, pos, velocity)
+        return slot
+
+    def reset(self, slot, pos, velocity=(0, 0)):
+        """Restarts the filter of a slot from a position and velocity.
+
+        Args:
+            slot: The index of the slot.
+            pos: A two element list of the initial X and Y position.
+            velocity: A two element list of the initial X and Y velocity.
+        """
+        state = (pos[0], pos[1], velocity[0], velocity[1])
+        self.states[slot] = state
+        self.predicted_states[slot] = state
+        self.covariances[slot] = np.eye(4)
+        self.predicted_covariances[slot] = np.eye(4)
+
+    def release(self, slot):
+        """Returns a slot to the free list.
+
+        Args:
+            slot: The index of the slot.
+        """
+        if self.active[slot]:
+            self.active[slot] = False
+            self.__free.append(slot)
+
+    def clear(self):
+        """Releases all slots.
+
+        Args:
+            None
+        """
+        self.active[:] = False
+        self.__free = range(len(self.active) - 1, -1, -1)
+
+    def grow(self):
+        """Doubles the number of slots.
+
+        Args:
+            None
+        """
+        capacity = len(self.active)
+        self.states = np.concatenate((self.states, np.zeros_like(self.states)))
+        self.covariances = np.concatenate(
+            (self.covariances, np.zeros_like(self.covariances)))
+        self.predicted_states = np.concatenate(
+            (self.predicted_states, np.zeros_like(self.predicted_states)))
+        self.predicted_covariances = np.concatenate(
+            (self.predicted_covariances,
+             np.zeros_like(self.predicted_covariances)))
+        self.active = np.concatenate((self.active, np.zeros_like(self.active)))
+        self.times = np.concatenate((self.times, np.empty(capacity)))
+        self.intervals = np.concatenate((self.intervals, np.empty(capacity)))
+        self.__free.extend(xrange(2 * capacity - 1, capacity - 1, -1))
+
+    def update(self, slots, measurements, time):
+        """Propagates the filters of several slots to the time of position
+        measurements, corrects them with the measurements and predicts their
+        next states. Slots already updated at or after the time of the
+        measurements are left unchanged.
+
+        Args:
+            slots: A list of slot indices.
+            measurements: A N x 2 array of measured positions, one row per
+                slot.
+            time: The time in seconds of the measurements.
+
+        Returns:
+            A two-element tuple of N x 4 arrays of the corrected and the
+            predicted states.
+        """
+        all_slots = np.asarray(slots, np.intp)
+        measurements = np.asarray(measurements, np.float64).reshape(-1, 2)
+        last_times = self.times[all_slots]
+        updated = ~np.isnan(last_times)
+        time_steps = np.zeros(len(all_slots))
+        time_steps[updated] = time - last_times[updated]
+
+        # Correcting again with a measurement that is not newer would count
+        # it twice and collapse the covariance
+        newer = ~updated | (time_steps > 0)
+        slots = all_slots[newer]
+        time_steps = time_steps[newer]
+
+        self.predict(slots, time_steps)
+        self.correct(slots, measurements[newer])
+
+        self.times[slots] = time
+        measured = time_steps > 0
+        self.intervals[slots[measured]] = time_steps[measured]
+        self.predict(slots, self.intervals[slots])
+        return (self.states[all_slots], self.predicted_states[all_slots])
+
+    def correct(self, slots, measurements):
+        """Corrects the predicted states of several slots with position
+        measurements.
+
+        Args:
+            slots: A list of slot indices.
+            measurements: A N x 2 array of measured positions, one row per
+                slot.
+
+        Returns:
+            A N x 4 array of the corrected states.
+        """
+        slots = np.asarray(slots, np.intp)
+        measurements = np.asarray(measurements, np.float64).reshape(-1, 2)
+        states = self.predicted_states[slots]
+        covariances = self.predicted_covariances[slots]
+
+        # Kalman gain for a position measurement, inverting the 2 x 2
+        # innovation covariances directly
+        innovation = covariances[:, :2, :2] + self.measurement_noise
+        a, b = innovation[:, 0, 0], innovation[:, 0, 1]
+        c, d = innovation[:, 1, 0], innovation[:, 1, 1]
+        inverse = np.empty_like(innovation)
+        inverse[:, 0, 0] = d
+        inverse[:, 0, 1] = -b
+        inverse[:, 1, 0] = -c
+        inverse[:, 1, 1] = a
+        inverse /= (a * d - b * c)[:, np.newaxis, np.newaxis]
+        gain = np.einsum('nij,njk->nik', covariances[:, :, :2], inverse)
+
+        residuals = measurements - states[:, :2]
+        states += np.einsum('nij,nj->ni', gain, residuals)
+        covariances -= np.einsum('nij,njk->nik', gain, covariances[:, :2, :])
+
+        self.states[slots] = states
+        self.covariances[slots] = covariances
+        return states
+
+    def predict(self, slots, time_steps):
+        """Predicts the states of several slots a number of seconds after
+        their corrected states.
+
+        Args:
+            slots: A list of slot indices.
+            time_steps: An array of the number of seconds to predict ahead,
+                one per slot.
+
+        Returns:
+            A N x 4 array of the predicted states.
+        """
+        slots = np.asarray(slots, np.intp)
+        time_steps = np.asarray(time_steps, np.float64)
+        transitions = np.zeros((len(slots), 4, 4))
+        transitions[:] = np.eye(4)
+        transitions[:, 0, 2] = time_steps
+        transitions[:, 1, 3] = time_steps
+
+        states = np.einsum('nij,nj->ni', transitions, self.states[slots])
+        covariances = np.einsum('nij,njk->nik', transitions,
+                                self.covariances[slots])
+        covariances = np.einsum('nij,nkj->nik', covariances, transitions)
+        covariances += (self.process_noise *
+                        (time_steps / self.time_step)[:, np.newaxis,
+                                                      np.newaxis])
+
+        self.predicted_states[slots] = states
+        self.predicted_covariances[slots] = covariances
+        return states
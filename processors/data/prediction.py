@@ -2,14 +2,28 @@
 Predicts the intersection point of a moving target with track and prediction
 line by using previous detection coordinates and radius of the detection line.
 
+The line through the previous positions can either be fit to the positions
+directly, or calculated from running sums of the positions that are kept up
+to date as positions enter and leave the history. The sums give the same line
+without visiting every position on every update, and allow the lines of all
+targets to be calculated at once.
+
 Functions:
     predict()
+    predictFromSums()
+    predictAllFromSums()
+    fitLines()
+    intersectCircle()
 """
 from numpy.linalg import lstsq
 import numpy as np
 from math import sqrt
 from random import random
 import itertools
+import logging
+
+# Relative size below which the spread of x values is treated as zero
+DEGENERATE_SPREAD = 1e-12
 
 
 def predict(positions, pred_line_r, num_prediction_vals):
@@ -47,6 +61,126 @@ def predict(positions, pred_line_r, num_prediction_vals):
     # use numpy least squares function to get slope and intercept
     slope, y_incpt = lstsq(A, y)[0]
 
+    return intersectCircle(slope, y_incpt, pred_line_r)
+
+
+def predictFromSums(count, sums, pred_line_r, num_prediction_vals):
+    """Predicts intersection point with track and prediction line given the
+    running sums of previous detection coordinates and radius of the
+    detection line.
+
+    Args:
+        count: The number of positions included in the sums.
+        sums: The sums of x, y, x * y and x * x over the positions.
+        pred_line_r: Radius of the prediction line in meters.
+        num_prediction_vals: Minimum number of values to return a valid
+            prediction.
+
+    Returns:
+        A two element list containing the X and Y coordinate of the predicted
+        crossing point of the prediction line.
+    """
+
+    # Prevent prediction when insufficient data is provided
+    if count < num_prediction_vals or count == 0:
+        return None
+
+    slopes, y_incpts = fitLines([count], [sums])
+    return intersectCircle(slopes[0], y_incpts[0], pred_line_r)
+
+
+def predictAllFromSums(counts, sums, pred_line_r, num_prediction_vals):
+    """Predicts the intersection points of several targets with the
+    prediction line from the running sums of their previous detection
+    coordinates.
+
+    Args:
+        counts: An array of the numbers of positions included in the sums.
+        sums: An N x 4 array of the sums of x, y, x * y and x * x.
+        pred_line_r: Radius of the prediction line in meters.
+        num_prediction_vals: Minimum number of values to return a valid
+            prediction.
+
+    Returns:
+        An N x 2 array of predicted crossing points, which are NaN for
+        targets without a valid prediction.
+    """
+    counts = np.asarray(counts, np.float64)
+    predictions = np.empty((len(counts), 2))
+    predictions.fill(np.nan)
+    ready = (counts >= num_prediction_vals) & (counts > 0)
+    if not ready.any():
+        return predictions
+
+    slope, y_incpt = fitLines(counts[ready], np.asarray(sums)[ready])
+
+    # Solve the quadratic equation of the line and circle intersection for
+    # all targets, preferring the root in front of the origin
+    a = 1 + slope**2
+    b = 2 * slope * y_incpt
+    c = y_incpt**2 - pred_line_r**2
+    discriminant = b**2 - 4*a*c
+    real = discriminant >= 0
+    root = np.sqrt(np.where(real, discriminant, 0))
+    x_pred = (-b + root) / (2*a)
+    y_pred = slope * x_pred + y_incpt
+    behind = y_pred <= 0
+    x_pred[behind] = ((-b - root) / (2*a))[behind]
+    y_pred[behind] = (slope * x_pred + y_incpt)[behind]
+
+    predictions[np.flatnonzero(ready)[real]] = np.column_stack(
+        (x_pred, y_pred))[real]
+    return predictions
+
+
+def fitLines(counts, sums):
+    """Calculates the least squares lines (y = slope * x + y_incpt) of sets
+    of positions from their running sums.
+
+    Positions whose x values are all equal are fit with the minimum norm
+    solution, as numpy.linalg.lstsq does.
+
+    Args:
+        counts: An array of the numbers of positions included in the sums.
+        sums: An N x 4 array of the sums of x, y, x * y and x * x.
+
+    Returns:
+        A two-element tuple of arrays of slopes and y intercepts.
+    """
+    counts = np.asarray(counts, np.float64)
+    sums = np.asarray(sums, np.float64).reshape(-1, 4)
+    sum_x, sum_y, sum_xy, sum_xx = sums.T
+
+    spread = counts * sum_xx - sum_x**2
+    degenerate = spread <= DEGENERATE_SPREAD * np.maximum(counts * sum_xx, 1)
+    spread[degenerate] = 1
+    slope = (counts * sum_xy - sum_x * sum_y) / spread
+    y_incpt = (sum_y - slope * sum_x) / counts
+
+    # All positions share one x value, which does not define a slope
+    mean_x = sum_x / counts
+    mean_y = sum_y / counts
+    slope[degenerate] = (mean_x * mean_y / (mean_x**2 + 1))[degenerate]
+    y_incpt[degenerate] = (mean_y / (mean_x**2 + 1))[degenerate]
+
+    return (slope, y_incpt)
+
+
+def intersectCircle(slope, y_incpt, pred_line_r):
+    """Finds the intersection point of a line with the prediction line,
+    preferring the point in front of the origin.
+
+    Args:
+        slope: The slope of the line.
+        y_incpt: The y intercept of the line.
+        pred_line_r: Radius of the prediction line in meters.
+
+    Returns:
+        A two element list containing the X and Y coordinate of the
+        intersection point, or None if the line does not cross the
+        prediction line.
+    """
+
     # create a, b and c for quadratic equation to solve for x given:
     # (y = slope * x + y_intcp)
     # and
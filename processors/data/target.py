@@ -1,47 +1,96 @@
 """
 Defines a target object assigned to each validated detection.
 
+The state of every target is kept in the TrackStore of the track module.
+Target objects are light handles onto their row of the store, exposing the
+stored values as attributes.
+
 Classes:
     Target
 
 Functions:
+    storeValue()
+    storeVector()
     VerifyValidity()
     angle_diff()
     magnitude()
 """
-import cv2.cv as cv
 import logging
 import math
-from datetime import datetime
-from collections import deque
 
-from display.tactical.tactical import PERSIST_TIME, MAXLEN_DEQUE
-import prediction
+import numpy as np
+
+from processors.image.image_source import getTime
 
 ORIGIN = [0, 0]
 
 
+def storeValue(name, convert, doc):
+    """Creates a property reading and writing a scalar array of the track
+    store at the index of the target.
+
+    Args:
+        name: The name of the TrackStore array.
+        convert: A function converting stored values to Python values.
+        doc: The docstring of the property.
+
+    Returns:
+        A property
+    """
+    def getValue(self):
+        return convert(getattr(self.ttm.store, name)[self.index])
+
+    def setValue(self, value):
+        getattr(self.ttm.store, name)[self.index] = value
+
+    return property(getValue, setValue, doc=doc)
+
+
+def storeVector(name, doc):
+    """Creates a property reading and writing an optional 2-D vector array of
+    the track store at the index of the target. Unset vectors are stored as
+    NaN and read as None.
+
+    Args:
+        name: The name of the TrackStore array.
+        doc: The docstring of the property.
+
+    Returns:
+        A property
+    """
+    def getVector(self):
+        vector = getattr(self.ttm.store, name)[self.index]
+        if np.isnan(vector[0]):
+            return None
+        return vector.tolist()
+
+    def setVector(self, vector):
+        if not vector:
+            vector = (np.nan, np.nan)
+        getattr(self.ttm.store, name)[self.index] = vector[0:2]
+
+    return property(getVector, setVector, doc=doc)
+
+
 class Target(object):
     """Represents a single tracked object (i.e. a child).
     Keeps track of filter and position information.
 
     Attributes:
+        ttm: A TargetTrackModule object.
+        index: The index of the TrackStore slot of this target.
         pos: A 2-D position coordinate.
         id_value: An integer that identifies a single target object.
-        ttm: A TargetTrackModule object.
-        kalman: Instance of kalman filter tied to this target.
+        kalman: Index of the kalman filter bank slot tied to this target.
         prediction: A two element list of filter prediction values.
         missed_updates: An integer that records the number of missed track
             updates.
-        filtered_positions: A list of positions after they've been processed
-            by the kalman filter. Used for prediction.
-        kal_meas: A 2x1 matrix containing the X and Y coordinates of the
-            current target position.
-        kal_pred: A 2x1 matrix containint the X and Y coordinates of the most
-            recent prediction point.
+        filtered_positions: An array of positions after they've been
+            processed by the kalman filter. Used for prediction.
         valid: A boolean indicating whether the position is within the safe
             zone radius.
-        last_update: Used to expire old track data.
+        last_update: The time in seconds of the last update. Used to expire
+            old track data.
         predLineIntersect: A two element list containing the X, Y coordinate
             of the prediction line intersection point.
         predLineIntersectInitial: A two element list containing the X, Y
@@ -58,16 +107,23 @@ class Target(object):
             zone.
         left_alert: A boolean that indicates if the target has left the alert
             zone.
-        prediction_positions: A queue containing the most recent predicted
-            intersection points.
+        hit_predict: A boolean that indicates if the target has crossed the
+            prediction line.
+        prediction_positions: An array containing the most recent filtered
+            positions used for prediction.
 
     Methods:
         update()
         clearTargetData()
         clearProcessedThisCycle()
+        getVelocity()
+        release()
         __repr__()
         makeKalman()
+        releaseKalman()
     """
+    __slots__ = ('ttm', 'index')
+
     CONSTANTS_SET = False
     PROCESS_NOISE = 1
     MEASUREMENT_NOISE = 1e3
@@ -78,27 +134,42 @@ class Target(object):
     NUM_PREDICTION_VALS = 20
     ID = 0
 
+    pos = storeVector('positions', 'A 2-D position coordinate.')
+    id_value = storeValue('ids', int, 'The target identifier.')
+    prediction = storeVector('predictions', 'The predicted position.')
+    max_velocity = storeVector('max_velocities',
+                               'The maximum velocity since the last turn.')
+    predLineIntersect = storeVector('intersects',
+                                    'The prediction line intersection.')
+    predLineIntersectInitial = storeVector(
+        'initial_intersects', 'The first prediction line intersection.')
+    last_update = storeValue('last_updates', float,
+                             'The time in seconds of the last update.')
+    missed_updates = storeValue('missed_updates', int,
+                                'The number of missed updates.')
+    valid = storeValue('valid', bool,
+                       'Whether the target started in the safe zone.')
+    updatedThisCycle = storeValue('updated', bool,
+                                  'Whether the target was updated this cycle.')
+    first_turn = storeValue('first_turn', bool,
+                            'Whether the first turn is completed.')
+    second_turn = storeValue('second_turn', bool,
+                             'Whether the second turn is completed.')
+    left_safe = storeValue('left_safe', bool,
+                           'Whether the target left the safe zone.')
+    left_alert = storeValue('left_alert', bool,
+                            'Whether the target left the alert zone.')
+    hit_predict = storeValue('hit_predict', bool,
+                             'Whether the target crossed the prediction line.')
+
     def __init__(self, pos, config=None, ttm=None):
-        self.pos = pos
-        self.id_value = None
         self.ttm = ttm
-        self.kalman = None
-        self.prediction = None
-        self.missed_updates = 0
-        self.filtered_positions = deque([pos], maxlen=MAXLEN_DEQUE)
-        self.kal_meas = cv.CreateMat(2, 1, cv.CV_32FC1)
-        self.kal_pred = cv.CreateMat(2, 1, cv.CV_32FC1)
+        self.index = ttm.store.allocate()
+        self.pos = pos
+        self.filtered_history.append(self.index, pos)
         self.valid = VerifyValidity(pos)
-        self.last_update = datetime.now()
-        self.predLineIntersect = None
-        self.predLineIntersectInitial = None
+        self.last_update = getTime()
         self.updatedThisCycle = True
-        self.first_turn = False
-        self.second_turn = False
-        self.max_velocity = None
-        self.left_safe = None
-        self.left_alert = None
-        self.hit_predict = None
         if Target.CONSTANTS_SET is False and config is not None:
             logging.debug('Setting track constants')
             Target.CONSTANTS_SET = True
@@ -116,77 +187,90 @@ class Target(object):
                 scm.getCalibrationDistances()
             Target.PREDICTION_RADIUS = zone_distances[2]
             Target.SAFE_RADIUS = zone_distances[0]
-        self.prediction_positions = deque([pos],
-                                          maxlen=Target.NUM_PREDICTION_VALS)
+        self.prediction_history.append(self.index, pos)
 
         self.id_value = Target.ID
         Target.ID += 1
 
-    def update(self, pos):
+    @property
+    def kalman(self):
+        """The kalman filter bank slot of the target, or None."""
+        slot = self.ttm.store.kalman_slots[self.index]
+        return None if slot < 0 else int(slot)
+
+    @kalman.setter
+    def kalman(self, slot):
+        self.ttm.store.kalman_slots[self.index] = -1 if slot is None else slot
+
+    @property
+    def filtered_history(self):
+        """The HistoryRing of filtered positions."""
+        return self.ttm.store.filtered_history
+
+    @property
+    def prediction_history(self):
+        """The HistoryRing of filtered positions used for prediction."""
+        return self.ttm.store.prediction_history
+
+    @property
+    def filtered_positions(self):
+        """An array of the filtered positions from oldest to newest."""
+        return self.filtered_history.get(self.index)
+
+    @property
+    def prediction_positions(self):
+        """An array of the most recent filtered positions from oldest to
+        newest."""
+        return self.prediction_history.get(self.index)
+
+    def update(self, pos, state, predicted_state):
         """
         Update this target object with a position that it
         is known to be associated with. Association occurs
-        before calling this.
+        before calling this. The kalman filters of all updated targets are
+        corrected and predicted together by the track module first.
 
         Args:
             pos: A two element list containing the X and Y value of a position
                 known to be associated with this target.
+            state: A four element list of the corrected kalman state (X, Y,
+                X velocity, Y velocity).
+            predicted_state: A four element list of the predicted kalman
+                state.
 
         Returns:
             None
         """
 
-        from data import distance
-
         self.pos = pos[0:2]
         #self.detected_positions.append(self.pos)
         self.missed_updates = 0
 
-        if self.kalman is None:
-            self.kalman = self.makeKalman(pos)
-
-        self.kal_meas[0, 0] = pos[0]
-        self.kal_meas[1, 0] = pos[1]
-        # TODO Implement newer OpenCV Kalman functions
-        tmp = cv.KalmanCorrect(self.kalman, self.kal_meas)
-        if math.isnan(tmp[0, 0]):
+        if math.isnan(state[0]):
             logging.error('Kalman correct returned nan')
 
-        velocity = (tmp[2, 0], tmp[3, 0])
+        velocity = (state[2], state[3])
         if magnitude(velocity) > magnitude(self.max_velocity):
-            self.max_velocity = velocity[:]
+            self.max_velocity = velocity
 
         #logging.debug('velocity: %f' % velocity)
 
-        self.filtered_positions.append([tmp[0, 0], tmp[1, 0]])
-        self.prediction_positions.append([tmp[0, 0], tmp[1, 0]])
-
-        self.kal_pred = cv.KalmanPredict(self.kalman)
-        self.prediction = [self.kal_pred[0, 0], self.kal_pred[1, 0]]
+        self.filtered_history.append(self.index, state)
+        self.prediction_history.append(self.index, state)
 
-        zone_distances = self.ttm.data_processor.tca.image_processors[0].scm. \
-            getCalibrationDistances()
-        Target.PREDICTION_RADIUS = zone_distances[2]
-        Target.SAFE_RADIUS = zone_distances[0]
+        self.prediction = predicted_state[0:2]
 
-        if self.valid:
-            # Calculate prediction line when target is located in alert zone
-            if (distance(self.pos, ORIGIN) > zone_distances[0] and
-                    distance(self.pos, ORIGIN) < zone_distances[1]):
-                self.predLineIntersect = prediction. \
-                    predict(self.prediction_positions,
-                            Target.PREDICTION_RADIUS,
-                            Target.NUM_PREDICTION_VALS)
-                if not self.predLineIntersectInitial and self.predLineIntersect:
-                    self.predLineIntersectInitial = self.predLineIntersect[:]
+        # The prediction line intersection is calculated for all targets
+        # together by the data processor after the update
+        zone_distances = self.ttm.zone_distances
 
         # check for turn
-        if (len(self.prediction_positions) > zone_distances[1]
+        if (self.prediction_history.counts[self.index] > zone_distances[1]
             and magnitude(self.max_velocity) > 0.0
             and math.fabs(angle_diff(self.max_velocity, velocity)) >
                 Target.TURN_THRESHOLD_DEGREES):
             self.max_velocity = None
-            self.prediction_positions.clear()
+            self.prediction_history.clear(self.index)
             self.predLineIntersectInitial = None
             self.predLineIntersect = None
             #TODO initialize new kalman with appropriate velocity
@@ -201,7 +285,7 @@ class Target(object):
                 self.kalman = self.makeKalman(pos)
 
         # Update last time modified
-        self.last_update = datetime.now()
+        self.last_update = getTime()
         self.updatedThisCycle = True
 
     def clearTargetData(self):
@@ -212,9 +296,9 @@ class Target(object):
             None
         """
         #del self.detected_positions[:]
-        self.filtered_positions.clear()
-        self.prediction_positions.clear()
-        del self.prediction[:]
+        self.filtered_history.clear(self.index)
+        self.prediction_history.clear(self.index)
+        self.prediction = None
 
     def clearProcessedThisCycle(self):
         """
@@ -226,6 +310,30 @@ class Target(object):
         if self.updatedThisCycle:
             self.updatedThisCycle = False
 
+    def getVelocity(self):
+        """
+        Returns the velocity estimated by the kalman filter.
+
+        Args:
+            None
+
+        Returns:
+            A two element list of the X and Y velocity in feet per second
+        """
+        if self.kalman is None:
+            return [0.0, 0.0]
+        return self.ttm.kalman_bank.states[self.kalman, 2:4].tolist()
+
+    def release(self):
+        """
+        Return the kalman filter and track store slot of this target.
+
+        Args:
+            None
+        """
+        self.releaseKalman()
+        self.ttm.store.release(self.index)
+
     def __repr__(self):
         """
         Returns 2-D position coordinate of target.
@@ -237,8 +345,9 @@ class Target(object):
 
     def makeKalman(self, pos, x_dot_init=0, y_dot_init=0):
         """
-        Create new kalman filter based on single position and
-        optionally a known velocity
+        Start the kalman filter of this target from a single position and
+        optionally a known velocity. The filter is kept in the kalman filter
+        bank of the track module.
 
         Args:
             pos: two element list containing X and Y coordinates
@@ -247,48 +356,26 @@ class Target(object):
             y_dot_init: (optional) y coordinate of initial velocity
 
         Returns:
-            instance of cv2 kalman filter
+            index of the kalman filter bank slot
         """
 
         logging.debug('Creating new kalman instance')
-        kalman = cv.CreateKalman(dynam_params=4, measure_params=2)
-
-        # Set previous state prediction
-        x_init = pos[0]
-        y_init = pos[1]
-        kalman.state_pre[0, 0] = x_init
-        kalman.state_pre[1, 0] = y_init
-        kalman.state_pre[2, 0] = x_dot_init
-        kalman.state_pre[3, 0] = y_dot_init
-
-        tk = Target.TIME_STEP
-        # Set kalman transition matrix
-        kalman.transition_matrix[0, 0] = 1
-        kalman.transition_matrix[0, 1] = 0
-        kalman.transition_matrix[0, 2] = tk
-        kalman.transition_matrix[0, 3] = 0
-        kalman.transition_matrix[1, 0] = 0
-        kalman.transition_matrix[1, 1] = 1
-        kalman.transition_matrix[1, 2] = 0
-        kalman.transition_matrix[1, 3] = tk
-        kalman.transition_matrix[2, 0] = 0
-        kalman.transition_matrix[2, 1] = 0
-        kalman.transition_matrix[2, 2] = 1
-        kalman.transition_matrix[2, 3] = 0
-        kalman.transition_matrix[3, 0] = 0
-        kalman.transition_matrix[3, 1] = 0
-        kalman.transition_matrix[3, 2] = 0
-        kalman.transition_matrix[3, 3] = 1
-
-        # Set Kalman Filter
-        cv.SetIdentity(kalman.measurement_matrix, cv.RealScalar(1))
-        cv.SetIdentity(kalman.process_noise_cov,
-                       cv.RealScalar(Target.PROCESS_NOISE))
-        cv.SetIdentity(kalman.measurement_noise_cov,
-                       cv.RealScalar(Target.MEASUREMENT_NOISE))
-        cv.SetIdentity(kalman.error_cov_post, cv.RealScalar(1))
-
-        return kalman
+        kalman_bank = self.ttm.kalman_bank
+        if self.kalman is None:
+            return kalman_bank.allocate(pos, (x_dot_init, y_dot_init))
+        kalman_bank.reset(self.kalman, pos, (x_dot_init, y_dot_init))
+        return self.kalman
+
+    def releaseKalman(self):
+        """
+        Return the kalman filter of this target to the kalman filter bank.
+
+        Args:
+            None
+        """
+        if self.kalman is not None:
+            self.ttm.kalman_bank.release(self.kalman)
+            self.kalman = None
 
 
 # This function is called during init to determine if a track is a running dog
@@ -15,7 +15,13 @@ import math
 import logging
 from collections import deque
 
+import numpy as np
+
+from association import associate
+from kalman import KalmanFilterBank
+from track_store import TrackStore
 from target import Target
+from processors.image.image_source import getTime
 from display.tactical.tactical import PERSIST_TIME, MAXLEN_DEQUE
 
 
@@ -30,10 +36,17 @@ class TargetTrackModule(object):
         targets: A list of Target objects.
         data_processor: A DataProcessor object.
         config: A SafeConfigParser object.
+        kalman_bank: A KalmanFilterBank object holding the kalman filters of
+            all targets.
+        store: A TrackStore object holding the state of all targets.
+        zone_distances: The zone distances of the current cycle.
 
     Methods:
         processDetections()
-        associateTrack()
+        updateTargets()
+        removeTarget()
+        clearTargets()
+        findExpiredTargets()
     """
     KNOWN_GATE = 1.0
     UNKNOWN_GATE = 1.5
@@ -51,96 +64,139 @@ class TargetTrackModule(object):
             TargetTrackModule.UNKNOWN_GATE = self.config. \
                 getfloat('track', 'unknown_gate')
 
-    def processDetections(self, unmatchedList):
+        if self.config is not None:
+            self.kalman_bank = KalmanFilterBank(
+                self.config.getfloat('track', 'time_step'),
+                self.config.getfloat('track', 'process_noise'),
+                self.config.getfloat('track', 'measurement_noise'))
+        else:
+            self.kalman_bank = KalmanFilterBank(Target.TIME_STEP,
+                                                Target.PROCESS_NOISE,
+                                                Target.MEASUREMENT_NOISE)
+
+        prediction_length = Target.NUM_PREDICTION_VALS
+        if self.config is not None:
+            prediction_length = self.config.getfloat(
+                'track', 'prediction_history_count')
+        self.store = TrackStore(MAXLEN_DEQUE, int(prediction_length))
+        self.zone_distances = None
+
+    def processDetections(self, unmatchedList, time=None):
         """
         This method takes in a list of unique tracks from the target
         discrimination module. These points are the results of matching all the
         detections from the various image processors compiled into a unique
-        list. This does a first fit match for detected points and existing
-        targets. Initially the program tries to only allow a single point to
-        modify one target. After all points have been exhausted they may be
-        used again. This handles merging and splitting. Any leftover points are
-        marked as new targets.
+        list. Points are assigned to targets by global nearest neighbor, so
+        that each point updates at most one target and the total distance
+        between targets and their points is as small as possible. Targets left
+        without a point may then share the nearest assigned point, which
+        handles merging and splitting. Any leftover points are marked as new
+        targets.
 
         Args:
             unmatchedList: A list of 2-D position coordinates for valid
                 targets.
+            time: The time in seconds the positions were captured at. The
+                current time is used if it is not known.
         """
-        matchedList = []
-        for target in self.targets:
-            associated = False
-            logging.debug("--current target--")
-            logging.debug(target)
-            logging.debug("--unmatched list--")
-            logging.debug(unmatchedList)
-            logging.debug("--matched list--")
-            logging.debug(matchedList)
-            for i in xrange(len(unmatchedList) - 1, -1, -1):
-                pos = unmatchedList[i]
-                logging.debug("-curret pos-")
-                logging.debug(pos)
-                associated = self.associateTrack(pos, target)
-
-                if associated:
-                    logging.debug("Target Associated!")
-                    matchedList.append(pos)
-                    del unmatchedList[i]
-                    break
-
-                logging.debug("Target Not Associated")
-            if not associated:
-                for pos in matchedList:
-                    associated = self.associateTrack(pos, target)
-
-        for pos in unmatchedList:
-            logging.debug("New Target:")
-            logging.debug(pos)
-            self.targets.append(Target(pos, self.config, self))
-
-    def associateTrack(self, pos, target):
+        targets = [target for target in self.targets
+                   if not target.updatedThisCycle]
+        track_positions = [target.prediction if target.prediction
+                           else target.pos[0:2] for target in targets]
+        gates = [TargetTrackModule.KNOWN_GATE if target.prediction
+                 else TargetTrackModule.UNKNOWN_GATE for target in targets]
+        cost, matches, unmatched = associate(track_positions, gates,
+                                             unmatchedList)
+        logging.debug('Associated %d of %d targets with %d detections' %
+                      (len(matches), len(targets), len(unmatchedList)))
+
+        updates = [(targets[i], unmatchedList[j]) for i, j in matches]
+
+        # Targets without a point of their own share the nearest assigned
+        # point
+        assigned = set(i for i, _ in matches)
+        matched = [j for _, j in matches]
+        if matched:
+            shared = cost[:, matched]
+            for i, target in enumerate(targets):
+                if i in assigned:
+                    continue
+                nearest = shared[i].argmin()
+                if np.isfinite(shared[i, nearest]):
+                    updates.append((target,
+                                    unmatchedList[matched[nearest]]))
+
+        if time is None:
+            time = getTime()
+        self.updateTargets(updates, time)
+
+        for j in unmatched:
+            logging.debug("New Target: %s" % (unmatchedList[j],))
+            self.targets.append(Target(unmatchedList[j], self.config, self))
+
+    def updateTargets(self, updates, time):
         """
-        Compare a position to known targets and try to
-        associate it to one of them.
+        Updates targets with the positions associated with them. The kalman
+        filters of all the targets are propagated to the time of the
+        positions, corrected and predicted in a single step before each target
+        is updated.
 
         Args:
-            pos: A two element list representing the X and Y
-                of a position
-            Targets: A list of known targets represented as
-                Target objects
+            updates: A list of (Target, position) pairs.
+            time: The time in seconds the positions were captured at.
+        """
+        if not updates:
+            return
 
-        Returns:
-            A boolean indicating whether the given position
-            was associated with any of the known targets
+        for target, pos in updates:
+            if target.kalman is None:
+                target.kalman = target.makeKalman(pos)
+
+        slots = [target.kalman for target, _ in updates]
+        states, predictions = self.kalman_bank.update(
+            slots, [pos for _, pos in updates], time)
+        for (target, pos), state, predicted_state in zip(
+                updates, states.tolist(), predictions.tolist()):
+            target.update(pos, state, predicted_state)
+
+    def removeTarget(self, target):
+        """
+        Removes a target and releases its kalman filter and track store slot.
+
+        Args:
+            target: A Target object.
+        """
+        target.release()
+        self.targets.remove(target)
+
+    def clearTargets(self):
         """
+        Removes all targets and releases their kalman filters and track
+        store slots.
 
-        if target.updatedThisCycle:
-            logging.debug("already associated")
-            return False
-
-        logging.debug("target prediction")
-        logging.debug(target.prediction)
-        if (target.prediction and
-                distance(pos, target.prediction) <
-                TargetTrackModule.KNOWN_GATE):
-            #logging.debug('Det associated: %f frm predict of target %d'%)
-            #             (distance(pos, target.prediction), i))
-            logging.debug('Det associated: %f from predictian of target '
-                          % (distance(pos, target.prediction)))
-            target.update(pos)
-            if target.missed_updates > 0:
-                target.missed_updates -= 1
-            return True
-        elif (not target.prediction and
-                distance(pos, target.pos) < TargetTrackModule.UNKNOWN_GATE):
-            target.prediction = []
-            target.update(pos)
-            if target.missed_updates > 0:
-                target.missed_updates -= 1
-            return True
-
-        # Got through the whole target list without a hit
-        #logging.debug('Det NOT associated'))
-        return False
+        Args:
+            None
+        """
+        del self.targets[:]
+        self.kalman_bank.clear()
+        self.store.clear()
+
+    def findExpiredTargets(self, persist_time):
+        """
+        Finds the targets that have not been updated for longer than the
+        persistence time.
+
+        Args:
+            persist_time: The persistence time in seconds.
+
+        Returns:
+            A list of expired Target objects.
+        """
+        expired = self.store.findExpired(getTime(), persist_time)
+        if not len(expired):
+            return []
+        expired = set(expired.tolist())
+        return [target for target in self.targets if target.index in expired]
 
 
 def distance(p1, p2):
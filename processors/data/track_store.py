@@ -0,0 +1,294 @@
+"""
+Stores the state of all tracked targets in contiguous arrays.
+
+Every per-track value is kept in a numpy array with one row per slot, and
+position histories are kept in fixed-length ring buffers, so that a track
+costs a few rows of floats rather than a graph of Python objects. Target
+objects are light handles holding the index of their slot, and operations
+over all tracks, such as finding expired tracks, work on the whole arrays at
+once.
+
+Slots of removed tracks are kept on a free list and handed to new tracks, and
+the arrays double in size when no slot is free.
+
+The history used for trajectory prediction also keeps running sums of its
+positions, so the least squares line through the history is available
+without visiting the positions again.
+
+Classes:
+    TrackStore
+    HistoryRing
+
+Functions:
+    lineTerms()
+"""
+import numpy as np
+
+# Number of slots allocated when a track store is created
+INITIAL_CAPACITY = 16
+
+
+class TrackStore(object):
+    """Stores the state of all tracks as a struct of arrays, one row per
+    slot.
+
+    Optional 2-D values (predictions, maximum velocities and prediction line
+    intersections) are NaN when they are not set.
+
+    Attributes:
+        ids: An array of target identifiers.
+        positions: A N x 2 array of the most recent detected positions.
+        predictions: A N x 2 array of the predicted next positions.
+        max_velocities: A N x 2 array of the maximum velocities since the
+            last turn.
+        intersects: A N x 2 array of the prediction line intersections.
+        initial_intersects: A N x 2 array of the first prediction line
+            intersections.
+        last_updates: An array of the times in seconds of the last updates.
+        missed_updates: An array of the numbers of missed updates.
+        kalman_slots: An array of kalman filter bank slots, -1 when the
+            track has no filter.
+        valid: A boolean array indicating whether tracks started inside the
+            safe zone.
+        updated: A boolean array indicating whether tracks were updated
+            this cycle.
+        first_turn: A boolean array indicating completed first turns.
+        second_turn: A boolean array indicating completed second turns.
+        left_safe: A boolean array indicating tracks that left the safe zone.
+        left_alert: A boolean array indicating tracks that left the alert
+            zone.
+        hit_predict: A boolean array indicating tracks that crossed the
+            prediction line.
+        active: A boolean array indicating which slots are in use.
+        filtered_history: A HistoryRing of filtered positions.
+        prediction_history: A HistoryRing of filtered positions used for
+            prediction.
+
+    Methods:
+        allocate()
+        release()
+        clear()
+        grow()
+        findExpired()
+    """
+    FIELDS = (('ids', np.int32, (), 0),
+              ('positions', np.float64, (2,), 0),
+              ('predictions', np.float64, (2,), np.nan),
+              ('max_velocities', np.float64, (2,), np.nan),
+              ('intersects', np.float64, (2,), np.nan),
+              ('initial_intersects', np.float64, (2,), np.nan),
+              ('last_updates', np.float64, (), 0),
+              ('missed_updates', np.int32, (), 0),
+              ('kalman_slots', np.intp, (), -1),
+              ('valid', np.bool_, (), False),
+              ('updated', np.bool_, (), False),
+              ('first_turn', np.bool_, (), False),
+              ('second_turn', np.bool_, (), False),
+              ('left_safe', np.bool_, (), False),
+              ('left_alert', np.bool_, (), False),
+              ('hit_predict', np.bool_, (), False),
+              ('active', np.bool_, (), False))
+
+    def __init__(self, history_length, prediction_length,
+                 capacity=INITIAL_CAPACITY):
+        for name, dtype, shape, default in TrackStore.FIELDS:
+            setattr(self, name, np.empty((capacity,) + shape, dtype))
+        self.active[:] = False
+        self.filtered_history = HistoryRing(capacity, history_length)
+        self.prediction_history = HistoryRing(capacity, prediction_length,
+                                              True)
+        self.__free = range(capacity - 1, -1, -1)
+
+    def allocate(self):
+        """Assigns a free slot to a new track with default values, growing
+        the store if none is free.
+
+        Args:
+            None
+
+        Returns:
+            The integer index of the slot.
+        """
+        if not self.__free:
+            self.grow()
+        index = self.__free.pop()
+        for name, dtype, shape, default in TrackStore.FIELDS:
+            getattr(self, name)[index] = default
+        self.active[index] = True
+        self.filtered_history.clear(index)
+        self.prediction_history.clear(index)
+        return index
+
+    def release(self, index):
+        """Returns a slot to the free list.
+
+        Args:
+            index: The index of the slot.
+        """
+        if self.active[index]:
+            self.active[index] = False
+            self.__free.append(index)
+
+    def clear(self):
+        """Releases all slots.
+
+        Args:
+            None
+        """
+        self.active[:] = False
+        self.__free = range(len(self.active) - 1, -1, -1)
+
+    def grow(self):
+        """Doubles the number of slots.
+
+        Args:
+            None
+        """
+        capacity = len(self.active)
+        for name, dtype, shape, default in TrackStore.FIELDS:
+            values = getattr(self, name)
+            setattr(self, name,
+                    np.concatenate((values, np.empty_like(values))))
+        self.active[capacity:] = False
+        self.filtered_history.grow()
+        self.prediction_history.grow()
+        self.__free.extend(xrange(2 * capacity - 1, capacity - 1, -1))
+
+    def findExpired(self, time, persist_time):
+        """Finds the tracks that have not been updated for longer than the
+        persistence time.
+
+        Args:
+            time: The current time in seconds.
+            persist_time: The persistence time in seconds.
+
+        Returns:
+            An array of slot indices.
+        """
+        return np.flatnonzero(self.active &
+                              (time - self.last_updates > persist_time))
+
+
+class HistoryRing(object):
+    """Keeps the most recent 2-D positions of every slot in a fixed-length
+    ring buffer.
+
+    When line sums are kept, the sums are updated as positions enter and
+    leave the history. They are recalculated from the stored positions each
+    time the ring wraps around, so rounding errors cannot accumulate.
+
+    Attributes:
+        positions: A N x L x 2 array of positions.
+        counts: An array of the number of positions stored for each slot.
+        ends: An array of the index following the newest position of each
+            slot.
+        sums: A N x 4 array of the sums of x, y, x * y and x * x over the
+            positions of each slot, or None if line sums are not kept.
+
+    Methods:
+        append()
+        get()
+        clear()
+        grow()
+        __len__()
+    """
+    def __init__(self, capacity, length, line_sums=False):
+        self.positions = np.zeros((capacity, length, 2), np.float32)
+        self.counts = np.zeros(capacity, np.intp)
+        self.ends = np.zeros(capacity, np.intp)
+        self.sums = np.zeros((capacity, 4)) if line_sums else None
+
+    def append(self, index, pos):
+        """Adds a position to the history of a slot, replacing the oldest
+        position when the history is full.
+
+        Args:
+            index: The index of the slot.
+            pos: A 2-D position coordinate.
+        """
+        length = self.positions.shape[1]
+        end = self.ends[index]
+        full = self.counts[index] == length
+        if self.sums is not None and full:
+            self.sums[index] -= lineTerms(self.positions[index, end])
+
+        self.positions[index, end] = pos[0:2]
+        self.ends[index] = (end + 1) % length
+        self.counts[index] = min(self.counts[index] + 1, length)
+
+        if self.sums is not None:
+            if self.ends[index] == 0:
+                # Recalculate from the stored positions once per wrap
+                count = self.counts[index]
+                self.sums[index] = lineTerms(
+                    self.positions[index, length - count:]).sum(axis=0)
+            else:
+                self.sums[index] += lineTerms(self.positions[index, end])
+
+    def get(self, index):
+        """Returns the history of a slot from oldest to newest.
+
+        Args:
+            index: The index of the slot.
+
+        Returns:
+            A M x 2 array of positions.
+        """
+        count = self.counts[index]
+        end = self.ends[index]
+        if end >= count:
+            return self.positions[index, end - count:end].copy()
+        return np.concatenate((self.positions[index, end - count:],
+                               self.positions[index, :end]))
+
+    def clear(self, index):
+        """Removes all positions from the history of a slot.
+
+        Args:
+            index: The index of the slot.
+        """
+        self.counts[index] = 0
+        self.ends[index] = 0
+        if self.sums is not None:
+            self.sums[index] = 0
+
+    def grow(self):
+        """Doubles the number of slots.
+
+        Args:
+            None
+        """
+        self.positions = np.concatenate(
+            (self.positions, np.zeros_like(self.positions)))
+        self.counts = np.concatenate((self.counts, np.zeros_like(self.counts)))
+        self.ends = np.concatenate((self.ends, np.zeros_like(self.ends)))
+        if self.sums is not None:
+            self.sums = np.concatenate((self.sums, np.zeros_like(self.sums)))
+
+    def __len__(self):
+        """Returns the maximum number of positions kept per slot.
+
+        Args:
+            None
+
+        Returns:
+            An integer
+        """
+        return self.positions.shape[1]
+
+
+def lineTerms(positions):
+    """Calculates the terms of the least squares line sums of positions.
+
+    Args:
+        positions: A 2-D position coordinate or an N x 2 array of them.
+
+    Returns:
+        An array of x, y, x * y and x * x, with one row per position for
+        an array of positions.
+    """
+    positions = np.asarray(positions, np.float64)
+    x = positions[..., 0]
+    y = positions[..., 1]
+    terms = np.array((x, y, x * y, x * x))
+    return terms.T if terms.ndim > 1 else terms
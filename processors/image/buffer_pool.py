@@ -0,0 +1,92 @@
+"""
+Provides reusable image buffers for the frame processing path.
+
+Processing a frame produces several intermediate images (blurred, HSV,
+classified and binary frames, frame copies for drawing) that have the same
+size from one frame to the next. Rather than allocating them for every frame,
+OpenCV and numpy write into named buffers kept by a BufferPool. A buffer is
+only allocated again when the requested shape or type changes.
+
+Classes:
+    BufferPool
+"""
+import numpy as np
+
+
+class BufferPool(object):
+    """Keeps named image buffers that are reused from frame to frame.
+
+    Buffers handed out by the pool are overwritten the next time the same
+    name is requested, so results that must outlive a frame have to be
+    copied.
+
+    Attributes:
+        buffers: A dictionary of image arrays keyed by name.
+        allocations: An integer counting all buffers allocated by the pool.
+        frame_allocations: An integer counting the buffers allocated since
+            the start of the current frame.
+
+    Methods:
+        get()
+        startFrame()
+        clear()
+        getStats()
+    """
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+        self.frame_allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        """Returns the buffer of a name, allocating it if it does not exist
+        or does not match the requested shape and type.
+
+        The contents of the buffer are undefined.
+
+        Args:
+            name: A hashable value naming the buffer.
+            shape: The shape of the buffer.
+            dtype: The numpy data type of the buffer.
+
+        Returns:
+            An uninitialized image array
+        """
+        shape = tuple(shape)
+        buffer = self.buffers.get(name)
+        if (buffer is None or buffer.shape != shape or
+                buffer.dtype != np.dtype(dtype)):
+            buffer = np.empty(shape, dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+            self.frame_allocations += 1
+        return buffer
+
+    def startFrame(self):
+        """Resets the per-frame allocation count.
+
+        Args:
+            None
+        """
+        self.frame_allocations = 0
+
+    def clear(self):
+        """Releases all buffers.
+
+        Args:
+            None
+        """
+        self.buffers = {}
+
+    def getStats(self):
+        """Returns the allocation statistics of the pool.
+
+        Args:
+            None
+
+        Returns:
+            A dictionary
+        """
+        return {'allocations': self.frame_allocations,
+                'total_allocations': self.allocations,
+                'buffer_bytes': sum(buffer.nbytes for buffer
+                                    in self.buffers.itervalues())}
@@ -6,19 +6,50 @@ the location of ground calibration markers in the provided image frame, the
 extrinsic system parameters are calculated. These parameters relate points in
 the camera frame to global positions in the surveilled environment.
 
+Once calibrated, the boundary of the demonstration zone is projected back into
+the image to give a pixel mask and bounding region of interest, which limit
+object detection to the part of the frame where valid targets can appear.
+
+Calibration also produces a ground table holding the ground coordinates of
+every pixel, with lens distortion removed, along with a table marking the
+pixels inside the zone. The tables are built when calibration or loading
+finishes, and again in a calibration job when the zone distances change, so
+they are never built while a frame is processed.
+
+Calibration data is stored per image source in a versioned binary file. A
+small checksummed JSON header holds the matrices and points along with a
+table of raw array sections (zone mask, ground and zone tables), which are
+memory-mapped on load, so loading does not depend on the size of the arrays.
+
+Calibration, loading and saving can run as background jobs on a shared thread
+pool, one job per image source. Each job builds a new CalibrationData object
+and replaces the image processor's calibration data in a single assignment
+when it finishes, so processing never sees a partially calibrated state.
+
 Classes:
     CalibrationThreshold
     SourceCalibrationModule
     CalibrationData
+
+Functions:
+    runCalibrationJob()
+    alignOffset()
+    encodeValue()
+    decodeValue()
 """
 import cv2 as cv
 import numpy as np
 import os
 import logging
-import pickle
-from math import sin, cos, pi
+import json
+import struct
+import zlib
+from multiprocessing.pool import ThreadPool
+from math import sin, cos, tan, pi
 
 from detection import DetectionThreshold
+from detection import STATE_LOCK
+from detection import stateChanged
 
 # CONSTANTS
 
@@ -33,6 +64,29 @@ SIDE_POINTS = [sin(SIDE_ANGLE), cos(SIDE_ANGLE), 0]
 CENTER_POINTS = [0, 1, 0]
 
 MIN_CAL_RADIUS = 8
+
+# Distance added beyond the outer zone boundary (matches discrimination)
+ZONE_PADDING = 0.25
+# Pixels added around the projected zone boundary
+ZONE_MASK_PADDING = 20
+# Number of points sampled along each zone boundary segment
+ZONE_BOUNDARY_SAMPLES = 50
+# Minimum camera depth of projected zone boundary points
+ZONE_MIN_DEPTH = 0.1
+
+# Calibration file format
+CAL_MAGIC = 'WENDECAL'
+CAL_VERSION = 1
+# Magic, version, header size and header CRC-32
+CAL_PREFIX = struct.Struct('<8sIII')
+# Byte alignment of array sections
+CAL_ALIGNMENT = 64
+# CalibrationData attributes stored in the header
+CAL_VALUES = ('intrinsic', 'distortion', 'rotation', 'translation',
+              'image_points', 'object_points', 'zone_roi', 'zone_distance',
+              'zone_radius', 'is_valid')
+# CalibrationData attributes stored as memory-mapped sections
+CAL_SECTIONS = ('zone_mask', 'ground_table', 'zone_table')
 ZERO_ARRAY = np.zeros((3), np.uint8)
 ONE_ARRAY = np.ones((3), np.uint8)
 
@@ -95,14 +149,26 @@ class SourceCalibrationModule(object):
 
     Methods:
         calibrate()
+        submitJob()
+        calibrateAsync()
         getCalibration()
         getCalibrationPoints()
+        findCalibrationPoints()
         calcExtrinsicParams()
         loadIntrinsicParams()
         getCalibrationDataFilename()
         saveCalibrationData()
         loadCalibrationData()
         calcDistortionMaps()
+        getDistortionMaps()
+        calcZoneMask()
+        projectZoneMask()
+        getZoneMask()
+        getZoneKey()
+        calcGroundTable()
+        calcZoneTable()
+        updateGroundTable()
+        getGroundTable()
         setCalibrationThresholds()
         getCalibrationThresholds()
         setDisplayColors()
@@ -114,10 +180,17 @@ class SourceCalibrationModule(object):
     CAL_THRESHOLDS = CalibrationThreshold()
     DISPLAY_COLORS = False, False
     ZONE_DISTANCES = []
+    # Thread pool running calibration jobs, created on first use
+    CAL_POOL = None
+    # Intrinsic parameters read from file, keyed by filenames
+    INTRINSICS = {}
 
     def __init__(self, image_processor):
         self.image_processor = image_processor
         self.config = image_processor.config
+        self.__map_key = None
+        self.use_ground_table = self.config.getboolean('calibration',
+                                                       'ground_table')
 
         # Expected color ranges of calibration markers
         center_thresh_min = np.array(self.config.get
@@ -142,6 +215,13 @@ class SourceCalibrationModule(object):
                                           DetectionThreshold(side_thresh_min,
                                                              side_thresh_max)])
 
+        # Set calibration target distances, which the ground tables of
+        # loaded calibration data depend on
+        if self.config.get('calibration', 'zone_size') == 'NORMAL':
+            self.setCalibrationDistances('NORMAL')
+        elif self.config.get('calibration', 'zone_size') == 'SMALL':
+            self.setCalibrationDistances('SMALL')
+
         # Load pre-saved calibration data or create blank cal_data
         if self.config.getboolean('calibration', 'use_cal_data'):
             self.loadCalibrationData()
@@ -149,28 +229,67 @@ class SourceCalibrationModule(object):
             # Create calibration data object
             self.image_processor.cal_data = CalibrationData()
 
-        # Set calibration target distances
-        if self.config.get('calibration', 'zone_size') == 'NORMAL':
-            self.setCalibrationDistances('NORMAL')
-        elif self.config.get('calibration', 'zone_size') == 'SMALL':
-            self.setCalibrationDistances('SMALL')
-
-    def calibrate(self, cal_points=None):
+    def calibrate(self, cal_points=None, frame=None):
         """Calibrates the image processor
 
+        The calibration is calculated into a new CalibrationData object,
+        which then replaces the image processor's calibration data.
+
         Args:
             cal_points -- list of lists containing calibration points
                 [[x, y], [...], ...]
+            frame -- an 8-bit image array to find calibration points in. A
+                frame is captured if it is not provided.
         """
+        cal_data = CalibrationData()
 
         # Intrinsic
-        self.loadIntrinsicParams()
-        self.calcDistortionMaps()
+        self.loadIntrinsicParams(cal_data)
 
         # Extrinsic
         if not cal_points:
-            cal_points = self.getCalibrationPoints()
-        self.calcExtrinsicParams(cal_points)
+            cal_points = self.getCalibrationPoints(frame)
+        self.calcExtrinsicParams(cal_points, cal_data)
+
+        with STATE_LOCK:
+            self.image_processor.cal_data = cal_data
+            stateChanged()
+
+    def submitJob(self, function, *args):
+        """Runs a function in the calibration thread pool. Errors are logged.
+
+        Args:
+            function: The function to run.
+            args: Arguments passed to the function.
+
+        Returns:
+            An AsyncResult object.
+        """
+        if SourceCalibrationModule.CAL_POOL is None:
+            image_processors = getattr(self.image_processor.tca,
+                                       'image_processors', None)
+            SourceCalibrationModule.CAL_POOL = ThreadPool(
+                max(len(image_processors or ()), 1))
+        return SourceCalibrationModule.CAL_POOL.apply_async(
+            runCalibrationJob, (self.image_processor.isi.name, function, args))
+
+    def calibrateAsync(self, cal_points=None):
+        """Calibrates the image processor in the calibration thread pool.
+
+        When no calibration points are provided, the frame to find them in is
+        captured before the job is submitted.
+
+        Args:
+            cal_points -- list of lists containing calibration points
+                [[x, y], [...], ...]
+
+        Returns:
+            An AsyncResult object.
+        """
+        frame = None
+        if not cal_points:
+            frame = self.image_processor.captureFrame()
+        return self.submitJob(self.calibrate, cal_points, frame)
 
     def getCalibration(self):
         """Returns calibration data from image processors
@@ -180,47 +299,62 @@ class SourceCalibrationModule(object):
         """
         return self.image_processor.cal_data
 
-    def getCalibrationPoints(self):
+    def getCalibrationPoints(self, frame=None):
         """Finds the pixel coordinates of calibration markers appearing in the
         captured image.
 
         Args:
-            None.
+            frame: An 8-bit image array. A frame is captured if it is not
+                provided.
         """
         # Capture Image
-        frame = self.image_processor.isi.read()
-        avg_frame = frame
-        height, width = frame.shape[:2]
+        if frame is None:
+            frame = self.image_processor.captureFrame()
+
+        # Find centroids of calibration points anywhere in the frame
+        context = self.image_processor.odm.createContext(frame, False)
+        return self.findCalibrationPoints(context)
+
+    def findCalibrationPoints(self, context, draw=(True, True)):
+        """Finds the pixel coordinates of calibration markers in a detection
+        context that is not limited to the zone.
 
-        # Find centroids of calibration points
+        Args:
+            context: A DetectionContext object.
+            draw: Two booleans indicating whether the center and side
+                markers are drawn.
+
+        Returns:
+            A list of (x, y) tuples.
+        """
         cal_points = []
-        for color in self.getCalibrationThresholds():
-            # Get Contours
-            color_threshold = DetectionThreshold(color.min, color.max)
-            _, contours = self.image_processor.odm. \
-                findObjects(frame, self.image_processor.frame_type,
-                            color_threshold)
+        for color, draw_color in zip(self.getCalibrationThresholds(), draw):
+            # Get objects
+            blobs = context.findObjects(color, draw_color)
             # Get center points
-            for contour in contours:
-                center, radius = cv.minEnclosingCircle(contour)
-                if radius > MIN_CAL_RADIUS:
-                    cal_points.append(center)
+            for center in blobs.centers[blobs.radii > MIN_CAL_RADIUS]:
+                cal_points.append(tuple(center.tolist()))
 
         return cal_points
 
-    def calcExtrinsicParams(self, cal_points):
+    def calcExtrinsicParams(self, cal_points, cal_data=None):
         """Collects images and calculates extrinsic parameters, storing them
         in ImageProcessor object
 
         Args:
             cal_points: A tuple containing the calibration points
+            cal_data: The CalibrationData object to store the parameters in.
+                Defaults to the image processor's calibration data.
         """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
+
         # Verify image points are valid
         if not len(cal_points) == 6:
             logging.error("%s Calibration Failed: %d/6 points: %s" %
                           (self.image_processor.isi.name, len(cal_points),
                            cal_points))
-            self.image_processor.cal_data.is_valid = False
+            cal_data.is_valid = False
             self.setDisplayColors(False, False)
             return
 
@@ -246,34 +380,45 @@ class SourceCalibrationModule(object):
         # logging.debug("distortion: %s"
         #              % self.image_processor.cal_data.distortion)
         _, rvec, tvec = cv.solvePnP(objectPoints, imagePoints,
-                                    self.image_processor.cal_data.intrinsic,
-                                    self.image_processor.cal_data.distortion)
+                                    cal_data.intrinsic, cal_data.distortion)
         rotation, _ = cv.Rodrigues(rvec)
         translation = tvec
 
         # Store in camera object
-        self.image_processor.cal_data.rotation = rotation
-        self.image_processor.cal_data.translation = translation
-        self.image_processor.cal_data.object_points = objectPoints
-        self.image_processor.cal_data.image_points = imagePoints
+        cal_data.rotation = rotation
+        cal_data.translation = translation
+        cal_data.object_points = objectPoints
+        cal_data.image_points = imagePoints
 
-        self.image_processor.cal_data.is_valid = True
+        cal_data.is_valid = True
         self.setDisplayColors(False, False)
 
-    def loadIntrinsicParams(self):
-        """Loads intrinsic matrix and distortion coefficients and calculates
-        distortion map.
+        self.calcZoneMask(cal_data)
+        if self.use_ground_table:
+            self.calcGroundTable(cal_data)
+
+    def loadIntrinsicParams(self, cal_data=None):
+        """Loads intrinsic matrix and distortion coefficients. The files are
+        only read the first time they are used.
 
         Args:
-            None.
+            cal_data: The CalibrationData object to store the parameters in.
+                Defaults to the image processor's calibration data.
         """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
         intrinsic_file = self.config.get('calibration', 'cal_intrinsic_file')
         distortion_file = self.config.get('calibration',
                                           'cal_distortion_file')
-        logging.debug('Loading intrinsic data from %s, %s' %
-                      (intrinsic_file, distortion_file))
-        self.image_processor.cal_data.intrinsic = np.loadtxt(intrinsic_file)
-        self.image_processor.cal_data.distortion = np.loadtxt(distortion_file)
+        key = (intrinsic_file, distortion_file)
+        if key not in SourceCalibrationModule.INTRINSICS:
+            logging.debug('Loading intrinsic data from %s, %s' %
+                          (intrinsic_file, distortion_file))
+            SourceCalibrationModule.INTRINSICS[key] = (
+                np.loadtxt(intrinsic_file), np.loadtxt(distortion_file))
+        intrinsic, distortion = SourceCalibrationModule.INTRINSICS[key]
+        cal_data.intrinsic = intrinsic.copy()
+        cal_data.distortion = distortion.copy()
 
     def getCalibrationDataFilename(self):
         """Generates the calibration data filename and returns it.
@@ -295,29 +440,53 @@ class SourceCalibrationModule(object):
         Args:
             None.
         """
-        with open(self.getCalibrationDataFilename(), 'w') as cal_file:
-            pickle.dump(self.image_processor.cal_data, cal_file)
-            #self.image_processor.cal_data.save(cal_file)
+        self.image_processor.cal_data.save(self.getCalibrationDataFilename())
 
     def loadCalibrationData(self):
-        """Loads calibration data from the calibration file.
+        """Loads calibration data from the calibration file. Invalid files
+        are logged and leave the image processor uncalibrated. A saved zone
+        mask is kept until the calibration or zone distances change. Ground
+        tables that were not saved, or were saved for other zone distances,
+        are calculated before the data replaces the image processor's
+        calibration data.
 
         Args:
             None.
         """
-        with open(self.getCalibrationDataFilename(), 'r') as cal_file:
-            self.image_processor.cal_data = pickle.load(cal_file)
-            #self.image_processor.cal_data.load(cal_file)
+        filename = self.getCalibrationDataFilename()
+        cal_data = CalibrationData()
+        try:
+            cal_data.load(filename)
+        except IOError as error:
+            logging.error('Unable to load calibration data: %s' % error)
+            cal_data = CalibrationData()
+        if not self.use_ground_table:
+            cal_data.ground_table = None
+            cal_data.zone_table = None
+        elif cal_data.is_valid:
+            self.updateGroundTable(cal_data)
+        if (cal_data.is_valid and cal_data.zone_mask is not None and
+                cal_data.zone_distance is not None):
+            cal_data.zone_key = self.getZoneKey(cal_data,
+                                                cal_data.zone_distance)
+        with STATE_LOCK:
+            self.image_processor.cal_data = cal_data
+            stateChanged()
 
     def calcDistortionMaps(self):
         """Calculates distortion maps used for distortion compensation.
 
+        The maps use the fixed-point CV_16SC2 format, which takes half the
+        memory of floating point maps and remaps faster.
+
         Args:
             None.
         """
         cal_data = self.image_processor.cal_data
-        size = (self.image_processor.isi.height,
-                self.image_processor.isi.width)
+        size = (self.image_processor.isi.width,
+                self.image_processor.isi.height)
+        self.__map_key = (np.asarray(cal_data.intrinsic).tostring(),
+                          np.asarray(cal_data.distortion).tostring())
 
         # Calculate newCameraMatrix
         camera_matrix, _ = cv.getOptimalNewCameraMatrix(
@@ -326,7 +495,258 @@ class SourceCalibrationModule(object):
         # Calculate Distortion Maps
         cal_data.map1, cal_data.map2 = cv.initUndistortRectifyMap(
             cal_data.intrinsic, cal_data.distortion,
-            None, camera_matrix, size, cv.CV_32FC1)
+            None, camera_matrix, size, cv.CV_16SC2)
+
+    def getDistortionMaps(self):
+        """Returns the distortion maps, calculating them on first use or
+        when the intrinsic parameters have changed.
+
+        Args:
+            None.
+
+        Returns:
+            A two-element tuple containing the maps passed to remap().
+        """
+        cal_data = self.image_processor.cal_data
+        key = (np.asarray(cal_data.intrinsic).tostring(),
+               np.asarray(cal_data.distortion).tostring())
+        if cal_data.map1 is None or key != self.__map_key:
+            self.calcDistortionMaps()
+        return cal_data.map1, cal_data.map2
+
+    def calcZoneMask(self, cal_data=None):
+        """Projects the demonstration zone boundary into the image to create
+        a pixel mask of the zone and its bounding region of interest.
+
+        The mask, region of interest and the key of the parameters they were
+        built from are stored in the calibration data together, so a
+        calibration job publishes them with the calibration data itself.
+
+        Args:
+            cal_data: The CalibrationData object to calculate the mask for.
+                Defaults to the image processor's calibration data.
+        """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
+        distance = self.getCalibrationDistances()[-1]
+        zone_key = self.getZoneKey(cal_data, distance)
+        zone_mask, zone_roi = self.projectZoneMask(cal_data, distance)
+
+        cal_data.zone_mask = zone_mask
+        cal_data.zone_roi = zone_roi
+        cal_data.zone_distance = distance
+        cal_data.zone_key = zone_key
+
+    def projectZoneMask(self, cal_data, distance):
+        """Projects the demonstration zone boundary into the image.
+
+        The boundary is sampled along both zone sides and the outer arc.
+        Points behind the camera are discarded and the convex hull of the
+        remaining projected points is filled, then padded by
+        ZONE_MASK_PADDING pixels.
+
+        Args:
+            cal_data: The CalibrationData object to project with.
+            distance: The outer zone distance.
+
+        Returns:
+            A two-element tuple containing an 8-bit image array mask and an
+            (x, y, width, height) region of interest, or (None, None) if the
+            zone is not visible.
+        """
+        height = self.image_processor.isi.height
+        width = self.image_processor.isi.width
+        radius = (distance + ZONE_PADDING) * SCALE
+
+        # Sample zone sides and outer arc in global coordinates
+        edge = np.linspace(0, radius, ZONE_BOUNDARY_SAMPLES)
+        angles = np.linspace(-SIDE_ANGLE, SIDE_ANGLE, ZONE_BOUNDARY_SAMPLES)
+        boundary_x = np.hstack((edge * sin(-SIDE_ANGLE),
+                                radius * np.sin(angles),
+                                edge * sin(SIDE_ANGLE)))
+        boundary_y = np.hstack((edge * cos(SIDE_ANGLE),
+                                radius * np.cos(angles),
+                                edge * cos(SIDE_ANGLE)))
+        boundary = np.column_stack((boundary_x, boundary_y,
+                                    np.zeros(len(boundary_x))))
+
+        # Keep points in front of the camera
+        depth = (np.dot(boundary, cal_data.rotation[2]) +
+                 cal_data.translation[2, 0])
+        boundary = boundary[depth > ZONE_MIN_DEPTH].astype(np.float32)
+        if len(boundary) < 3:
+            logging.warning('%s zone is not visible' %
+                            self.image_processor.isi.name)
+            return None, None
+
+        # Project with distortion to match the distorted camera frames
+        rvec, _ = cv.Rodrigues(cal_data.rotation)
+        image_points, _ = cv.projectPoints(
+            boundary.reshape(-1, 1, 3), rvec, cal_data.translation,
+            cal_data.intrinsic, cal_data.distortion)
+        hull = cv.convexHull(image_points.reshape(-1, 2).astype(np.int32))
+
+        zone_mask = np.zeros((height, width), np.uint8)
+        cv.fillConvexPoly(zone_mask, hull, 255)
+        kernel = cv.getStructuringElement(
+            cv.MORPH_ELLIPSE, (2 * ZONE_MASK_PADDING + 1,) * 2)
+        zone_mask = cv.dilate(zone_mask, kernel)
+
+        points = cv.findNonZero(zone_mask)
+        if points is None:
+            logging.warning('%s zone is outside the image' %
+                            self.image_processor.isi.name)
+            return None, None
+
+        zone_roi = cv.boundingRect(points)
+        logging.debug('%s zone region of interest: %s' %
+                      (self.image_processor.isi.name, zone_roi,))
+        return zone_mask, zone_roi
+
+    def getZoneMask(self):
+        """Returns the zone pixel mask and region of interest, recalculating
+        them if the calibration or zone distances have changed.
+
+        Args:
+            None
+
+        Returns:
+            A two-element tuple containing an 8-bit image array mask and an
+            (x, y, width, height) region of interest, or (None, None) if the
+            image processor is not calibrated.
+        """
+        cal_data = self.image_processor.cal_data
+        if not cal_data.is_valid:
+            return None, None
+        if self.getZoneKey() != cal_data.zone_key:
+            self.calcZoneMask(cal_data)
+        return cal_data.zone_mask, cal_data.zone_roi
+
+    def getZoneKey(self, cal_data=None, distance=None):
+        """Returns a value identifying the parameters the zone mask depends
+        on.
+
+        Args:
+            cal_data: A CalibrationData object. Defaults to the image
+                processor's calibration data.
+            distance: The outer zone distance. Defaults to the current
+                calibration distance.
+
+        Returns:
+            A tuple
+        """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
+        if distance is None:
+            distance = self.getCalibrationDistances()[-1]
+        return (np.asarray(cal_data.rotation).tostring(),
+                np.asarray(cal_data.translation).tostring(),
+                np.asarray(cal_data.intrinsic).tostring(),
+                distance)
+
+    def calcGroundTable(self, cal_data=None):
+        """Calculates the ground coordinates of every pixel in the image.
+
+        Pixels are undistorted using the intrinsic matrix and distortion
+        coefficients before being projected onto the ground plane, so the
+        table also corrects lens distortion. The zone table is recalculated
+        afterwards.
+
+        Args:
+            cal_data: The CalibrationData object to calculate the table for.
+                Defaults to the image processor's calibration data.
+        """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
+        height = self.image_processor.isi.height
+        width = self.image_processor.isi.width
+
+        rows, cols = np.indices((height, width), np.float32)
+        pixels = np.dstack((cols, rows)).reshape(-1, 1, 2)
+        pixels = cv.undistortPoints(pixels, cal_data.intrinsic,
+                                    cal_data.distortion,
+                                    P=cal_data.intrinsic).reshape(-1, 2)
+
+        homography = cal_data.getGroundHomography()
+        ground = (np.dot(pixels, homography[:, :2].T.astype(np.float32)) +
+                  homography[:, 2].astype(np.float32))
+        ground = ground[:, :2] / ground[:, 2:]
+        cal_data.ground_table = ground.reshape(height, width, 2)
+        self.calcZoneTable(cal_data)
+
+    def calcZoneTable(self, cal_data=None):
+        """Marks the pixels of the ground table that lie inside the zone
+        sector and within the outer zone distance (with padding).
+
+        Args:
+            cal_data: The CalibrationData object to calculate the table for.
+                Defaults to the image processor's calibration data.
+        """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
+        radius = (self.getCalibrationDistances()[-1] + ZONE_PADDING) * SCALE
+        ground_x = cal_data.ground_table[:, :, 0]
+        ground_y = cal_data.ground_table[:, :, 1]
+
+        # Zone sides are SIDE_ANGLE from the y axis
+        in_sector = (np.abs(ground_x) * tan(pi / 2 - SIDE_ANGLE) <
+                     np.abs(ground_y))
+        in_range = np.hypot(ground_x, ground_y) <= radius
+        zone_table = (in_sector & in_range).astype(np.uint8)
+        with STATE_LOCK:
+            cal_data.zone_table = zone_table
+            cal_data.zone_radius = radius
+
+    def updateGroundTable(self, cal_data=None):
+        """Calculates the ground and zone tables if they are missing or the
+        zone distances have changed.
+
+        Args:
+            cal_data: The CalibrationData object to calculate the tables for.
+                Defaults to the image processor's calibration data.
+        """
+        if cal_data is None:
+            cal_data = self.image_processor.cal_data
+        if not (cal_data.is_valid and self.use_ground_table):
+            return
+        shape = (self.image_processor.isi.height,
+                 self.image_processor.isi.width, 2)
+        if (cal_data.ground_table is None or
+                cal_data.ground_table.shape != shape):
+            self.calcGroundTable(cal_data)
+        radius = (self.getCalibrationDistances()[-1] + ZONE_PADDING) * SCALE
+        if cal_data.zone_radius != radius:
+            self.calcZoneTable(cal_data)
+
+    def getGroundTable(self):
+        """Returns the ground and zone tables. The tables are not calculated
+        here; until updateGroundTable() has built them for the current
+        calibration and zone distances, none are returned.
+
+        Args:
+            None
+
+        Returns:
+            A two-element tuple containing the H x W x 2 ground table and the
+            H x W zone table, or (None, None) if the image processor is not
+            calibrated, ground tables are disabled or the tables are not
+            ready.
+        """
+        cal_data = self.image_processor.cal_data
+        if not (cal_data.is_valid and self.use_ground_table):
+            return None, None
+        with STATE_LOCK:
+            ground_table = cal_data.ground_table
+            zone_table = cal_data.zone_table
+            zone_radius = cal_data.zone_radius
+        shape = (self.image_processor.isi.height,
+                 self.image_processor.isi.width)
+        radius = (self.getCalibrationDistances()[-1] + ZONE_PADDING) * SCALE
+        if (ground_table is None or zone_table is None or
+                zone_table.shape != shape or
+                ground_table.shape[:2] != shape or zone_radius != radius):
+            return None, None
+        return ground_table, zone_table
 
     def setCalibrationThresholds(self, which_color, cal_thresholds):
         """ Sets new HSV values used to find calibration points
@@ -338,16 +758,16 @@ class SourceCalibrationModule(object):
                 either one or two DetectionThreshold objects
 
         """
-        if which_color == 'all':
-            SourceCalibrationModule.CAL_THRESHOLDS.setThresholds('all',
-                                                        cal_thresholds[0].min,
-                                                        cal_thresholds[0].max,
-                                                        cal_thresholds[1].min,
-                                                        cal_thresholds[1].max)
-        elif which_color == 'center' or 'side':
-            SourceCalibrationModule.CAL_THRESHOLDS.setThresholds(which_color,
-                                                        cal_thresholds[0].min,
-                                                        cal_thresholds[0].max)
+        with STATE_LOCK:
+            if which_color == 'all':
+                SourceCalibrationModule.CAL_THRESHOLDS.setThresholds(
+                    'all', cal_thresholds[0].min, cal_thresholds[0].max,
+                    cal_thresholds[1].min, cal_thresholds[1].max)
+            elif which_color == 'center' or 'side':
+                SourceCalibrationModule.CAL_THRESHOLDS.setThresholds(
+                    which_color, cal_thresholds[0].min,
+                    cal_thresholds[0].max)
+            stateChanged()
 
     def getCalibrationThresholds(self, which_color=None):
         """ Gets HSV values used to find calibration points
@@ -379,6 +799,7 @@ class SourceCalibrationModule(object):
         """
 
         SourceCalibrationModule.DISPLAY_COLORS = bool_center, bool_side
+        stateChanged()
 
     def getDisplayColors(self):
         """ Gets current value for display colors class attribute """
@@ -398,6 +819,13 @@ class SourceCalibrationModule(object):
             zone_distances = DISTANCES_SMALL
 
         SourceCalibrationModule.ZONE_DISTANCES = zone_distances
+        stateChanged()
+
+        # Rebuild the zone table of calibrated image sources
+        cal_data = self.image_processor.cal_data
+        if (self.use_ground_table and cal_data is not None and
+                cal_data.is_valid):
+            self.submitJob(self.updateGroundTable, cal_data)
 
         # Calibration point position calculations
         DISTANCES = [distance * SCALE for distance in zone_distances]
@@ -423,18 +851,39 @@ class CalibrationData(object):
             parameters.
         distortion: A multi-channel 2D matrix of the camera distortion
             parameters.
-        map1: An array of the undistortion transformation map.
-        map2: An array of the rectification transformation map.
+        map1: An array of the undistortion transformation map. It is only
+            calculated when a frame is undistorted and is not saved.
+        map2: An array of the rectification transformation map. It is only
+            calculated when a frame is undistorted and is not saved.
         rotation: An array of the rotation parameters.
         translation: An array of the translation parameters.
         image_points: An integer indicating the number of calibration markers
             seen in the image.
         object_points: An array containing the position coordinates for
             calibration points.
+        zone_mask: An 8-bit image array masking the demonstration zone.
+        zone_roi: An (x, y, width, height) tuple bounding the zone mask.
+        zone_distance: The outer zone distance the zone mask was built for.
+        zone_key: A value identifying the parameters the zone mask was built
+            from. It is not saved.
         is_valid: Boolean value defining whether object contains valid
             calibration data
+        ground_homography: A 3x3 matrix mapping homogeneous pixel coordinates
+            to ground plane coordinates. It is recomputed whenever the
+            intrinsic or extrinsic parameters change.
+        ground_table: An H x W x 2 float array of the undistorted ground
+            coordinates of every pixel.
+        zone_table: An H x W 8-bit array that is 1 where a pixel lies inside
+            the zone.
+        zone_radius: The outer zone distance the zone table was built for.
+        reprojection_error: The most recently measured distance in pixels
+            between the calibration markers and their projected positions,
+            or None if it has not been measured.
+        is_degraded: Boolean value indicating whether the calibration
+            markers have drifted from their calibrated positions.
 
     Methods:
+        getGroundHomography()
         save()
         load()
         __eq__()
@@ -448,38 +897,139 @@ class CalibrationData(object):
         self.translation = None
         self.image_points = None
         self.object_points = None
+        self.zone_mask = None
+        self.zone_roi = None
+        self.zone_distance = None
+        self.zone_key = None
         self.is_valid = False
+        self.ground_homography = None
+        self.ground_table = None
+        self.zone_table = None
+        self.zone_radius = None
+        self.reprojection_error = None
+        self.is_degraded = False
+        self.__ground_key = None
+
+    def getGroundHomography(self):
+        """Returns the homography from pixel coordinates to ground plane
+        coordinates, computing it if the calibration has changed.
 
-    def save(self, file):
-        """Saves the calibration data to a text file.
+        Ground points (X, Y, 0) project to pixels through
+        intrinsic * [r1 r2 t], so its inverse maps pixels back to the ground.
 
         Args:
-            file: A string containing the file name where the data will be
-                saved.
+            None
+
+        Returns:
+            A 3x3 array
         """
-        logging.debug("%s %s %s %s %s %s %s %s" % (self.intrinsic,
-                                                   self.distortion,
-                                                   self.map1, self.map2,
-                                                   self.rotation,
-                                                   self.translation,
-                                                   self.image_points,
-                                                   self.object_points))
-        np.savez(file, self.intrinsic, self.distortion,
-                 self.map1, self.map2, self.rotation, self.translation,
-                 self.image_points, self.object_points)
-
-    def load(self, file):
-        """Loads the calibration data from a text file.
+        key = (self.intrinsic.tostring(), self.rotation.tostring(),
+               self.translation.tostring())
+        if key != self.__ground_key:
+            rotation = np.asarray(self.rotation, np.float64)
+            translation = np.asarray(self.translation,
+                                     np.float64).reshape(3)
+            plane = np.column_stack((rotation[:, 0], rotation[:, 1],
+                                     translation))
+            homography = np.dot(np.asarray(self.intrinsic, np.float64), plane)
+            self.ground_homography = np.linalg.inv(homography)
+            self.__ground_key = key
+        return self.ground_homography
+
+    def save(self, filename):
+        """Saves the calibration data to a binary calibration file.
+
+        The file starts with a fixed prefix (CAL_PREFIX) followed by a JSON
+        header holding the CAL_VALUES attributes and a table of the array
+        sections, which follow the header aligned to CAL_ALIGNMENT bytes.
+        The distortion maps are not saved.
+
+        Sections may be memory-mapped from the file being replaced, so they
+        are copied and the data is written to a temporary file that is then
+        renamed over the original.
 
         Args:
-            file: A string containing the file name from which the data will
-                be retrieved.
+            filename: A string containing the file name where the data will
+                be saved.
         """
-        (self.intrinsic, self.distortion, self.map1,
-         self.map2, self.rotation, self.translation, self.image_points,
-         self.object_points) = np.load(file).files
+        sections = []
+        arrays = []
+        offset = 0
+        for name in CAL_SECTIONS:
+            array = getattr(self, name)
+            if array is None:
+                continue
+            array = np.array(array, copy=True, order='C')
+            offset = alignOffset(offset)
+            sections.append({'name': name, 'dtype': array.dtype.str,
+                             'shape': list(array.shape), 'offset': offset})
+            arrays.append(array)
+            offset += array.nbytes
+
+        header = json.dumps({
+            'values': dict((name, encodeValue(getattr(self, name)))
+                           for name in CAL_VALUES),
+            'sections': sections}, sort_keys=True)
+        prefix = CAL_PREFIX.pack(CAL_MAGIC, CAL_VERSION, len(header),
+                                 zlib.crc32(header) & 0xffffffff)
+        data_start = alignOffset(len(prefix) + len(header))
+
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'wb') as cal_file:
+            cal_file.write(prefix)
+            cal_file.write(header)
+            position = len(prefix) + len(header)
+            for section, array in zip(sections, arrays):
+                start = data_start + section['offset']
+                cal_file.write('\0' * (start - position))
+                cal_file.write(array.tostring())
+                position = start + array.nbytes
+        if os.name == 'nt' and os.path.exists(filename):
+            # Windows cannot rename over an existing file
+            os.remove(filename)
+        os.rename(temp_filename, filename)
+
+    def load(self, filename):
+        """Loads the calibration data from a binary calibration file. Array
+        sections are memory-mapped rather than read.
 
-        self.is_valid = True
+        Args:
+            filename: A string containing the file name from which the data
+                will be retrieved.
+
+        Raises:
+            IOError: The file is missing, truncated, of another version or
+                fails its checksum.
+        """
+        with open(filename, 'rb') as cal_file:
+            prefix = cal_file.read(CAL_PREFIX.size)
+            if len(prefix) != CAL_PREFIX.size:
+                raise IOError('%s is truncated' % filename)
+            magic, version, header_size, checksum = CAL_PREFIX.unpack(prefix)
+            if magic != CAL_MAGIC:
+                raise IOError('%s is not a calibration file' % filename)
+            if version != CAL_VERSION:
+                raise IOError('%s has unsupported version %d' %
+                              (filename, version))
+            header = cal_file.read(header_size)
+        if (len(header) != header_size or
+                zlib.crc32(header) & 0xffffffff != checksum):
+            raise IOError('%s failed its checksum' % filename)
+        header = json.loads(header)
+
+        for name, value in header['values'].iteritems():
+            setattr(self, str(name), decodeValue(value))
+
+        data_start = alignOffset(CAL_PREFIX.size + header_size)
+        file_size = os.path.getsize(filename)
+        for section in header['sections']:
+            dtype = np.dtype(str(section['dtype']))
+            shape = tuple(section['shape'])
+            offset = data_start + section['offset']
+            if offset + dtype.itemsize * int(np.prod(shape)) > file_size:
+                raise IOError('%s is truncated' % filename)
+            setattr(self, str(section['name']),
+                    np.memmap(filename, dtype, 'r', offset, shape))
 
     def __eq__(self):
         """Checks to see if calibration data is present.
@@ -491,3 +1041,69 @@ class CalibrationData(object):
             A boolean
         """
         return self.rotation and self.translation and self.image_points == 6
+
+
+def runCalibrationJob(name, function, args):
+    """Runs a calibration job, logging any error it raises.
+
+    Args:
+        name: A string naming the image source the job belongs to.
+        function: The function to run.
+        args: A tuple of arguments passed to the function.
+
+    Returns:
+        The result of the function, or None if it raised an error.
+    """
+    try:
+        return function(*args)
+    except Exception:
+        logging.exception('%s calibration job failed' % name)
+
+
+def alignOffset(offset):
+    """Rounds a file offset up to the next multiple of CAL_ALIGNMENT.
+
+    Args:
+        offset: An integer byte offset.
+
+    Returns:
+        An integer
+    """
+    return -(-offset // CAL_ALIGNMENT) * CAL_ALIGNMENT
+
+
+def encodeValue(value):
+    """Converts a calibration value into a form that can be stored as JSON.
+
+    Args:
+        value: An array, tuple, numpy scalar or plain value.
+
+    Returns:
+        A JSON serializable value.
+    """
+    if isinstance(value, np.ndarray):
+        return {'dtype': value.dtype.str, 'shape': list(value.shape),
+                'data': value.ravel().tolist()}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return [encodeValue(item) for item in value]
+    return value
+
+
+def decodeValue(value):
+    """Converts a value created by encodeValue() back into a calibration
+    value.
+
+    Args:
+        value: A value read from JSON.
+
+    Returns:
+        An array, tuple or plain value.
+    """
+    if isinstance(value, dict):
+        return np.array(value['data'],
+                        np.dtype(str(value['dtype']))).reshape(value['shape'])
+    if isinstance(value, list):
+        return tuple(decodeValue(item) for item in value)
+    return value
@@ -10,20 +10,66 @@ contours are detected on the filtered image and are overlayed onto original,
 unaltered frame. Rectangular bounding boxes enclosing each contour are also
 drawn before returning the frame.
 
+Instead of converting every frame to HSV, the active detection thresholds may
+be compiled into a color lookup table that maps each quantized BGR color to
+one bit per threshold. A single table lookup per pixel then yields the masks
+of all thresholds at once. The table is only rebuilt when a threshold
+changes.
+
+Once the image source is calibrated, detection is restricted to the image
+region covered by the demonstration zone. Frames are cropped to the zone's
+bounding region of interest and masked with the zone pixel mask before
+contours are found.
+
+Detection may also run on a downscaled frame. Contours found at the reduced
+scale are mapped back to full resolution pixel coordinates and can optionally
+be refined by repeating detection at full resolution around each object.
+Overlapping refinement regions are merged, so each object is found once.
+
+Since the scene is static most of the time, a motion gate can restrict color
+classification to the tiles of a frame that differ from a running background
+model. The classification of all other tiles is reused from earlier frames.
+
+The objects found for a threshold are summarized in a BlobTable, which stores
+the area, bounding box, enclosing circle and centroid of every object in
+contiguous arrays for the discrimination and calibration stages.
+
 Classes:
+    DetectionThreshold
     ObjectDetectionModule
+    DetectionContext
+    ColorLookupTable
+    MotionGate
+    BlobTable
 
 Functions:
+    stateChanged()
+    mergeRegions()
+    getSignature()
+    thresholdHSV()
     buildDetectionThresholds()
 """
 import cv2 as cv
 import numpy as np
 import logging as logging
+import math
+import threading
 
 from image import FRAME_TYPES
+from buffer_pool import BufferPool
 
-# AVG_WEIGHT = 0.01
-# BW_THRESHOLD = 20
+# Serializes changes to the shared detection thresholds, color lookup tables,
+# motion gates and calibration data between the main loop, calibration jobs
+# and the calibration monitor
+STATE_LOCK = threading.RLock()
+# Incremented by stateChanged() whenever state forwarded to worker processes
+# changes
+STATE_VERSION = 0
+
+# Weight of each new frame in the running background model
+AVG_WEIGHT = 0.01
+# Minimum pixel difference from the background to be considered changed
+BW_THRESHOLD = 20
 
 # Binary filter threshold limits
 TARGET_THRESHOLD_MIN = [124, 98, 40]
@@ -40,6 +86,17 @@ DELTA_MAX_RATIO = 0.25
 CONTOUR_MIN_WIDTH = 5
 CONTOUR_MIN_HEIGHT = 5
 
+# Size of the Gaussian blur kernel at full resolution
+BLUR_SIZE = 19
+# Pixels added around objects refined at full resolution
+REFINE_MARGIN = 4
+
+# Fraction of changed pixels for a motion gate tile to be processed
+GATE_CHANGE_RATIO = 0.01
+
+# Bits kept per color channel when indexing the color lookup table
+LUT_BITS = 6
+
 
 class DetectionThreshold(object):
     """ Storage container for minimum and maximum detection thresholds
@@ -77,8 +134,19 @@ class ObjectDetectionModule(object):
     Attributes:
         image_processor: An ImageProcessor object.
         config: A SafeConfigParser object.
+        lookup_table: A ColorLookupTable object when the LUT detection method
+            is configured, otherwise None.
+        use_zone_mask: A boolean indicating whether detection is limited to
+            the calibrated demonstration zone.
+        detection_scale: The scale at which frames are searched for objects.
+        detection_refine: A boolean indicating whether objects found in
+            downscaled frames are refined at full resolution.
+        gate: A MotionGate object when the motion gate is configured,
+            otherwise None.
 
     Methods:
+        createContext()
+        getDetectionThresholds()
         findObjects()
     """
 
@@ -88,6 +156,65 @@ class ObjectDetectionModule(object):
     def __init__(self, image_processor):
         self.image_processor = image_processor
         self.config = image_processor.config
+        self.lookup_table = None
+        if self.config.get('detection', 'detection_method') == 'LUT':
+            self.lookup_table = ColorLookupTable()
+        self.use_zone_mask = self.config.getboolean('detection', 'zone_mask')
+        self.detection_scale = self.config.getfloat('detection',
+                                                    'detection_scale')
+        self.detection_refine = self.config.getboolean('detection',
+                                                       'detection_refine')
+        self.gate = None
+        if self.config.getboolean('detection', 'motion_gate'):
+            self.gate = MotionGate(
+                self.config.getint('detection', 'gate_tile_size'),
+                self.config.getint('detection', 'gate_refresh'))
+
+    def createContext(self, frame, use_zone_mask=True, background=None,
+                      buffers=None):
+        """Creates a detection context for a single frame.
+
+        The color lookup table is rebuilt first if any detection threshold
+        has changed.
+
+        Args:
+            frame: An 8-bit image array of the frame to be processed.
+            use_zone_mask: A boolean indicating whether detection should be
+                limited to the calibrated demonstration zone.
+            background: An 8-bit image array of the background model. When
+                provided, the motion gate is applied to the frame.
+            buffers: A BufferPool object holding the intermediate images. A
+                temporary pool is used if it is not provided.
+
+        Returns:
+            A DetectionContext object.
+        """
+        if self.lookup_table is not None:
+            with STATE_LOCK:
+                if (self.lookup_table.update(self.getDetectionThresholds())
+                        and self.gate is not None):
+                    self.gate.reset()
+        zone_mask = zone_roi = None
+        if use_zone_mask and self.use_zone_mask:
+            zone_mask, zone_roi = self.image_processor.scm.getZoneMask()
+        gate = None
+        if background is not None:
+            gate = self.gate
+        return DetectionContext(frame, self.lookup_table, zone_mask, zone_roi,
+                                self.detection_scale, self.detection_refine,
+                                gate, background, buffers)
+
+    def getDetectionThresholds(self):
+        """Returns all active detection thresholds: target, center and side.
+
+        Args:
+            None
+
+        Returns:
+            A list of DetectionThreshold objects.
+        """
+        return ([ObjectDetectionModule.TARGET_THRESHOLDS] +
+                self.image_processor.scm.getCalibrationThresholds())
 
     def findObjects(self, frame, frame_type=FRAME_TYPES[0],
                     detection_threshold=TARGET_THRESHOLDS):
@@ -102,6 +229,9 @@ class ObjectDetectionModule(object):
         unaltered frame. Rectangular bounding boxes enclosing sufficiently
         large contours are also drawn.
 
+        To search a frame for several thresholds, use a DetectionContext
+        so the blurred HSV image is only computed once.
+
         Args:
             frame: An 8-bit image array of the frame to be processed.
             frame_type: An string from the FRAME_TYPES list that describes a
@@ -111,62 +241,931 @@ class ObjectDetectionModule(object):
         Returns:
             A two-element list whose first element is the original 8-bit
             image frame with contours and bounding boxes drawn. The second
-            element is an array containing vectors of contour points.
+            element is a BlobTable object summarizing the detected objects.
+        """
+        context = self.createContext(frame, False)
+        blobs = context.findObjects(detection_threshold)
+
+        return (context.getFrame(frame_type), blobs)
+
+
+class DetectionContext(object):
+    """Holds the intermediate images of a single frame so that any number of
+    detection thresholds can be applied to it while the blur and color
+    classification are only performed once.
+
+    Attributes:
+        frame: An 8-bit image array of the frame being processed.
+        lookup_table: A ColorLookupTable object, or None to threshold the
+            HSV frame directly.
+        roi_frame: The part of the frame inside the region of interest.
+        zone_mask: An 8-bit mask of the zone inside the region of interest,
+            or None when detection is not limited to the zone.
+        offset: The (x, y) position of the region of interest in the frame.
+        scale: The scale at which the region of interest is searched.
+        refine: A boolean indicating whether downscaled detections are
+            refined at full resolution.
+        detect_frame: The region of interest at the detection scale.
+        detect_mask: The zone mask at the detection scale.
+        gate: A MotionGate object limiting classification to changed tiles,
+            or None to classify the whole frame.
+        buffers: A BufferPool object providing the intermediate images.
+        main_frame: A copy of the frame with all detections drawn. It will
+            contain "None" until it is first requested.
+        detections: A list of BlobTable objects found in the frame.
+        thresh_frame: The binary image of the most recent detection, limited
+            to the region of interest at the detection scale.
+
+    Methods:
+        blur_frame()
+        hsv_frame()
+        class_frame()
+        blur_size()
+        blur_margin()
+        blur()
+        blurHSV()
+        blurClasses()
+        threshold()
+        findObjects()
+        findContours()
+        refineContours()
+        drawObjects()
+        getThreshFrame()
+        getFrame()
+    """
+
+    def __init__(self, frame, lookup_table=None, zone_mask=None,
+                 zone_roi=None, scale=1.0, refine=False, gate=None,
+                 background=None, buffers=None):
+        if buffers is None:
+            buffers = BufferPool()
+        self.buffers = buffers
+        self.frame = frame
+        self.lookup_table = lookup_table
+        self.roi_frame = frame
+        self.zone_mask = None
+        self.offset = (0, 0)
+        self.main_frame = None
+        self.detections = []
+        self.thresh_frame = None
+        self.__blur_frame = None
+        self.__hsv_frame = None
+        self.__class_frame = None
+
+        # Crop to the zone region of interest
+        if zone_mask is not None and zone_mask.shape == frame.shape[:2]:
+            x, y, width, height = zone_roi
+            self.roi_frame = frame[y:y + height, x:x + width]
+            self.zone_mask = zone_mask[y:y + height, x:x + width]
+            self.offset = (x, y)
+
+        # Downscale the region of interest for detection
+        self.scale = scale
+        self.refine = refine and scale < 1
+        self.detect_frame = self.roi_frame
+        self.detect_mask = self.zone_mask
+        if scale < 1:
+            height, width = self.roi_frame.shape[:2]
+            size = (int(round(width * scale)), int(round(height * scale)))
+            self.detect_frame = cv.resize(
+                self.roi_frame, size,
+                dst=buffers.get('detect', size[::-1] + frame.shape[2:]),
+                interpolation=cv.INTER_AREA)
+            if self.zone_mask is not None:
+                self.detect_mask = cv.resize(
+                    self.zone_mask, size,
+                    dst=buffers.get('detect_mask', size[::-1]),
+                    interpolation=cv.INTER_NEAREST)
+
+        # Find the tiles that changed since they were last classified
+        self.gate = gate
+        if gate is not None:
+            x, y = self.offset
+            height, width = self.roi_frame.shape[:2]
+            background = background[y:y + height, x:x + width]
+            if scale < 1:
+                background = cv.resize(background,
+                                       self.detect_frame.shape[1::-1],
+                                       interpolation=cv.INTER_AREA)
+            gate.update(self.detect_frame, background,
+                        (self.offset, self.detect_frame.shape))
+
+    @property
+    def blur_frame(self):
+        """Returns the blurred frame at the detection scale, computing it on
+        first use.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit 3-channel BGR image array
+        """
+        if self.__blur_frame is None:
+            self.__blur_frame = self.blur(
+                self.detect_frame,
+                self.buffers.get('blur', self.detect_frame.shape))
+        return self.__blur_frame
+
+    @property
+    def hsv_frame(self):
+        """Returns the blurred frame in HSV format, computing it on first use.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit 3-channel HSV image array
+        """
+        if self.__hsv_frame is None:
+            if self.gate is not None:
+                self.__hsv_frame = self.gate.apply(
+                    'hsv', self.detect_frame, self.blurHSV, self.blur_margin)
+            else:
+                self.__hsv_frame = cv.cvtColor(
+                    self.blur_frame, cv.COLOR_BGR2HSV,
+                    dst=self.buffers.get('hsv', self.detect_frame.shape))
+        return self.__hsv_frame
+
+    @property
+    def class_frame(self):
+        """Returns the threshold bits of each pixel of the blurred frame from
+        the color lookup table, computing them on first use.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit image array
+        """
+        if self.__class_frame is None:
+            if self.gate is not None:
+                self.__class_frame = self.gate.apply(
+                    'class', self.detect_frame, self.blurClasses,
+                    self.blur_margin)
+            else:
+                self.__class_frame = self.lookup_table.lookup(self.blur_frame,
+                                                              self.buffers)
+        return self.__class_frame
+
+    @property
+    def blur_size(self):
+        """Returns the Gaussian blur kernel size at the detection scale.
+
+        Args:
+            None
+
+        Returns:
+            An odd integer
+        """
+        return max(int(round(BLUR_SIZE * self.scale)) | 1, 3)
+
+    @property
+    def blur_margin(self):
+        """Returns the number of pixels around a region that affect its
+        blurred values.
+
+        Args:
+            None
+
+        Returns:
+            An integer
         """
-        blur_frame = cv.GaussianBlur(frame, (19, 19), 0)
-        hsv_frame = cv.cvtColor(blur_frame, cv.COLOR_BGR2HSV)
+        return self.blur_size // 2
+
+    def blur(self, image, dst=None):
+        """Blurs an image at the detection scale.
 
-        detect_min = detection_threshold.min
-        detect_max = detection_threshold.max
+        Args:
+            image: An 8-bit image array.
+            dst: An optional image array to write the result into.
+
+        Returns:
+            An 8-bit image array
+        """
+        return cv.GaussianBlur(image, (self.blur_size, self.blur_size), 0,
+                               dst=dst)
+
+    def blurHSV(self, image):
+        """Blurs an image and converts it to HSV format.
+
+        Args:
+            image: An 8-bit 3-channel BGR image array.
 
-        # Find pixels in defined HSV ranges
-        if detect_min[0] < detect_max[0]:
-            thresh_frame = cv.inRange(hsv_frame, detect_min, detect_max)
+        Returns:
+            An 8-bit 3-channel HSV image array
+        """
+        return cv.cvtColor(self.blur(image), cv.COLOR_BGR2HSV)
+
+    def blurClasses(self, image):
+        """Blurs an image and classifies it with the color lookup table.
+
+        Args:
+            image: An 8-bit 3-channel BGR image array.
+
+        Returns:
+            An 8-bit image array of threshold bits
+        """
+        return self.lookup_table.lookup(self.blur(image))
 
+    def threshold(self, detection_threshold, blur_frame=None):
+        """Binary filters the blurred frame, excluding pixels outside the
+        zone mask.
+
+        The color lookup table is used when it contains the threshold,
+        otherwise the HSV frame is filtered directly.
+
+        Args:
+            detection_threshold: The min and max threshold for binary
+                filtering
+            blur_frame: A blurred 8-bit image array to filter instead of the
+                context's frame. The zone mask is not applied to it.
+
+        Returns:
+            An 8-bit binary image array
+        """
+        bit = None
+        if self.lookup_table is not None:
+            bit = self.lookup_table.getBit(detection_threshold)
+
+        # Each threshold has its own buffer since its binary image may be
+        # kept by the motion gate
+        shape = self.detect_frame.shape[:2]
+        dst = bits = None
+        if blur_frame is None:
+            dst = self.buffers.get(('thresh', id(detection_threshold)), shape)
+            bits = self.buffers.get('thresh_bits', shape)
+
+        if bit is None:
+            if blur_frame is None:
+                hsv_frame = self.hsv_frame
+            else:
+                hsv_frame = cv.cvtColor(blur_frame, cv.COLOR_BGR2HSV)
+            thresh_frame = thresholdHSV(hsv_frame, detection_threshold, dst)
         else:
-            # If the hue is wrapped, process separately from saturation,
-            # value (brightness)
-            channel_hue = hsv_frame[:, :, 0]
-            thresh_hue = np.logical_not(cv.inRange(channel_hue,
-                                                   np.array(detect_max[0]),
-                                                   np.array(detect_min[0])))
-            thresh_sv = cv.inRange(hsv_frame[:, :, 1:],
-                                   detect_min[1:],
-                                   detect_max[1:])
-            # Logical combination of the two thresholds, cast into uint8 for
-            # findContours
-            thresh_frame = np.logical_and(thresh_hue,
-                                          thresh_sv).astype(np.uint8)
-
-        # Calculate contours
-        thresh_copy = thresh_frame.copy()
-        contours, hier = cv.findContours(thresh_copy, cv.RETR_EXTERNAL,
+            if blur_frame is None:
+                class_frame = self.class_frame
+            else:
+                class_frame = self.lookup_table.lookup(blur_frame)
+            bit = np.array(bit, np.uint8)
+            thresh_frame = cv.inRange(np.bitwise_and(class_frame, bit,
+                                                     out=bits),
+                                      bit, bit, dst=dst)
+
+        if blur_frame is None and self.detect_mask is not None:
+            thresh_frame = cv.bitwise_and(thresh_frame, self.detect_mask,
+                                          dst=thresh_frame)
+
+        return thresh_frame
+
+    def findObjects(self, detection_threshold, draw=True):
+        """Finds the contours of objects matching a threshold. The objects
+        are drawn when the main frame is requested.
+
+        Args:
+            detection_threshold: The min and max threshold for binary
+                filtering
+            draw: A boolean indicating whether the objects are drawn and
+                their binary image is kept as the thresh frame.
+
+        Returns:
+            A BlobTable object summarizing the objects in full resolution
+            frame coordinates.
+        """
+        thresh_frame = None
+        if self.gate is not None and not self.gate.tiles.any():
+            # Nothing changed, reuse the previous results
+            thresh_frame, blobs = self.gate.getBlobs(detection_threshold)
+        if thresh_frame is None:
+            thresh_frame = self.threshold(detection_threshold)
+            contours = self.findContours(thresh_frame)
+            if self.refine:
+                contours = self.refineContours(contours, detection_threshold)
+            blobs = BlobTable(contours)
+            if self.gate is not None:
+                self.gate.setBlobs(detection_threshold, thresh_frame, blobs)
+
+        if draw:
+            self.thresh_frame = thresh_frame
+            self.detections.append(blobs)
+            self.main_frame = None
+
+        return blobs
+
+    def findContours(self, thresh_frame):
+        """Finds the contours of a binary image at the detection scale and
+        maps them to full resolution frame coordinates.
+
+        Args:
+            thresh_frame: An 8-bit binary image array at the detection scale.
+
+        Returns:
+            An array containing vectors of contour points.
+        """
+        # findContours modifies its input
+        scratch = self.buffers.get('contours', thresh_frame.shape)
+        scratch[...] = thresh_frame
+        if self.scale == 1:
+            contours, hier = cv.findContours(scratch, cv.RETR_EXTERNAL,
+                                             cv.CHAIN_APPROX_SIMPLE,
+                                             offset=self.offset)
+            return contours
+
+        contours, hier = cv.findContours(scratch, cv.RETR_EXTERNAL,
                                          cv.CHAIN_APPROX_SIMPLE)
+        # Map pixel centers back to full resolution
+        offset = np.array(self.offset, np.float32) + 0.5 / self.scale - 0.5
+        return [np.int32(np.round(contour / self.scale + offset))
+                for contour in contours]
 
-        # Draw countours and bounding boxes
-        main_frame = frame.copy()
-        filtered_contours = []
+    def refineContours(self, contours, detection_threshold):
+        """Repeats detection at full resolution in a small region around each
+        contour found at the detection scale.
+
+        Overlapping regions are merged before detection, so an object near
+        several contours is only found once. Contours for which no full
+        resolution object is found are kept.
+
+        Args:
+            contours: An array containing vectors of contour points in full
+                resolution frame coordinates.
+            detection_threshold: The min and max threshold for binary
+                filtering
+
+        Returns:
+            An array containing vectors of contour points.
+        """
+        roi_height, roi_width = self.roi_frame.shape[:2]
+        offset_x, offset_y = self.offset
+        slack = int(math.ceil(1 / self.scale))
+        margin = REFINE_MARGIN + slack + BLUR_SIZE // 2
+
+        # Regions around the contours in region of interest coordinates,
+        # each a list of its bounds and the bounding boxes of its contours
+        regions = []
         for contour in contours:
-            rect = cv.boundingRect(contour)
-            if rect[1] > CONTOUR_MIN_WIDTH and rect[3] > CONTOUR_MIN_HEIGHT:
-                top = rect[0:2]  # Top left corner
-                bot = (rect[0] + rect[2], rect[1] + rect[3])  # Lwr rght cornr
+            x, y, width, height = cv.boundingRect(contour)
+            x -= offset_x
+            y -= offset_y
+            regions.append([max(x - margin, 0), max(y - margin, 0),
+                            min(x + width + margin, roi_width),
+                            min(y + height + margin, roi_height),
+                            [(x, y, width, height, contour)]])
+        regions = mergeRegions(regions)
+
+        refined = []
+        for left, top, right, bottom, boxes in regions:
+            blur_frame = cv.GaussianBlur(
+                self.roi_frame[top:bottom, left:right],
+                (BLUR_SIZE, BLUR_SIZE), 0)
+            thresh_frame = self.threshold(detection_threshold, blur_frame)
+            if self.zone_mask is not None:
+                thresh_frame = cv.bitwise_and(
+                    thresh_frame, self.zone_mask[top:bottom, left:right])
+            blobs, hier = cv.findContours(
+                thresh_frame, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE,
+                offset=(left + offset_x, top + offset_y))
+
+            # Keep objects centered on one of the original contours
+            found = [False] * len(boxes)
+            for blob in blobs:
+                blob_x, blob_y, blob_width, blob_height = cv.boundingRect(blob)
+                center_x = blob_x - offset_x + blob_width / 2.0
+                center_y = blob_y - offset_y + blob_height / 2.0
+                kept = False
+                for index, (x, y, width, height, _) in enumerate(boxes):
+                    if (x - slack <= center_x <= x + width + slack and
+                            y - slack <= center_y <= y + height + slack):
+                        found[index] = kept = True
+                if kept:
+                    refined.append(blob)
+            refined.extend(box[4] for box, is_found in zip(boxes, found)
+                           if not is_found)
+
+        return refined
+
+    def drawObjects(self):
+        """Returns a copy of the frame with the contours and bounding boxes of
+        all detections drawn, rendering it on first use.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit image array, or the original frame if nothing has been
+            searched for.
+        """
+        if not self.detections:
+            return self.frame
+        if self.main_frame is not None:
+            return self.main_frame
+
+        main_frame = self.buffers.get('main', self.frame.shape)
+        main_frame[...] = self.frame
+        for blobs in self.detections:
+            # Draw countours and bounding boxes
+            large = ((blobs.rects[:, 2] > CONTOUR_MIN_WIDTH) &
+                     (blobs.rects[:, 3] > CONTOUR_MIN_HEIGHT))
+            for x, y, width, height in blobs.rects[large]:
+                top = (x, y)  # Top left corner
+                bot = (x + width, y + height)  # Lower right corner
                 cv.rectangle(main_frame, top, bot, (0, 255, 0), 1)
-                np.append(filtered_contours, contour)
-        cv.drawContours(main_frame, contours, -1, (255, 0, 0), -1)
+            cv.drawContours(main_frame, blobs.contours, -1, (255, 0, 0), -1)
+        self.main_frame = main_frame
+        return main_frame
+
+    def getThreshFrame(self):
+        """Returns the binary image of the most recent detection placed
+        within a full sized frame.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit binary image array, or None if nothing has been searched
+            for.
+        """
+        thresh_frame = self.thresh_frame
+        if thresh_frame is not None and self.detect_frame is not self.frame:
+            # Place region of interest within a full sized frame
+            x, y = self.offset
+            height, width = self.roi_frame.shape[:2]
+            if thresh_frame.shape != (height, width):
+                thresh_frame = cv.resize(
+                    thresh_frame, (width, height),
+                    dst=self.buffers.get('thresh_roi', (height, width)),
+                    interpolation=cv.INTER_NEAREST)
+            roi_thresh_frame = thresh_frame
+            thresh_frame = self.buffers.get('thresh_full',
+                                            self.frame.shape[:2])
+            thresh_frame.fill(0)
+            thresh_frame[y:y + height, x:x + width] = roi_thresh_frame
+        return thresh_frame
+
+    def getFrame(self, frame_type=FRAME_TYPES[0]):
+        """Returns the frame corresponding to a frame type. Only the requested
+        frame is rendered.
+
+        Args:
+            frame_type: An string from the FRAME_TYPES list that describes a
+                property of the current frame.
+
+        Returns:
+            An 8-bit image array
+        """
+        renderers = dict(zip(FRAME_TYPES, (self.drawObjects,
+                                           lambda: self.frame,
+                                           self.getThreshFrame)))
+        return renderers[frame_type]()
+
+
+class ColorLookupTable(object):
+    """Maps quantized BGR colors to one bit per detection threshold.
+
+    Each color channel is reduced to LUT_BITS bits, and the quantized color
+    indexes a table whose entries have bit i set when the color passes
+    detection threshold i.
+
+    Attributes:
+        table: An 8-bit array with one entry per quantized color.
+        thresholds: The list of DetectionThreshold objects in bit order.
+        signature: The threshold values the table was built from.
+
+    Methods:
+        update()
+        compile()
+        getBit()
+        lookup()
+    """
+
+    def __init__(self):
+        self.table = None
+        self.thresholds = []
+        self.signature = None
+
+    def update(self, thresholds):
+        """Rebuilds the table if the thresholds have changed.
+
+        Args:
+            thresholds: A list of at most 8 DetectionThreshold objects.
+
+        Returns:
+            A boolean indicating whether the table was rebuilt.
+        """
+        self.thresholds = thresholds
+        signature = getSignature(thresholds)
+        if signature == self.signature:
+            return False
+        self.compile(thresholds)
+        self.signature = signature
+        return True
+
+    def compile(self, thresholds):
+        """Builds the table by classifying the center color of every
+        quantization bin.
+
+        Args:
+            thresholds: A list of at most 8 DetectionThreshold objects.
+        """
+        logging.debug('Compiling color lookup table')
+        levels = 1 << LUT_BITS
+        shift = 8 - LUT_BITS
+        bin_colors = ((np.arange(levels) << shift) + (1 << shift >> 1)). \
+            astype(np.uint8)
+        colors = bin_colors[np.indices((levels, levels, levels))]
+        colors = np.rollaxis(colors, 0, 4).reshape(1, -1, 3)
+        hsv_colors = cv.cvtColor(colors, cv.COLOR_BGR2HSV)
+
+        table = np.zeros(levels ** 3, np.uint8)
+        for bit, threshold in enumerate(thresholds):
+            matches = thresholdHSV(hsv_colors, threshold).ravel() > 0
+            table[matches] |= 1 << bit
+        self.table = table
+
+    def getBit(self, detection_threshold):
+        """Returns the bit assigned to a detection threshold.
+
+        Args:
+            detection_threshold: A DetectionThreshold object.
+
+        Returns:
+            An integer bit mask, or None if the threshold is not in the table.
+        """
+        for bit, threshold in enumerate(self.thresholds):
+            if threshold is detection_threshold:
+                return 1 << bit
+        return None
+
+    def lookup(self, frame, buffers=None):
+        """Classifies every pixel of a frame.
+
+        Args:
+            frame: An 8-bit 3-channel BGR image array.
+            buffers: A BufferPool object providing the intermediate and
+                result images. A temporary pool is used if it is not
+                provided.
+
+        Returns:
+            An 8-bit image array of threshold bits.
+        """
+        if buffers is None:
+            buffers = BufferPool()
+        shape = frame.shape[:2]
+        quantized = buffers.get('lut_quantized', frame.shape)
+        index = buffers.get('lut_index', shape, np.uint32)
+        channel = buffers.get('lut_channel', shape, np.uint32)
+
+        # Index is (B << 2 * LUT_BITS) | (G << LUT_BITS) | R
+        np.right_shift(frame, 8 - LUT_BITS, out=quantized)
+        index[...] = quantized[:, :, 0]
+        np.left_shift(index, 2 * LUT_BITS, out=index)
+        channel[...] = quantized[:, :, 1]
+        np.left_shift(channel, LUT_BITS, out=channel)
+        np.bitwise_or(index, channel, out=index)
+        channel[...] = quantized[:, :, 2]
+        np.bitwise_or(index, channel, out=index)
+        return self.table.take(index, out=buffers.get('lut_class', shape))
+
+
+class MotionGate(object):
+    """Limits color classification to the tiles of a frame that have changed.
+
+    Each frame is compared with the background model. A tile is processed
+    while more than GATE_CHANGE_RATIO of its pixels differ from the background
+    by over BW_THRESHOLD, once more after it settles, and at least every
+    refresh frames. Per-pixel results of processed tiles are written into
+    cached images, so unchanged tiles keep their earlier results.
+
+    Attributes:
+        tile_size: The width and height of a tile in pixels.
+        refresh: The maximum number of frames a tile is skipped.
+        tiles: A boolean array marking the tiles processed this frame.
+        active: A boolean array marking the tiles that differed from the
+            background when last compared.
+        age: An array counting the frames since each tile was processed.
+        key: A value identifying the frame geometry of the cached results.
+        cache: A dictionary of cached per-pixel images.
+        blobs: A dictionary of cached detections for each threshold.
+        tiles_processed: The number of tiles processed this frame.
+        tiles_skipped: The number of tiles skipped this frame.
+
+    Methods:
+        reset()
+        update()
+        apply()
+        getBlobs()
+        setBlobs()
+        getStats()
+    """
+
+    def __init__(self, tile_size=64, refresh=30):
+        self.tile_size = tile_size
+        self.refresh = refresh
+        self.tiles = None
+        self.active = None
+        self.age = None
+        self.key = None
+        self.cache = {}
+        self.blobs = {}
+        self.tiles_processed = 0
+        self.tiles_skipped = 0
+
+    def reset(self):
+        """Discards all cached results so the next frame is fully processed.
+
+        Args:
+            None
+        """
+        self.key = None
+
+    def update(self, frame, background, key):
+        """Determines the tiles of a frame that must be processed.
+
+        Args:
+            frame: An 8-bit 3-channel image array.
+            background: An 8-bit 3-channel image array of the background model
+                with the same size as the frame.
+            key: A value identifying the frame geometry. Cached results are
+                discarded when it changes.
+        """
+        height, width = frame.shape[:2]
+        tiles_shape = (int(math.ceil(height / float(self.tile_size))),
+                       int(math.ceil(width / float(self.tile_size))))
+
+        # Fraction of changed pixels in each tile
+        diff = cv.absdiff(cv.cvtColor(frame, cv.COLOR_BGR2GRAY),
+                          cv.cvtColor(background, cv.COLOR_BGR2GRAY))
+        _, changed = cv.threshold(diff, BW_THRESHOLD, 255, cv.THRESH_BINARY)
+        changed = cv.resize(changed, tiles_shape[::-1],
+                            interpolation=cv.INTER_AREA)
+        active = changed > GATE_CHANGE_RATIO * 255
+
+        if key != self.key:
+            self.key = key
+            self.cache = {}
+            self.blobs = {}
+            self.tiles = np.ones(tiles_shape, np.bool_)
+            self.age = np.zeros(tiles_shape, np.int32)
+        else:
+            self.tiles = active | self.active | (self.age >= self.refresh)
+            self.age += 1
+            self.age[self.tiles] = 0
+        self.active = active
+
+        self.tiles_processed = int(np.count_nonzero(self.tiles))
+        self.tiles_skipped = self.tiles.size - self.tiles_processed
+
+    def apply(self, name, image, compute, margin):
+        """Returns a cached per-pixel result, recomputing the processed tiles.
+
+        Adjacent processed tiles in a row are computed together.
+
+        Args:
+            name: A string naming the cached result.
+            image: The image array the result is computed from.
+            compute: A function computing the result of an image region.
+            margin: The number of pixels around a region that affect its
+                result.
+
+        Returns:
+            An image array
+        """
+        cached = self.cache.get(name)
+        if cached is None or self.tiles.all():
+            cached = compute(image)
+            self.cache[name] = cached
+            return cached
+
+        size = self.tile_size
+        height, width = image.shape[:2]
+        for row in xrange(self.tiles.shape[0]):
+            columns = np.flatnonzero(self.tiles[row])
+            if not len(columns):
+                continue
+            # Split into runs of adjacent tiles
+            runs = np.split(columns, np.flatnonzero(np.diff(columns) > 1) + 1)
+            for run in runs:
+                top, bottom = row * size, min((row + 1) * size, height)
+                left = run[0] * size
+                right = min((run[-1] + 1) * size, width)
+                region_top, region_left = (max(top - margin, 0),
+                                           max(left - margin, 0))
+                region_bottom = min(bottom + margin, height)
+                region_right = min(right + margin, width)
+                result = compute(image[region_top:region_bottom,
+                                       region_left:region_right])
+                cached[top:bottom, left:right] = result[
+                    top - region_top:bottom - region_top,
+                    left - region_left:right - region_left]
+        return cached
+
+    def getBlobs(self, detection_threshold):
+        """Returns the cached detections of a threshold.
+
+        Args:
+            detection_threshold: A DetectionThreshold object.
+
+        Returns:
+            A two-element tuple containing the binary image and BlobTable, or
+            (None, None) if nothing is cached for the threshold's values.
+        """
+        cached = self.blobs.get(id(detection_threshold))
+        if (cached is None or
+                cached[0] != getSignature([detection_threshold])):
+            return None, None
+        return cached[1:]
+
+    def setBlobs(self, detection_threshold, thresh_frame, blobs):
+        """Caches the detections of a threshold.
+
+        Args:
+            detection_threshold: A DetectionThreshold object.
+            thresh_frame: An 8-bit binary image array.
+            blobs: A BlobTable object.
+        """
+        self.blobs[id(detection_threshold)] = (
+            getSignature([detection_threshold]), thresh_frame, blobs)
+
+    def getStats(self):
+        """Returns the motion gate statistics of the current frame.
+
+        Args:
+            None
+
+        Returns:
+            A dictionary
+        """
+        return {'tiles_processed': self.tiles_processed,
+                'tiles_skipped': self.tiles_skipped}
+
+
+class BlobTable(object):
+    """Summarizes detected objects in contiguous arrays, one row per object.
+
+    All values are computed in a single pass over the contours, so later
+    stages never need to walk the contours again.
+
+    Attributes:
+        contours: A list containing vectors of contour points, kept for
+            drawing.
+        areas: An array of contour areas.
+        rects: An N x 4 integer array of bounding boxes (x, y, width,
+            height).
+        centers: An N x 2 array of enclosing circle centers.
+        radii: An array of enclosing circle radii.
+        centroids: An N x 2 array of contour centroids.
+
+    Methods:
+        select()
+        __len__()
+    """
+    def __init__(self, contours=()):
+        count = len(contours)
+        self.contours = list(contours)
+        self.areas = np.zeros(count, np.float32)
+        self.rects = np.zeros((count, 4), np.int32)
+        self.centers = np.zeros((count, 2), np.float32)
+        self.radii = np.zeros(count, np.float32)
+        self.centroids = np.zeros((count, 2), np.float32)
+
+        for index, contour in enumerate(self.contours):
+            moments = cv.moments(contour)
+            area = abs(moments['m00'])
+            self.areas[index] = area
+            self.rects[index] = cv.boundingRect(contour)
+            center, radius = cv.minEnclosingCircle(contour)
+            self.centers[index] = center
+            self.radii[index] = radius
+            if area > 0:
+                self.centroids[index] = (moments['m10'] / moments['m00'],
+                                         moments['m01'] / moments['m00'])
+            else:
+                self.centroids[index] = center
+
+    def select(self, mask):
+        """Returns a table containing a subset of the objects.
+
+        Args:
+            mask: A boolean array or an array of indices selecting objects.
+
+        Returns:
+            A BlobTable object
+        """
+        blobs = BlobTable()
+        indices = np.arange(len(self))[mask]
+        blobs.contours = [self.contours[index] for index in indices]
+        blobs.areas = self.areas[indices]
+        blobs.rects = self.rects[indices]
+        blobs.centers = self.centers[indices]
+        blobs.radii = self.radii[indices]
+        blobs.centroids = self.centroids[indices]
+        return blobs
+
+    def __len__(self):
+        """Returns the number of objects in the table.
+
+        Args:
+            None
+
+        Returns:
+            An integer
+        """
+        return len(self.areas)
+
+
+def stateChanged():
+    """Marks the detection thresholds, calibration data or frame types as
+    changed, so that they are forwarded to worker processes.
+
+    Args:
+        None
+    """
+    global STATE_VERSION
+    with STATE_LOCK:
+        STATE_VERSION += 1
+
+
+def mergeRegions(regions):
+    """Merges overlapping rectangular regions until none overlap.
+
+    Args:
+        regions: A list of regions, each a list of the left, top, right and
+            bottom bounds followed by a list of items inside the region.
+
+    Returns:
+        A list of regions in the same format, where merged regions cover
+        the bounds and hold the items of all the regions they replace.
+    """
+    merged = []
+    for region in regions:
+        region = list(region)
+        # Absorb every merged region overlapping this one, growing it until
+        # it overlaps none of the remaining regions
+        overlapping = True
+        while overlapping:
+            overlapping = False
+            for other in merged:
+                if (other[0] < region[2] and region[0] < other[2] and
+                        other[1] < region[3] and region[1] < other[3]):
+                    merged.remove(other)
+                    region = [min(region[0], other[0]),
+                              min(region[1], other[1]),
+                              max(region[2], other[2]),
+                              max(region[3], other[3]),
+                              other[4] + region[4]]
+                    overlapping = True
+                    break
+        merged.append(region)
+    return merged
+
+
+def getSignature(thresholds):
+    """Returns a value identifying the values of detection thresholds.
+
+    Args:
+        thresholds: A list of DetectionThreshold objects.
+
+    Returns:
+        A tuple
+    """
+    return tuple((threshold.min.tostring(), threshold.max.tostring())
+                 for threshold in thresholds)
+
+
+def thresholdHSV(hsv_frame, detection_threshold, dst=None):
+    """Binary filters an HSV frame.
+
+    Args:
+        hsv_frame: An 8-bit 3-channel HSV image array.
+        detection_threshold: The min and max threshold for binary filtering
+        dst: An optional image array to write the result into.
+
+    Returns:
+        An 8-bit binary image array
+    """
+    detect_min = detection_threshold.min
+    detect_max = detection_threshold.max
 
-##        for contour in contours:
-##            rect = cv.boundingRect(contour)
-##            top  = rect[0:2] # Top left corner
-##            bot  = (rect[0] + rect[2], rect[1] + rect[3]) # Lwr right corner
-##            if rect[2]>CONTOUR_MIN_WIDTH and rect[3]>CONTOUR_MIN_HEIGHT:
-##                cv.rectangle(main_frame, top, bot, (0, 255, 0), 1)
-##        cv.drawContours(main_frame, contours, -1, (255, 0, 0), -1)
+    # Find pixels in defined HSV ranges
+    if detect_min[0] < detect_max[0]:
+        thresh_frame = cv.inRange(hsv_frame, detect_min, detect_max, dst=dst)
 
-        frames = dict(zip(FRAME_TYPES, (main_frame, frame, thresh_frame)))
-        out_frame = frames[frame_type]
+    else:
+        # If the hue is wrapped, process separately from saturation,
+        # value (brightness)
+        channel_hue = hsv_frame[:, :, 0]
+        thresh_hue = np.logical_not(cv.inRange(channel_hue,
+                                               np.array(detect_max[0]),
+                                               np.array(detect_min[0])))
+        thresh_sv = cv.inRange(hsv_frame[:, :, 1:],
+                               detect_min[1:],
+                               detect_max[1:])
+        # Logical combination of the two thresholds, cast into uint8 for
+        # findContours
+        thresh_frame = np.logical_and(thresh_hue,
+                                      thresh_sv).astype(np.uint8)
 
-        return (out_frame, contours)
+    return thresh_frame
 
 
 def buildDetectionThresholds(threshold_seed):
@@ -8,11 +8,17 @@ using the Image Source Interface. Images are then sent to the Object Detection
 Module where the frames are scanned for potential target objects and returned.
 
 The image processor overlays the calibration markers and associated
-calibration status onto each frame as well.
+calibration status onto each frame as well. Overlays are only rendered when
+the most recent frame is requested, so image processors without a visible
+display do not spend time drawing.
 
 Data collected by the image processor from the Object Detection Module is
 delivered to the data processor for further analysis.
 
+Image processors may optionally run in their own worker processes, in which
+case the image processor in the main process receives its frames and
+detections from an ImageProcessorWorker.
+
 Classes:
     ImageProcessor
 
@@ -30,11 +36,14 @@ FRAME_TYPES = ('main', 'orig', 'blur', 'avg', 'gray', 'bw')
 
 from calibration import SourceCalibrationModule
 from detection import ObjectDetectionModule
-from detection import DetectionThreshold
+from detection import AVG_WEIGHT
+from detection import stateChanged
+from buffer_pool import BufferPool
 from image_source import ImageSourceInterface
 from image_sources import Camera
 from image_sources import ImageFile
 from image_sources import VideoFile
+from worker import ImageProcessorWorker
 
 
 class ImageProcessor(object):
@@ -42,9 +51,28 @@ class ImageProcessor(object):
 	Module, and the Source Calibration Module.
 
     Attributes:
-        last_frame: An 8-bit image array containing the most recent frame.
-        __avg_frame: An 8-bit image array that stores an average of previous
-                     frames.
+        __last_frame: An 8-bit image array containing the most recent frame
+                      of the active frame type once it has been rendered.
+        __context: The DetectionContext of the most recent frame, kept until
+                   the frame is rendered.
+        __avg_frame: A floating point image array that stores a running
+                     average of previous frames.
+        frame_stats: A dictionary of statistics about the most recent frame.
+        frame_time: The monotonic capture time in seconds of the most recent
+            frame, or None if no frame has been processed.
+        valid_targets: An M x 2 array of the global positions of the valid
+            targets of the most recent frame.
+        valid_time: The capture time in seconds of the frame the valid
+            targets were found in.
+        cal_points_requested: A boolean indicating whether the calibration
+            markers are to be found in the next processed frame.
+        cal_points: A two-element tuple of the CalibrationData object in use
+            and the list of calibration marker coordinates found in the
+            frame processed after the last request, or None until found.
+        source_frame: The most recent unmodified frame read from the image
+            source, or None when processing runs in a worker process.
+        buffers: A BufferPool object holding the intermediate images of the
+            frame being processed.
         frame_type: An string from the FRAME_TYPES list that describes a
                     property of the current frame.
         cal_data: A CalibrationData object.
@@ -53,24 +81,44 @@ class ImageProcessor(object):
         isi: An ImageSourceInterface object.
         scm: A SourceCalibrationModule object.
         odm: An ObjectDetectionModule object.
+        worker: An ImageProcessorWorker object when processing runs in a
+            worker process, otherwise None.
 
     Methods:
         process()
+        last_frame()
+        last_frame(frame)
+        renderFrame()
         avg_frame()
         avg_frame(frame)
+        startWorker()
+        stopWorker()
+        requestCalibrationPoints()
+        captureFrame()
         saveFrame()
+        startRecord()
+        stopRecord()
         setFrameType()
         __string__()
         __repr__()
     """
     def __init__(self, tca, image_source, frame_type=0):
-        self.last_frame = None
+        self.__last_frame = None
+        self.__context = None
         self.last_detected_positions = None
         self.valid_targets = None
+        self.valid_time = None
+        self.cal_points_requested = False
+        self.cal_points = None
         self.__avg_frame = None
+        self.frame_stats = {}
+        self.frame_time = None
+        self.source_frame = None
+        self.buffers = BufferPool()
         self.frame_type = FRAME_TYPES[frame_type]
         self.cal_data = None
         self.config = tca.config
+        self.worker = None
 
         # Tactical Computer Application
         self.tca = tca
@@ -83,41 +131,117 @@ class ImageProcessor(object):
 
     def process(self):
         """Reads in an image frame and searches for detections. Located
-        detections are defined by enclosing contours, which are stored as
-        vectors of points.
+        detections are defined by enclosing contours, which are summarized in
+        a BlobTable.
+
+        The frame of the active frame type is rendered when last_frame is
+        first accessed.
+
+        When the image source has not captured a new frame since the last
+        call, nothing is processed and the previous detections are returned.
+
+        When running in a worker process, the most recent results published
+        by the worker are collected instead.
+
+        Args:
+            None
+
+        Returns:
+            A BlobTable object summarizing the detected objects.
+        """
+        if self.worker is not None:
+            return self.worker.poll()
+
+        frame = self.isi.read(new_only=True)
+        if frame is None:
+            return self.last_detected_positions
+
+        self.buffers.startFrame()
+        self.source_frame = frame
+        self.frame_time = self.isi.frame_time
+
+        # The background model is only kept for the motion gate
+        background = None
+        if self.odm.gate is not None:
+            background = self.avg_frame
+            self.avg_frame = frame
+            if background is None:
+                background = self.avg_frame
+
+        # Find objects from the image source, sharing the blurred HSV frame
+        # between the target and calibration color thresholds. Calibration
+        # markers may lie outside the current zone, so the zone mask is only
+        # used when calibration colors are neither displayed nor requested.
+        display_colors = self.scm.getDisplayColors()
+        find_markers = self.cal_points_requested
+        context = self.odm.createContext(
+            frame, not (any(display_colors) or find_markers), background,
+            self.buffers)
+        img_data = context.findObjects(ObjectDetectionModule.TARGET_THRESHOLDS)
+
+        if find_markers:
+            # Publish the markers, drawing those of displayed colors
+            self.cal_points_requested = False
+            self.cal_points = (self.cal_data, self.scm.findCalibrationPoints(
+                context, display_colors))
+        else:
+            if display_colors[0]:
+                context.findObjects(
+                    self.scm.getCalibrationThresholds('center'))
+            if display_colors[1]:
+                context.findObjects(self.scm.getCalibrationThresholds('side'))
+
+        self.last_frame = None
+        self.__context = context
+        self.frame_stats = self.buffers.getStats()
+        if context.gate is not None:
+            self.frame_stats.update(context.gate.getStats())
+        logging.debug('%s: %s' % (self.isi.name, self.frame_stats))
+
+        self.last_detected_positions = img_data
+
+        return img_data
+
+    @property
+    def last_frame(self):
+        """Returns the most recent frame of the active frame type, rendering
+        its overlays on first access.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit image array, or None if no frame has been processed
+        """
+        if self.__last_frame is None and self.__context is not None:
+            self.__last_frame = self.renderFrame(self.__context)
+            self.__context = None
+        return self.__last_frame
+
+    @last_frame.setter
+    def last_frame(self, frame):
+        """Sets the most recent frame, discarding any unrendered frame.
+
+        Args:
+            frame: An 8-bit image array
+        """
+        self.__last_frame = frame
+        self.__context = None
+
+    def renderFrame(self, context):
+        """Renders the frame of the active frame type from a detection
+        context.
 
         If calibration has been performed, then circles are drawn on the frame
         at points overlaying the visible calibration markers on the ground.
 
         Args:
-            None
+            context: A DetectionContext object.
 
         Returns:
-            An array storing the contour points of valid target objects.
+            An 8-bit image array
         """
-        self.last_frame = self.isi.read()
-
-        if self.avg_frame is None:
-            self.avg_frame = self.last_frame
-
-        # Find objects from the image source
-        self.last_frame, img_data = self.odm.findObjects(self.last_frame,
-                                                         self.frame_type)
-
-        if self.scm.getDisplayColors()[0]:
-            center_threshold = DetectionThreshold(
-                self.scm.getCalibrationThresholds('center').min,
-                self.scm.getCalibrationThresholds('center').max)
-            self.last_frame, img_data_center = self.odm. \
-                findObjects(self.last_frame, self.frame_type,
-                            center_threshold)
-        if self.scm.getDisplayColors()[1]:
-            side_threshold = DetectionThreshold(
-                self.scm.getCalibrationThresholds('side').min,
-                self.scm.getCalibrationThresholds('side').max)
-            self.last_frame, img_data_side = self.odm. \
-                findObjects(self.last_frame, self.frame_type,
-                            side_threshold)
+        frame = context.getFrame(self.frame_type)
 
         # Display calibration points
         if self.cal_data.is_valid and self.frame_type == 'main':
@@ -128,37 +252,86 @@ class ImageProcessor(object):
                     color = (0, 0, color_intensity)
                 else: 
                     color = (0, color_intensity, 0)
-                cv.circle(self.last_frame, point, 5, color, thickness=-1)
-                cv.circle(self.last_frame, point, 5, [0, 0, 0], thickness=2)
-
-        self.last_detected_positions = img_data
+                cv.circle(frame, point, 5, color, thickness=-1)
+                cv.circle(frame, point, 5, [0, 0, 0], thickness=2)
 
-        return img_data
+        return frame
 
     @property
     def avg_frame(self):
-        """Currently returns the most recent image frame. Future
-        development may return an average of previous image frames.
+        """Returns the running average of previous image frames, which serves
+        as the background model of the scene.
 
         Args:
             None
 
         Returns:
-            An 8-bit image array
+            An 8-bit image array, or None if no frame has been averaged
         """
-        return self.__avg_frame
+        if self.__avg_frame is None:
+            return None
+        return cv.convertScaleAbs(
+            self.__avg_frame,
+            dst=self.buffers.get('background', self.__avg_frame.shape))
 
     @avg_frame.setter
     def avg_frame(self, frame):
-        """Sets average frame using numpy float.
+        """Adds a frame to the running average using numpy float.
 
         Args:
             frame: An 8-bit image array
         """
-        if self.__avg_frame is None:
+        if (self.__avg_frame is None or
+                self.__avg_frame.shape != frame.shape):
             self.__avg_frame = np.float32(frame)
         else:
-            self.__avg_frame = frame
+            cv.accumulateWeighted(frame, self.__avg_frame, AVG_WEIGHT)
+
+    def startWorker(self):
+        """Moves processing into a worker process.
+
+        Args:
+            None
+        """
+        if self.worker is None:
+            self.worker = ImageProcessorWorker(self)
+            self.worker.start()
+
+    def stopWorker(self):
+        """Stops the worker process, if processing runs in one.
+
+        Args:
+            None
+        """
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    def requestCalibrationPoints(self):
+        """Requests the calibration markers to be found in the next processed
+        frame and published in cal_points. When running in a worker process,
+        the request is forwarded by the next poll.
+
+        Args:
+            None
+        """
+        self.cal_points = None
+        self.cal_points_requested = True
+
+    def captureFrame(self):
+        """Reads an unmodified frame from the image source. When running in
+        a worker process, the frame is requested from the worker, which owns
+        the image source.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit image array.
+        """
+        if self.worker is not None:
+            return self.worker.captureFrame()
+        return self.isi.read()
 
     def saveFrame(self, filename="", processed=True):
         """Saves current frame to an image file.
@@ -168,8 +341,33 @@ class ImageProcessor(object):
             processed: A boolean indicating whether or not the image has
                 been processed.
         """
+        if self.worker is not None:
+            self.worker.call('saveFrame', filename, processed)
+            return
         self.isi.save(filename, self.last_frame if processed else None)
 
+    def startRecord(self):
+        """Starts recording frames from the image source to a video file.
+
+        Args:
+            None
+        """
+        if self.worker is not None:
+            self.worker.call('startRecord')
+            return
+        self.isi.startRecord()
+
+    def stopRecord(self):
+        """Stops recording frames from the image source.
+
+        Args:
+            None
+        """
+        if self.worker is not None:
+            self.worker.call('stopRecord')
+            return
+        self.isi.stopRecord()
+
     def setFrameType(self, frame_type):
         """Sets the frame type.
 
@@ -188,6 +386,7 @@ class ImageProcessor(object):
                 raise Exception("Invalid frame type '%s'" % frame_type)
         else:
             self.frame_type = FRAME_TYPES[frame_type]
+        stateChanged()
 
     def __string__(self):
         """Returns a description of the image source.
@@ -264,4 +463,9 @@ def createImageProcessors(tca):
             image_processor = ImageProcessor(tca, image_source)
             image_processors.append(image_processor)
 
+    # Run each image processor in its own process
+    if config.getboolean('main', 'multiprocess'):
+        for image_processor in image_processors:
+            image_processor.startWorker()
+
     return image_processors
@@ -10,17 +10,38 @@ processing, frames can be either saved as single images (PNG by default) or
 compiled into video files (file type controlled in config.ini; avi by
 default).
 
+When threaded capture is enabled, each camera is read continuously by a
+background CaptureThread that keeps only the most recent frame. Reads from
+the interface then return immediately with the newest available frame rather
+than waiting on the camera. Every captured frame is numbered, so a read can
+skip a frame that has already been read.
+
+Every frame read is stamped with a monotonic capture time, so that
+detections from image sources read at different moments can be aligned.
+
 Classes:
     ImageSourceInterface
+    CaptureThread
+
+Functions:
+    getTime()
 """
 import cv2
 import time
 import datetime
 import logging
+import threading
+
+from image_sources import Camera
 
 DEFAULT_OUTPUT_DIR = "../"
 DEFAULT_IMG_EXT = "png"
 
+# Seconds to wait for the first frame from a capture thread
+CAPTURE_TIMEOUT = 5.0
+# Seconds to wait before retrying a failed capture
+CAPTURE_RETRY_DELAY = 0.01
+
 
 class ImageSourceInterface(object):
     """Acts as the point of interaction between the processing algorithms and
@@ -39,16 +60,28 @@ class ImageSourceInterface(object):
             recorded video.
         video_fps: An integer that determines the frames per second of
             recorded video.
+        threaded: A boolean indicating whether frames are captured by a
+            background thread.
+        capture_thread: The CaptureThread object reading the image source.
+            It will contain "None" when threaded capture is not active.
+        frame_time: The monotonic capture time in seconds of the most
+            recently read frame. It will contain "None" until a frame has
+            been read.
+        frame_sequence: An integer numbering the most recently read frame.
+            It is 0 until a frame has been read.
 
     Methods:
         read()
         save()
+        startCapture()
+        stopCapture()
         startRecord()
         stopRecord()
         record()
         width()
         height()
         name()
+        dropped_frames()
         __string__()
         __repr__()
     """
@@ -61,25 +94,51 @@ class ImageSourceInterface(object):
         self.video_codec = self.config.get('video_file', 'video_codec')
         self.video_ext = self.config.get('video_file', 'video_ext')
         self.video_fps = self.config.get('video_file', 'video_fps')
+        self.threaded = (isinstance(image_source, Camera) and
+                         self.config.getboolean('camera', 'threaded_capture'))
+        self.capture_thread = None
+        self.frame_time = None
+        self.frame_sequence = 0
 
-    def read(self, flip=False):
+    def read(self, flip=False, new_only=False):
         """Reads in a frame from the image source and returns it.
 
         The frame will be mirrored if the argument "flip" is true. The frame
         will be written to a video file if "video_writer" and record()
         indicate an active writing state.
 
+        With threaded capture, the capture thread is started on the first
+        read and the most recent captured frame is returned without waiting
+        on the camera.
+
+        The capture time of the frame is stored in frame_time and its number
+        in frame_sequence.
+
         Args:
             flip: A boolean that determines whether images/frames are
                   flipped or mirrored when read.
+            new_only: A boolean that determines whether None is returned,
+                  without recording, when no frame has been captured since
+                  the last read.
 
         Returns:
-            A single 8-bit image array
+            A single 8-bit image array, or None if new_only is set and
+            there is no new frame
 
         Raises:
             IOError: Unable to read image source.
         """
-        frame = self.image_source.read()
+        if self.threaded:
+            if self.capture_thread is None:
+                self.startCapture()
+            frame, frame_time, sequence = self.capture_thread.read()
+            if (new_only and frame is not None and
+                    sequence == self.frame_sequence):
+                return None
+        else:
+            frame = self.image_source.read()
+            frame_time = getTime()
+            sequence = self.frame_sequence + 1
         if flip:
             frame = cv2.flip(frame, 1)
         # Checks for an active writing state.
@@ -87,6 +146,8 @@ class ImageSourceInterface(object):
             self.record(frame)
         if frame is None:
             raise IOError('Unable to read image source %s' % self.name)
+        self.frame_time = frame_time
+        self.frame_sequence = sequence
         return frame
 
     def save(self, filename="", frame=None):
@@ -112,6 +173,32 @@ class ImageSourceInterface(object):
             frame = self.read()
         cv2.imwrite(filename, frame)
 
+    def startCapture(self):
+        """Starts a background thread that continuously captures frames from
+        the image source.
+
+        Args:
+            None
+        """
+        if self.capture_thread is not None:
+            return
+        self.capture_thread = CaptureThread(self.image_source)
+        self.capture_thread.start()
+
+    def stopCapture(self):
+        """Stops the background capture thread.
+
+        Args:
+            None
+        """
+        if self.capture_thread is None:
+            return
+        self.capture_thread.stop()
+        logging.debug('%s capture stopped: %d frames, %d dropped' %
+                      (self.name, self.capture_thread.frame_count,
+                       self.capture_thread.dropped_frames))
+        self.capture_thread = None
+
     def startRecord(self, filename=""):
         """Creates and initializes a file to contain recorded video.
 
@@ -187,6 +274,21 @@ class ImageSourceInterface(object):
         """
         return self.image_source.name
 
+    @property
+    def dropped_frames(self):
+        """Returns the number of captured frames that were replaced by a newer
+        frame before being read.
+
+        Args:
+            None
+
+        Returns:
+            An integer
+        """
+        if self.capture_thread is None:
+            return 0
+        return self.capture_thread.dropped_frames
+
     def __string__(self):
         """Returns the name of the image source (i.e. "Cam1", "Video2", etc.).
 
@@ -211,3 +313,112 @@ class ImageSourceInterface(object):
                                     self.image_source.width,
                                     self.image_source.height)
 
+
+class CaptureThread(threading.Thread):
+    """Continuously reads frames from an image source in the background,
+    keeping only the most recent frame.
+
+    Attributes:
+        image_source: A Camera object.
+        frame: An 8-bit image array containing the most recent frame. It will
+            contain "None" until the first frame has been captured.
+        frame_time: The monotonic capture time in seconds of the most recent
+            frame.
+        frame_count: An integer counting the frames captured, which numbers
+            the most recent frame.
+        dropped_frames: An integer counting the captured frames that were
+            replaced before being read.
+        running: A boolean indicating whether the thread is capturing.
+        failed: A boolean indicating whether capturing stopped because the
+            image source raised an error.
+
+    Methods:
+        run()
+        read()
+        stop()
+    """
+    def __init__(self, image_source):
+        threading.Thread.__init__(self, name='Capture-%s' % image_source.name)
+        self.daemon = True
+        self.image_source = image_source
+        self.frame = None
+        self.frame_time = None
+        self.frame_count = 0
+        self.dropped_frames = 0
+        self.running = True
+        self.failed = False
+        self.__unread = False
+        self.__condition = threading.Condition()
+
+    def run(self):
+        """Captures frames until stopped, replacing the stored frame with each
+        new one. Errors raised by the image source are logged and stop the
+        capture, after which reads return no frame.
+
+        Args:
+            None
+        """
+        while self.running:
+            try:
+                frame = self.image_source.read()
+            except Exception:
+                logging.exception('Capture from %s failed' %
+                                  self.image_source.name)
+                with self.__condition:
+                    self.failed = True
+                    self.__condition.notify_all()
+                return
+            frame_time = getTime()
+            if frame is None:
+                time.sleep(CAPTURE_RETRY_DELAY)
+                continue
+            with self.__condition:
+                if self.__unread:
+                    self.dropped_frames += 1
+                self.frame = frame
+                self.frame_time = frame_time
+                self.frame_count += 1
+                self.__unread = True
+                self.__condition.notify_all()
+
+    def read(self):
+        """Returns the most recent frame, its capture time and its number.
+        Only blocks until the first frame has been captured.
+
+        Args:
+            None
+
+        Returns:
+            A three-element tuple of a single 8-bit image array, or None if
+            no frame was captured within CAPTURE_TIMEOUT seconds or capturing
+            failed, its capture time in seconds and its frame_count number.
+        """
+        with self.__condition:
+            if self.frame is None and not self.failed:
+                self.__condition.wait(CAPTURE_TIMEOUT)
+            if self.failed:
+                return (None, None, None)
+            self.__unread = False
+            return (self.frame, self.frame_time, self.frame_count)
+
+    def stop(self):
+        """Stops capturing and waits for the thread to finish.
+
+        Args:
+            None
+        """
+        self.running = False
+        self.join(CAPTURE_TIMEOUT)
+
+
+def getTime():
+    """Returns the current time of the monotonic tick counter shared by all
+    image sources and worker processes.
+
+    Args:
+        None
+
+    Returns:
+        A float of seconds
+    """
+    return cv2.getTickCount() / cv2.getTickFrequency()
@@ -19,13 +19,17 @@ class Camera:
               an instance of this object (i.e. "Cam1", "Cam2", etc.).
         width: An integer indicating the pixel width of each camera frame.
         height: An integer indicating the pixel height of each camera frame.
+        args: A tuple of the constructor arguments, so the camera can be
+              reopened in another process.
 
     Methods:
         read()
+        release()
         __string__()
     """
     def __init__(self, name, cap_index, size):
         self.capture = cv2.VideoCapture(cap_index)
+        self.args = (name, cap_index, size)
         self.name = name
         self.width = size[0]
         self.height = size[1]
@@ -44,6 +48,14 @@ class Camera:
         _, frame = self.capture.read()
         return frame
 
+    def release(self):
+        """Closes the camera so it can be opened by another process.
+
+        Args:
+            None
+        """
+        self.capture.release()
+
     def __string__(self):
         """Returns the camera name (i.e. "Cam1", "Cam2", etc.).
 
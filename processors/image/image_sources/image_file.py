@@ -18,12 +18,16 @@ class ImageFile:
         image: An array that stores the 8-bit image aquired by imread().
         height: An integer indicating the pixel height of the image.
         width: An integer indicating the pixel width of the image.
+        args: A tuple of the constructor arguments, so the image can be
+              reopened in another process.
 
     Methods:
         read()
+        release()
         __string__()
     """
     def __init__(self, filename):
+        self.args = (filename,)
         self.name = os.path.splitext(filename)[0]
         self.image = cv2.imread(filename)
         # Display error message if image read fails.
@@ -43,6 +47,14 @@ class ImageFile:
         """
         return self.image
 
+    def release(self):
+        """Does nothing, as the image is read when the file is opened.
+
+        Args:
+            None
+        """
+        pass
+
     def __string__(self):
         """Returns the image file name, without the extension.
 
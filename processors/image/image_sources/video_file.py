@@ -19,13 +19,17 @@ class VideoFile:
               an instance of this object (i.e. "Video1", "Video2", etc.).
         width: An integer indicating the pixel width of each video frame.
         height: An integer indicating the pixel height of each video frame.
+        args: A tuple of the constructor arguments, so the video can be
+              reopened in another process.
 
     Methods:
         read()
+        release()
         __string__()
     """
     def __init__(self, name, filename, size):
         self.capture = cv2.VideoCapture(filename)
+        self.args = (name, filename, size)
         self.name = name
         self.width = size[0]
         self.height = size[1]
@@ -51,6 +55,14 @@ class VideoFile:
 
         return frame
 
+    def release(self):
+        """Closes the video file.
+
+        Args:
+            None
+        """
+        self.capture.release()
+
     def __string__(self):
         """Returns a generic video name(i.e. "Video1", "Video2", etc.).
 
@@ -0,0 +1,155 @@
+"""
+Monitors calibrated image sources for calibration drift.
+
+A camera that is bumped after calibration silently produces wrong global
+positions. The calibration monitor periodically finds the ground calibration
+markers again and measures how far they are from where the current
+calibration projects them. Image sources whose markers have moved further
+than the drift threshold are marked as degraded until they are recalibrated.
+
+Checks run in a background thread. Each check requests the markers from an
+image processor, which finds them in its next processed frame, sharing the
+frame's detection context, and publishes them for the following check. The
+monitor therefore never reads from the image sources or runs detection
+itself, and works for image processors in worker processes. The time between
+checks is stretched so that checking takes at most the configured fraction of
+the time.
+
+Classes:
+    CalibrationMonitor
+
+Functions:
+    calcReprojectionError()
+"""
+import logging
+import threading
+import time
+
+import cv2 as cv
+import numpy as np
+
+from detection import STATE_LOCK
+
+# Minimum number of markers that must be found for a drift measurement
+MIN_DRIFT_MARKERS = 3
+
+
+class CalibrationMonitor(threading.Thread):
+    """Periodically measures the calibration drift of image processors in a
+    background thread.
+
+    Attributes:
+        image_processors: A list of ImageProcessor objects.
+        interval: The minimum number of seconds between checks.
+        threshold: The reprojection error in pixels above which an image
+            processor's calibration is marked as degraded.
+        duty_cycle: The maximum fraction of time spent checking.
+        running: A boolean indicating whether the monitor is running.
+
+    Methods:
+        run()
+        stop()
+        check()
+    """
+    def __init__(self, image_processors, config):
+        threading.Thread.__init__(self, name='CalibrationMonitor')
+        self.daemon = True
+        self.image_processors = image_processors
+        self.interval = config.getfloat('calibration', 'drift_interval')
+        self.threshold = config.getfloat('calibration', 'drift_threshold')
+        self.duty_cycle = config.getfloat('calibration', 'drift_duty_cycle')
+        self.running = True
+        self.__stopped = threading.Event()
+
+    def run(self):
+        """Checks all image processors until stopped.
+
+        Args:
+            None
+        """
+        while self.running:
+            start = time.time()
+            for image_processor in self.image_processors:
+                try:
+                    self.check(image_processor)
+                except Exception:
+                    logging.exception('%s drift check failed' %
+                                      image_processor.isi.name)
+            duration = time.time() - start
+            # Limit the time spent checking to the duty cycle
+            delay = max(self.interval, duration / self.duty_cycle) - duration
+            self.__stopped.wait(delay)
+
+    def stop(self):
+        """Stops the monitor and waits for the running check to finish.
+
+        Args:
+            None
+        """
+        self.running = False
+        self.__stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def check(self, image_processor):
+        """Updates the calibration drift of an image processor from the
+        calibration markers it published since the previous check, then
+        requests the markers for the next check. The drift is discarded if
+        the image processor was recalibrated since the markers were found.
+
+        Args:
+            image_processor: An ImageProcessor object.
+        """
+        cal_data = image_processor.cal_data
+        published = image_processor.cal_points
+        if not cal_data.is_valid:
+            return
+        image_processor.requestCalibrationPoints()
+        if published is None or published[0] is not cal_data:
+            return
+
+        cal_points = published[1]
+        error = calcReprojectionError(cal_data, cal_points)
+        if error is None:
+            logging.debug('%s drift check found %d markers' %
+                          (image_processor.isi.name, len(cal_points)))
+            return
+
+        with STATE_LOCK:
+            if image_processor.cal_data is not cal_data:
+                return
+            cal_data.reprojection_error = error
+            degraded = error > self.threshold
+            if degraded and not cal_data.is_degraded:
+                logging.warning('%s calibration degraded: markers moved %.1f '
+                                'pixels' % (image_processor.isi.name, error))
+            cal_data.is_degraded = degraded
+
+
+def calcReprojectionError(cal_data, cal_points):
+    """Calculates the RMS distance between the calibration markers found in a
+    frame and the nearest markers projected with the calibration parameters.
+
+    Distances are measured from the found markers so that markers hidden by
+    targets do not count as drift.
+
+    Args:
+        cal_data: A valid CalibrationData object.
+        cal_points: A list of 2-D pixel coordinates of found markers.
+
+    Returns:
+        A float, or None if fewer than MIN_DRIFT_MARKERS markers were found.
+    """
+    if len(cal_points) < MIN_DRIFT_MARKERS:
+        return None
+
+    rvec, _ = cv.Rodrigues(cal_data.rotation)
+    expected, _ = cv.projectPoints(
+        np.asarray(cal_data.object_points, np.float32).reshape(-1, 1, 3),
+        rvec, cal_data.translation, cal_data.intrinsic, cal_data.distortion)
+    expected = expected.reshape(-1, 1, 2)
+    found = np.asarray(cal_points, np.float64).reshape(1, -1, 2)
+
+    # Distance from each found marker to the nearest expected marker
+    distances = np.sqrt(((expected - found) ** 2).sum(axis=2)).min(axis=0)
+    return float(np.sqrt(np.mean(distances ** 2)))
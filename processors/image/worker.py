@@ -0,0 +1,447 @@
+"""
+Runs image processors in dedicated worker processes.
+
+When multi-process execution is enabled, each ImageProcessor is rebuilt in
+its own worker process from a picklable snapshot of its configuration and
+image source, so workers can be spawned as well as forked. The worker reads
+the image source, detects objects and draws the requested frame type. Every
+processed frame is written into a ring of shared memory slots so the main
+process can display it without copying, while the detections are sent back
+over a pipe. The main process owns each published slot until it hands the
+slot back, so a frame is never rewritten while it is displayed.
+
+State changed in the main process (frame type, calibration parameters and
+detection thresholds) is forwarded to the worker only after it has been
+marked as changed with detection.stateChanged(). Actions
+that must run next to the image source, such as saving or recording frames,
+are forwarded as calls, and unmodified frames needed for calibration are
+requested from the worker rather than read from the image source by the main
+process.
+
+Classes:
+    ImageProcessorWorker
+    WorkerApplication
+
+Functions:
+    getConfigSnapshot()
+    createConfig()
+    getWorkerState()
+    setWorkerState()
+    runWorker()
+    handleControl()
+    publishFrame()
+"""
+import ctypes
+import cPickle as pickle
+import logging
+import multiprocessing
+import time
+from ConfigParser import RawConfigParser
+from ConfigParser import SafeConfigParser
+from multiprocessing import sharedctypes
+
+import cv2 as cv
+import numpy as np
+
+import detection
+from detection import ObjectDetectionModule
+from detection import DetectionThreshold
+from calibration import SourceCalibrationModule
+
+# Number of shared frame slots per worker. A published slot is not rewritten
+# until the main process has released it.
+FRAME_RING_SIZE = 3
+
+# Seconds to wait when the image source has no new frame
+NO_FRAME_DELAY = 0.005
+
+# Calibration data attributes forwarded to workers
+SYNCED_CAL_ATTRIBUTES = ('intrinsic', 'distortion', 'rotation', 'translation',
+                         'image_points', 'object_points', 'is_valid')
+
+
+class ImageProcessorWorker(object):
+    """Runs an ImageProcessor in a worker process and publishes its frames and
+    detections to the main process.
+
+    Attributes:
+        image_processor: The ImageProcessor object in the main process.
+        ring: The shared memory array holding the frame slots.
+        frames: An array of FRAME_RING_SIZE 8-bit image slots backed by shared
+            memory.
+        process: The worker multiprocessing.Process object.
+        frame_count: An integer counting the frames received from the worker.
+        state_version: The detection.STATE_VERSION of the state last
+            forwarded to the worker, or None before the state is forwarded.
+        slot: The index of the slot holding the image processor's last
+            frame, or None before the first frame.
+
+    Methods:
+        start()
+        stop()
+        poll()
+        captureFrame()
+        sync()
+        call()
+    """
+    def __init__(self, image_processor):
+        self.image_processor = image_processor
+        isi = image_processor.isi
+        shape = (FRAME_RING_SIZE, isi.height, isi.width, 3)
+        self.ring = sharedctypes.RawArray(ctypes.c_uint8, int(np.prod(shape)))
+        self.frames = np.frombuffer(self.ring, np.uint8).reshape(shape)
+        self.process = None
+        self.frame_count = 0
+        self.state_version = None
+        self.slot = None
+        self.__result_recv, self.__result_send = multiprocessing.Pipe(False)
+        self.__control_recv, self.__control_send = multiprocessing.Pipe(False)
+
+    def start(self):
+        """Starts the worker process. The image source is closed in the main
+        process and reopened by the worker.
+
+        Args:
+            None
+        """
+        self.sync()
+        isi = self.image_processor.isi
+        isi.stopCapture()
+        isi.image_source.release()
+        self.process = multiprocessing.Process(
+            target=runWorker, name='Worker-%s' % isi.name,
+            args=(getConfigSnapshot(self.image_processor.config),
+                  isi.image_source.__class__, isi.image_source.args,
+                  self.ring, self.frames.shape, self.__result_send,
+                  self.__control_recv))
+        self.process.daemon = True
+        self.process.start()
+        # Close the worker's pipe end so a dead worker is seen as EOF
+        self.__result_send.close()
+
+    def stop(self):
+        """Terminates the worker process.
+
+        Args:
+            None
+        """
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+    def poll(self):
+        """Collects the most recent result published by the worker and stores
+        it in the image processor. Only blocks until the first frame has been
+        received. The slots of the previous and any skipped frames are
+        released to the worker.
+
+        Args:
+            None
+
+        Returns:
+            A BlobTable object summarizing the detected objects.
+
+        Raises:
+            IOError: The worker process has exited.
+        """
+        self.sync()
+        if self.image_processor.cal_points_requested:
+            self.image_processor.cal_points_requested = False
+            self.call('requestCalibrationPoints')
+
+        frame_message = None
+        wait = self.slot is None
+        while wait or self.__result_recv.poll():
+            message = self.receive()
+            # Unmodified frames are only kept by captureFrame()
+            if message[0] != 'frame':
+                continue
+            if frame_message is not None:
+                self.__control_send.send(('release', frame_message[1]))
+            frame_message = message
+            wait = False
+
+        if frame_message is not None:
+            self.publish(frame_message)
+
+        return self.image_processor.last_detected_positions
+
+    def captureFrame(self):
+        """Requests the next unmodified frame read by the worker's image
+        source and waits for it. Results published while waiting are stored
+        in the image processor.
+
+        Args:
+            None
+
+        Returns:
+            An 8-bit image array.
+
+        Raises:
+            IOError: The worker process has exited.
+        """
+        self.sync()
+        self.__control_send.send(('capture',))
+        while True:
+            message = self.receive()
+            if message[0] == 'source':
+                return message[1]
+            self.publish(message)
+
+    def receive(self):
+        """Waits for the next message from the worker. Calibration markers
+        carried by a frame message are stored in the image processor, even if
+        the frame itself is skipped.
+
+        Args:
+            None
+
+        Returns:
+            A tuple whose first element names the message type.
+
+        Raises:
+            IOError: The worker process has exited.
+        """
+        try:
+            message = self.__result_recv.recv()
+        except EOFError:
+            raise IOError('Worker for %s exited' %
+                          self.image_processor.isi.name)
+        if message[0] == 'frame' and message[5] is not None:
+            self.image_processor.cal_points = (self.image_processor.cal_data,
+                                               message[5])
+        return message
+
+    def publish(self, message):
+        """Stores a processed frame result in the image processor and
+        releases the slot of the previous frame.
+
+        Args:
+            message: A frame message sent by the worker.
+        """
+        _, slot, detections, frame_time, frame_stats, _ = message
+        if self.slot is not None:
+            self.__control_send.send(('release', self.slot))
+        self.slot = slot
+        self.image_processor.last_frame = self.frames[slot]
+        self.image_processor.last_detected_positions = detections
+        self.image_processor.frame_time = frame_time
+        self.image_processor.frame_stats = frame_stats
+        self.frame_count += 1
+
+    def sync(self):
+        """Forwards the main process state to the worker if it has changed
+        since it was last forwarded.
+
+        Args:
+            None
+        """
+        # Read before collecting, so a concurrent change is sent next time
+        version = detection.STATE_VERSION
+        if version == self.state_version:
+            return
+        state = pickle.dumps(getWorkerState(self.image_processor),
+                             pickle.HIGHEST_PROTOCOL)
+        self.__control_send.send(('state', state))
+        self.state_version = version
+
+    def call(self, method, *args):
+        """Calls an ImageProcessor method in the worker process.
+
+        Args:
+            method: A string naming the ImageProcessor method.
+            args: Arguments passed to the method.
+        """
+        self.__control_send.send(('call', method, args))
+
+
+class WorkerApplication(object):
+    """Stands in for the Tactical Computer Application in a worker process.
+
+    Attributes:
+        config: A SafeConfigParser object.
+        image_processors: A list holding the worker's ImageProcessor object.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.image_processors = []
+
+
+def getConfigSnapshot(config):
+    """Copies the raw option values of a configuration.
+
+    Args:
+        config: A SafeConfigParser object.
+
+    Returns:
+        A dictionary of lists of (option, value) tuples keyed by section.
+    """
+    return dict((section, config.items(section, raw=True))
+                for section in config.sections())
+
+
+def createConfig(snapshot):
+    """Rebuilds a configuration from a snapshot.
+
+    Args:
+        snapshot: A dictionary created by getConfigSnapshot().
+
+    Returns:
+        A SafeConfigParser object.
+    """
+    config = SafeConfigParser()
+    for section, items in snapshot.iteritems():
+        config.add_section(section)
+        # Raw values are copied without checking interpolation
+        for option, value in items:
+            RawConfigParser.set(config, section, option, value)
+    return config
+
+
+def getWorkerState(image_processor):
+    """Collects the image processor state that is changed by the main process.
+
+    Args:
+        image_processor: An ImageProcessor object.
+
+    Returns:
+        A dictionary of picklable state.
+    """
+    scm = image_processor.scm
+    cal_data = image_processor.cal_data
+    return {
+        'frame_type': image_processor.frame_type,
+        'cal_data': dict((name, getattr(cal_data, name))
+                         for name in SYNCED_CAL_ATTRIBUTES),
+        'target_thresholds':
+            ObjectDetectionModule.TARGET_THRESHOLDS.getThresholds(),
+        'cal_thresholds': [threshold.getThresholds() for threshold
+                           in scm.getCalibrationThresholds()],
+        'display_colors': scm.getDisplayColors(),
+        'zone_distances': scm.getCalibrationDistances()}
+
+
+def setWorkerState(image_processor, state):
+    """Applies state forwarded by the main process to an image processor.
+
+    Args:
+        image_processor: An ImageProcessor object.
+        state: A dictionary created by getWorkerState().
+    """
+    scm = image_processor.scm
+    image_processor.frame_type = state['frame_type']
+    for name, value in state['cal_data'].iteritems():
+        setattr(image_processor.cal_data, name, value)
+    ObjectDetectionModule.TARGET_THRESHOLDS.setThresholds(
+        *state['target_thresholds'])
+    scm.setCalibrationThresholds('all', [DetectionThreshold(*threshold)
+                                         for threshold
+                                         in state['cal_thresholds']])
+    scm.setDisplayColors(*state['display_colors'])
+    SourceCalibrationModule.ZONE_DISTANCES = state['zone_distances']
+
+
+def runWorker(config_snapshot, source_class, source_args, ring, shape,
+              result_conn, control_conn):
+    """Worker process loop. Builds the image processor, then processes
+    frames continuously, publishing each frame into a shared memory slot
+    released by the main process. Waits for a slot to be released when the
+    main process holds all of them. When requested, the unmodified frame is
+    also sent to the main process.
+
+    The state of the main process arrives as the first control message.
+
+    Args:
+        config_snapshot: A dictionary created by getConfigSnapshot().
+        source_class: The class of the image source.
+        source_args: The arguments that create the image source.
+        ring: The shared memory array holding the frame slots.
+        shape: The shape of the array of frame slots.
+        result_conn: A Connection for sending results.
+        control_conn: A Connection for receiving state and calls.
+    """
+    # Imported here, as the image module imports this module
+    from image import ImageProcessor
+
+    tca = WorkerApplication(createConfig(config_snapshot))
+    image_processor = ImageProcessor(tca, source_class(*source_args))
+    tca.image_processors.append(image_processor)
+    frames = np.frombuffer(ring, np.uint8).reshape(shape)
+    free_slots = range(FRAME_RING_SIZE)
+    capture = False
+    while True:
+        while control_conn.poll():
+            capture |= handleControl(image_processor, control_conn.recv(),
+                                     free_slots)
+
+        sequence = image_processor.isi.frame_sequence
+        try:
+            detections = image_processor.process()
+        except IOError as error:
+            logging.error(error)
+            return
+
+        if capture:
+            result_conn.send(('source', image_processor.source_frame))
+            capture = False
+
+        # Only new frames are published
+        if image_processor.isi.frame_sequence == sequence:
+            time.sleep(NO_FRAME_DELAY)
+            continue
+
+        while not free_slots:
+            try:
+                message = control_conn.recv()
+            except EOFError:
+                return
+            capture |= handleControl(image_processor, message, free_slots)
+
+        slot = free_slots.pop(0)
+        publishFrame(image_processor.last_frame, frames[slot])
+        cal_points = None
+        if image_processor.cal_points is not None:
+            cal_points = image_processor.cal_points[1]
+            image_processor.cal_points = None
+        result_conn.send(('frame', slot, detections,
+                          image_processor.frame_time,
+                          image_processor.frame_stats, cal_points))
+
+
+def handleControl(image_processor, message, free_slots):
+    """Applies a message sent by the main process to a worker.
+
+    Args:
+        image_processor: The worker's ImageProcessor object.
+        message: A tuple whose first element names the message type.
+        free_slots: A list of shared memory slots the worker may write.
+
+    Returns:
+        True if the main process requested the next unmodified frame.
+    """
+    if message[0] == 'state':
+        setWorkerState(image_processor, pickle.loads(message[1]))
+    elif message[0] == 'release':
+        free_slots.append(message[1])
+    elif message[0] == 'capture':
+        return True
+    else:
+        getattr(image_processor, message[1])(*message[2])
+    return False
+
+
+def publishFrame(frame, slot):
+    """Copies a frame into a shared memory slot, converting its size and
+    channels to match the slot.
+
+    Args:
+        frame: An 8-bit image array.
+        slot: A shared 8-bit 3-channel image array.
+    """
+    height, width = slot.shape[:2]
+    if frame.shape[:2] != (height, width):
+        frame = cv.resize(frame, (width, height))
+    if frame.ndim == 2:
+        frame = frame[:, :, np.newaxis]
+    slot[...] = frame
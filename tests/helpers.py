@@ -0,0 +1,23 @@
+"""
+Provides helpers shared by the unit tests.
+
+Classes:
+    RandomTestCase
+"""
+import unittest
+
+import numpy as np
+
+# Seed of the random number generator of each test
+RANDOM_SEED = 0
+
+
+class RandomTestCase(unittest.TestCase):
+    """Test case with a seeded random number generator, so that random test
+    data is the same on every run.
+
+    Attributes:
+        random: A numpy RandomState object.
+    """
+    def setUp(self):
+        self.random = np.random.RandomState(RANDOM_SEED)
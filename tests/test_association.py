@@ -0,0 +1,130 @@
+"""
+Tests the global nearest neighbor association of detections with tracks.
+
+Classes:
+    SolveAssignmentTest
+    AssociateTest
+
+Functions:
+    bruteForce()
+"""
+import itertools
+import unittest
+
+import numpy as np
+
+from processors.data.association import associate
+from processors.data.association import solveAssignment
+from tests.helpers import RandomTestCase
+
+
+class SolveAssignmentTest(RandomTestCase):
+    """Compares the Hungarian method with every possible assignment."""
+
+    def checkAssignment(self, cost):
+        """Checks that an assignment has the most finite pairs and the
+        smallest total cost of the finite pairs.
+
+        Args:
+            cost: An N x M array of costs.
+        """
+        pairs = solveAssignment(cost)
+        self.assertEqual(len(pairs), min(cost.shape))
+        self.assertEqual(len(set(row for row, _ in pairs)), len(pairs))
+        self.assertEqual(len(set(col for _, col in pairs)), len(pairs))
+
+        costs = [cost[row, col] for row, col in pairs]
+        finite = [value for value in costs if np.isfinite(value)]
+        expected_count, expected_total = bruteForce(cost)
+        self.assertEqual(len(finite), expected_count)
+        self.assertAlmostEqual(sum(finite), expected_total)
+
+    def testSquare(self):
+        for size in range(1, 7):
+            for _ in range(20):
+                self.checkAssignment(self.random.rand(size, size))
+
+    def testRectangular(self):
+        for rows, cols in ((1, 4), (2, 5), (3, 6), (4, 2), (6, 3)):
+            for _ in range(20):
+                self.checkAssignment(self.random.rand(rows, cols))
+
+    def testGated(self):
+        for rows, cols in ((3, 3), (4, 5), (5, 4), (6, 6)):
+            for _ in range(20):
+                cost = self.random.rand(rows, cols)
+                cost[self.random.rand(rows, cols) < 0.5] = np.inf
+                self.checkAssignment(cost)
+
+    def testAllGated(self):
+        cost = np.empty((2, 3))
+        cost.fill(np.inf)
+        self.checkAssignment(cost)
+
+    def testEmpty(self):
+        self.assertEqual(solveAssignment(np.empty((0, 3))), [])
+        self.assertEqual(solveAssignment(np.empty((3, 0))), [])
+
+    def testPrefersMorePairs(self):
+        # The cheapest pair would leave the other track unassigned
+        cost = np.array([[1.0, 2.0],
+                         [0.1, np.inf]])
+        self.assertEqual(solveAssignment(cost), [(0, 1), (1, 0)])
+
+
+class AssociateTest(unittest.TestCase):
+    """Tests the association of detections with track positions."""
+
+    def testCrossingTracks(self):
+        # Taking the nearest detection in track order would leave the
+        # second track without a detection inside its gate
+        tracks = [[0.0, 0.0], [1.0, 0.0]]
+        detections = [[0.7, 0.0], [-0.8, 0.0]]
+        cost, matches, unmatched = associate(tracks, [1.0, 1.0], detections)
+        self.assertEqual(cost.shape, (2, 2))
+        self.assertEqual(sorted(matches), [(0, 1), (1, 0)])
+        self.assertEqual(unmatched, [])
+
+    def testGate(self):
+        tracks = [[0.0, 0.0], [10.0, 0.0]]
+        detections = [[0.5, 0.0], [5.0, 0.0], [10.0, 2.5]]
+        cost, matches, unmatched = associate(tracks, [1.0, 3.0], detections)
+        self.assertTrue(np.isinf(cost[0, 1]))
+        self.assertTrue(np.isinf(cost[1, 1]))
+        self.assertEqual(sorted(matches), [(0, 0), (1, 2)])
+        self.assertEqual(unmatched, [1])
+
+    def testNoTracks(self):
+        cost, matches, unmatched = associate(np.empty((0, 2)), [],
+                                             [[1.0, 1.0], [2.0, 2.0]])
+        self.assertEqual(cost.shape, (0, 2))
+        self.assertEqual(matches, [])
+        self.assertEqual(unmatched, [0, 1])
+
+
+def bruteForce(cost):
+    """Finds the most pairs with finite costs and their smallest total cost
+    over every possible assignment.
+
+    Args:
+        cost: An N x M array of costs.
+
+    Returns:
+        A two-element tuple of the number of pairs and their total cost.
+    """
+    if cost.shape[0] > cost.shape[1]:
+        cost = cost.T
+    rows, cols = cost.shape
+    best = (0, 0.0)
+    for assignment in itertools.permutations(range(cols), rows):
+        costs = [cost[row, col] for row, col in enumerate(assignment)]
+        finite = [value for value in costs if np.isfinite(value)]
+        candidate = (len(finite), sum(finite))
+        if (candidate[0] > best[0] or
+                (candidate[0] == best[0] and candidate[1] < best[1])):
+            best = candidate
+    return best
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests the clustering of detections from several image processors.
+
+Classes:
+    ClusterPositionsTest
+"""
+import unittest
+
+import numpy as np
+
+from processors.data.correlation import TargetCorrelationModule
+from tests.helpers import RandomTestCase
+
+
+class DataProcessorStub(object):
+    """Data processor without a configuration, so the default merge radius
+    is used."""
+    config = None
+
+
+class ClusterPositionsTest(RandomTestCase):
+    """Tests clustering positions within the merge radius."""
+
+    def setUp(self):
+        RandomTestCase.setUp(self)
+        self.tcm = TargetCorrelationModule(DataProcessorStub())
+        self.radius = TargetCorrelationModule.MERGE_RADIUS
+
+    def testPermutation(self):
+        for _ in range(50):
+            # Crowded detections, so that many are within the merge radius
+            positions = self.random.uniform(0, 8 * self.radius, (40, 2))
+            expected = self.tcm.clusterPositions(positions)
+            for _ in range(5):
+                shuffled = positions[self.random.permutation(len(positions))]
+                np.testing.assert_allclose(
+                    self.tcm.clusterPositions(shuffled), expected)
+
+    def testChain(self):
+        # The ends of the chain are further apart than the merge radius
+        step = 0.8 * self.radius
+        positions = np.array([[0.0, 0.0], [step, 0.0], [2 * step, 0.0]])
+        clusters = self.tcm.clusterPositions(positions)
+        np.testing.assert_allclose(clusters,
+                                   [[step / 2, 0.0], [2 * step, 0.0]])
+        np.testing.assert_allclose(
+            self.tcm.clusterPositions(positions[::-1]), clusters)
+
+    def testDiameter(self):
+        positions = self.random.uniform(0, 6 * self.radius, (60, 2))
+        clusters = self.tcm.clusterPositions(positions)
+        self.assertTrue(len(clusters) < len(positions))
+
+        # Every position lies within the merge radius of some cluster mean
+        distances = np.hypot(
+            positions[:, np.newaxis, 0] - clusters[np.newaxis, :, 0],
+            positions[:, np.newaxis, 1] - clusters[np.newaxis, :, 1])
+        self.assertTrue((distances.min(axis=1) < self.radius).all())
+
+    def testCentroid(self):
+        positions = np.array([[1.0, 1.0], [1.2, 1.0], [1.1, 1.3],
+                              [5.0, 5.0]])
+        np.testing.assert_allclose(self.tcm.clusterPositions(positions),
+                                   [[1.1, 1.1], [5.0, 5.0]])
+
+    def testFewPositions(self):
+        self.assertEqual(self.tcm.clusterPositions(np.empty((0, 2))).shape,
+                         (0, 2))
+        np.testing.assert_array_equal(
+            self.tcm.clusterPositions(np.array([[1.0, 2.0]])), [[1.0, 2.0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
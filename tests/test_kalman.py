@@ -0,0 +1,147 @@
+"""
+Tests the batched Kalman filter bank against a single reference filter.
+
+Classes:
+    KalmanFilterBankTest
+
+Functions:
+    referenceUpdate()
+"""
+import unittest
+
+import numpy as np
+
+from processors.data.kalman import KalmanFilterBank
+from tests.helpers import RandomTestCase
+
+TIME_STEP = 0.1
+PROCESS_NOISE = 1e-3
+MEASUREMENT_NOISE = 1e-2
+
+
+class KalmanFilterBankTest(RandomTestCase):
+    """Tests the filter bank."""
+
+    def setUp(self):
+        RandomTestCase.setUp(self)
+        self.bank = KalmanFilterBank(TIME_STEP, PROCESS_NOISE,
+                                     MEASUREMENT_NOISE, capacity=2)
+
+    def testVariableTimeStep(self):
+        # Filters updated at different, irregular times
+        starts = [(0.0, 0.0), (5.0, 1.0), (-2.0, 3.0)]
+        slots = [self.bank.allocate(pos) for pos in starts]
+        references = [(np.array(pos + (0.0, 0.0)), np.eye(4), None)
+                      for pos in starts]
+
+        time = 0.0
+        for _ in range(30):
+            time += self.random.uniform(0.02, 0.3)
+            updated = [i for i in range(len(slots))
+                       if self.random.rand() < 0.7]
+            if not updated:
+                continue
+            measurements = self.random.uniform(-5, 5, (len(updated), 2))
+            states, predictions = self.bank.update(
+                [slots[i] for i in updated], measurements, time)
+
+            for row, i in enumerate(updated):
+                references[i] = referenceUpdate(references[i],
+                                                measurements[row], time)
+                state, covariance, _ = references[i]
+                np.testing.assert_allclose(states[row], state)
+                np.testing.assert_allclose(
+                    self.bank.covariances[slots[i]], covariance)
+
+                # The next state is predicted one measured interval ahead
+                interval = self.bank.intervals[slots[i]]
+                np.testing.assert_allclose(
+                    predictions[row], np.dot(transition(interval), state))
+
+    def testMeasuredInterval(self):
+        slot = self.bank.allocate((0.0, 0.0))
+        self.bank.update([slot], [[0.0, 0.0]], 1.0)
+        self.assertEqual(self.bank.intervals[slot], TIME_STEP)
+        self.bank.update([slot], [[0.1, 0.0]], 1.25)
+        self.assertAlmostEqual(self.bank.intervals[slot], 0.25)
+        self.assertEqual(self.bank.times[slot], 1.25)
+
+    def testStaleMeasurement(self):
+        slot = self.bank.allocate((0.0, 0.0))
+        self.bank.update([slot], [[0.0, 0.0]], 1.0)
+        self.bank.update([slot], [[0.2, 0.1]], 1.1)
+        state = self.bank.states[slot].copy()
+        covariance = self.bank.covariances[slot].copy()
+        predicted_state = self.bank.predicted_states[slot].copy()
+
+        for time in (1.1, 1.05):
+            states, predictions = self.bank.update([slot], [[3.0, 3.0]], time)
+            np.testing.assert_array_equal(states[0], state)
+            np.testing.assert_array_equal(predictions[0], predicted_state)
+            np.testing.assert_array_equal(self.bank.covariances[slot],
+                                          covariance)
+            self.assertEqual(self.bank.times[slot], 1.1)
+
+    def testSlots(self):
+        slots = [self.bank.allocate((i, i)) for i in range(5)]
+        self.assertEqual(len(set(slots)), 5)
+        self.assertTrue(len(self.bank.active) >= 5)
+        self.assertTrue(self.bank.active[slots].all())
+
+        self.bank.release(slots[1])
+        self.assertFalse(self.bank.active[slots[1]])
+        slot = self.bank.allocate((7.0, 8.0), (1.0, 2.0))
+        self.assertEqual(slot, slots[1])
+        self.assertTrue(np.isnan(self.bank.times[slot]))
+        np.testing.assert_array_equal(self.bank.states[slot],
+                                      [7.0, 8.0, 1.0, 2.0])
+
+        self.bank.clear()
+        self.assertFalse(self.bank.active.any())
+
+
+def transition(time_step):
+    """Returns the constant velocity state transition matrix.
+
+    Args:
+        time_step: The number of seconds to propagate.
+
+    Returns:
+        A 4 x 4 array
+    """
+    matrix = np.eye(4)
+    matrix[0, 2] = matrix[1, 3] = time_step
+    return matrix
+
+
+def referenceUpdate(reference, measurement, time):
+    """Propagates and corrects a single Kalman filter with the textbook
+    matrix equations.
+
+    Args:
+        reference: A three-element tuple of the state, covariance and time
+            of the last update, which is None before the first update.
+        measurement: A measured position.
+        time: The time in seconds of the measurement.
+
+    Returns:
+        A three-element tuple of the corrected state, covariance and time.
+    """
+    state, covariance, last_time = reference
+    time_step = 0.0 if last_time is None else time - last_time
+    process_noise = np.eye(4) * PROCESS_NOISE * time_step / TIME_STEP
+    state = np.dot(transition(time_step), state)
+    covariance = np.dot(np.dot(transition(time_step), covariance),
+                        transition(time_step).T) + process_noise
+
+    observation = np.eye(2, 4)
+    innovation = (np.dot(np.dot(observation, covariance), observation.T) +
+                  np.eye(2) * MEASUREMENT_NOISE)
+    gain = np.dot(np.dot(covariance, observation.T), np.linalg.inv(innovation))
+    state = state + np.dot(gain, measurement - np.dot(observation, state))
+    covariance = np.dot(np.eye(4) - np.dot(gain, observation), covariance)
+    return (state, covariance, time)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+Tests trajectory prediction from running least squares sums.
+
+Classes:
+    FitLinesTest
+    PredictTest
+
+Functions:
+    fitReference()
+"""
+import unittest
+
+import numpy as np
+
+from processors.data.prediction import fitLines
+from processors.data.prediction import intersectCircle
+from processors.data.prediction import predict
+from processors.data.prediction import predictAllFromSums
+from processors.data.prediction import predictFromSums
+from processors.data.track_store import lineTerms
+from tests.helpers import RandomTestCase
+
+
+class FitLinesTest(RandomTestCase):
+    """Compares lines fit from sums with numpy.linalg.lstsq."""
+
+    def checkFit(self, positions):
+        """Checks the line fit to positions from their sums.
+
+        Args:
+            positions: An N x 2 array of positions.
+        """
+        slopes, y_incpts = fitLines([len(positions)],
+                                    [lineTerms(positions).sum(axis=0)])
+        slope, y_incpt = fitReference(positions)
+        self.assertAlmostEqual(slopes[0], slope, places=9)
+        self.assertAlmostEqual(y_incpts[0], y_incpt, places=9)
+
+    def testRandom(self):
+        for _ in range(50):
+            count = self.random.randint(2, 20)
+            self.checkFit(self.random.uniform(-20, 20, (count, 2)))
+
+    def testVerticalTrack(self):
+        # All positions share one x value, so lstsq returns the minimum
+        # norm solution
+        for x in (0.0, 2.0, -3.5):
+            positions = np.column_stack(
+                (np.repeat(x, 6), np.linspace(1.0, 9.0, 6)))
+            self.checkFit(positions)
+
+    def testSinglePosition(self):
+        self.checkFit(np.array([[3.0, 4.0]]))
+
+    def testSeveralLines(self):
+        positions = [self.random.uniform(-20, 20, (count, 2))
+                     for count in (3, 7, 12)]
+        positions.append(np.column_stack((np.ones(4), np.arange(4.0))))
+        slopes, y_incpts = fitLines(
+            [len(points) for points in positions],
+            [lineTerms(points).sum(axis=0) for points in positions])
+        for points, slope, y_incpt in zip(positions, slopes, y_incpts):
+            expected = fitReference(points)
+            self.assertAlmostEqual(slope, expected[0], places=9)
+            self.assertAlmostEqual(y_incpt, expected[1], places=9)
+
+
+class PredictTest(RandomTestCase):
+    """Tests the prediction line intersections."""
+
+    def testIntersectCircle(self):
+        x, y = intersectCircle(1.0, 0.0, 10.0)
+        self.assertAlmostEqual(x, 10.0 / np.sqrt(2))
+        self.assertAlmostEqual(y, 10.0 / np.sqrt(2))
+        # The intersection in front of the origin is preferred
+        x, y = intersectCircle(-1.0, 0.0, 10.0)
+        self.assertTrue(y > 0)
+        self.assertTrue(intersectCircle(0.0, 20.0, 10.0) is None)
+
+    def testFromSums(self):
+        for _ in range(20):
+            positions = self.random.uniform(-3, 3, (8, 2)) + (0.0, 5.0)
+            sums = lineTerms(positions).sum(axis=0)
+            expected = predict(positions.tolist(), 10.0, 5)
+            actual = predictFromSums(len(positions), sums, 10.0, 5)
+            if expected is None:
+                self.assertTrue(actual is None)
+            else:
+                np.testing.assert_allclose(actual, expected)
+
+    def testTooFewPositions(self):
+        sums = lineTerms([[0.0, 1.0], [1.0, 2.0]]).sum(axis=0)
+        self.assertTrue(predictFromSums(2, sums, 10.0, 5) is None)
+        self.assertTrue(predictFromSums(0, np.zeros(4), 10.0, 0) is None)
+
+    def testAllFromSums(self):
+        positions = [self.random.uniform(-3, 3, (count, 2)) + (0.0, 4.0)
+                     for count in (8, 3, 10, 6)]
+        # A line that does not reach the prediction line
+        positions.append(np.column_stack((np.linspace(0, 5, 6),
+                                          np.repeat(20.0, 6))))
+        counts = [len(points) for points in positions]
+        sums = [lineTerms(points).sum(axis=0) for points in positions]
+
+        predictions = predictAllFromSums(counts, sums, 10.0, 5)
+        self.assertEqual(predictions.shape, (len(positions), 2))
+        for count, total, prediction in zip(counts, sums, predictions):
+            expected = None
+            if count >= 5:
+                expected = predictFromSums(count, total, 10.0, 5)
+            if expected is None:
+                self.assertTrue(np.isnan(prediction).all())
+            else:
+                np.testing.assert_allclose(prediction, expected)
+
+
+def fitReference(positions):
+    """Fits a line to positions with numpy.linalg.lstsq.
+
+    Args:
+        positions: An N x 2 array of positions.
+
+    Returns:
+        A two-element tuple of the slope and y intercept.
+    """
+    positions = np.asarray(positions, np.float64)
+    matrix = np.column_stack((positions[:, 0], np.ones(len(positions))))
+    slope, y_incpt = np.linalg.lstsq(matrix, positions[:, 1], rcond=-1)[0]
+    return (slope, y_incpt)
+
+
+if __name__ == '__main__':
+    unittest.main()
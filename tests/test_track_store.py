@@ -0,0 +1,118 @@
+"""
+Tests the struct-of-arrays track store and its position history rings.
+
+Classes:
+    HistoryRingTest
+    TrackStoreTest
+"""
+import unittest
+
+import numpy as np
+
+from processors.data.track_store import HistoryRing
+from processors.data.track_store import TrackStore
+from processors.data.track_store import lineTerms
+from tests.helpers import RandomTestCase
+
+
+class HistoryRingTest(RandomTestCase):
+    """Tests the position history ring buffers."""
+
+    def testWrap(self):
+        ring = HistoryRing(2, 4, True)
+        positions = self.random.uniform(-10, 10, (11, 2)).astype(np.float32)
+        for count, pos in enumerate(positions, 1):
+            ring.append(1, pos)
+            expected = positions[max(count - 4, 0):count]
+            np.testing.assert_array_equal(ring.get(1), expected)
+            self.assertEqual(ring.counts[1], len(expected))
+        self.assertEqual(ring.counts[0], 0)
+        self.assertEqual(len(ring.get(0)), 0)
+        self.assertEqual(len(ring), 4)
+
+    def testSums(self):
+        ring = HistoryRing(1, 5, True)
+        positions = self.random.uniform(-100, 100, (23, 2))
+        for count, pos in enumerate(positions, 1):
+            ring.append(0, pos)
+            expected = lineTerms(ring.get(0)).sum(axis=0)
+            np.testing.assert_allclose(ring.sums[0], expected, rtol=1e-9,
+                                       atol=1e-9)
+            if count % 5 == 0:
+                # Sums are recalculated from the stored positions on wrap
+                self.assertEqual(ring.ends[0], 0)
+                np.testing.assert_array_equal(ring.sums[0], expected)
+
+    def testWithoutSums(self):
+        ring = HistoryRing(1, 3)
+        ring.append(0, (1.0, 2.0))
+        self.assertTrue(ring.sums is None)
+        np.testing.assert_array_equal(ring.get(0), [[1.0, 2.0]])
+
+    def testClearAndGrow(self):
+        ring = HistoryRing(2, 3, True)
+        ring.append(0, (1.0, 2.0))
+        ring.append(1, (3.0, 4.0))
+        ring.clear(0)
+        self.assertEqual(len(ring.get(0)), 0)
+        np.testing.assert_array_equal(ring.sums[0], 0)
+
+        ring.grow()
+        self.assertEqual(len(ring.counts), 4)
+        np.testing.assert_array_equal(ring.get(1), [[3.0, 4.0]])
+        self.assertEqual(ring.counts[3], 0)
+        np.testing.assert_array_equal(ring.sums[3], 0)
+
+    def testLineTerms(self):
+        np.testing.assert_array_equal(lineTerms((2.0, 3.0)),
+                                      [2.0, 3.0, 6.0, 4.0])
+        np.testing.assert_array_equal(lineTerms([[2.0, 3.0], [1.0, -1.0]]),
+                                      [[2.0, 3.0, 6.0, 4.0],
+                                       [1.0, -1.0, -1.0, 1.0]])
+
+
+class TrackStoreTest(unittest.TestCase):
+    """Tests slot allocation and expiry in the track store."""
+
+    def setUp(self):
+        self.store = TrackStore(4, 3, capacity=2)
+
+    def testAllocate(self):
+        slots = [self.store.allocate() for _ in range(5)]
+        self.assertEqual(len(set(slots)), 5)
+        self.assertTrue(self.store.active[slots].all())
+        self.assertEqual(len(self.store.ids), len(self.store.active))
+        self.assertEqual(len(self.store.filtered_history.counts),
+                         len(self.store.active))
+
+        slot = slots[2]
+        self.store.positions[slot] = (1.0, 2.0)
+        self.store.kalman_slots[slot] = 3
+        self.store.prediction_history.append(slot, (1.0, 2.0))
+        self.store.release(slot)
+        self.assertFalse(self.store.active[slot])
+
+        # A reused slot starts from the default values
+        self.assertEqual(self.store.allocate(), slot)
+        np.testing.assert_array_equal(self.store.positions[slot], 0)
+        self.assertEqual(self.store.kalman_slots[slot], -1)
+        self.assertTrue(np.isnan(self.store.predictions[slot]).all())
+        self.assertEqual(len(self.store.prediction_history.get(slot)), 0)
+
+    def testFindExpired(self):
+        slots = [self.store.allocate() for _ in range(3)]
+        self.store.last_updates[slots] = (1.0, 5.0, 2.0)
+        self.store.release(slots[0])
+        np.testing.assert_array_equal(self.store.findExpired(6.0, 3.5),
+                                      [slots[2]])
+
+    def testClear(self):
+        for _ in range(3):
+            self.store.allocate()
+        self.store.clear()
+        self.assertFalse(self.store.active.any())
+        self.assertEqual(len(self.store.findExpired(100.0, 0.0)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,7 @@ import os
 import display.gui
 from processors.image import image
 from processors.image import ImageProcessor
+from processors.image.monitor import CalibrationMonitor
 from processors.data import DataProcessor
 #from processors.data import correlation
 from display.tactical import TacticalDisplay
@@ -22,6 +23,11 @@ class App(object):
         # Setup processors
         self.data_processor = DataProcessor(self)
         self.image_processors = image.createImageProcessors(self)
+        self.calibration_monitor = None
+        if config.getboolean('calibration', 'drift_monitor'):
+            self.calibration_monitor = CalibrationMonitor(
+                self.image_processors, config)
+            self.calibration_monitor.start()
 #        self.corr = correlation.CorrelationModule(self)
 
         # Setup GUI
@@ -39,8 +45,8 @@ class App(object):
         # Key bindings
         #TODO Clean up syntax, implement dynamic frame types
         self.ui.addKeyEvent("p", lambda: map(lambda ip: ip.saveFrame(processed=False), self.image_processors))
-        self.ui.addKeyEvent("r", lambda: map(lambda ip: ip.isi.startRecord(), self.image_processors))
-        self.ui.addKeyEvent("e", lambda: map(lambda ip: ip.isi.stopRecord(), self.image_processors))
+        self.ui.addKeyEvent("r", lambda: map(lambda ip: ip.startRecord(), self.image_processors))
+        self.ui.addKeyEvent("e", lambda: map(lambda ip: ip.stopRecord(), self.image_processors))
         #for i in range(len(ImageProcessor.frame_types)):
             #ui.addKeyEvent(str(i), lambda: map(((lambda iv: lambda ip: ip.setFrameType(iv))(i)), image_processors))
         self.ui.addKeyEvent("0", lambda: map(lambda ip: ip.setFrameType(0), self.image_processors))
@@ -49,12 +55,22 @@ class App(object):
         #self.ui.addKeyEvent("d", lambda: map(lambda ip: ip.scm.calibrate(), self.image_processors))
         self.ui.addKeyEvent("c", lambda: ColorDialog(self.ui.root))
         self.ui.addKeyEvent("q", lambda: self.tactical.clearTargetData())
-        self.ui.addKeyEvent("k", lambda: map(lambda ip: ip.scm.saveCalibrationData(), self.image_processors))
-        self.ui.addKeyEvent("l", lambda: map(lambda ip: ip.scm.loadCalibrationData(), self.image_processors))
+        self.ui.addKeyEvent("k", lambda: map(lambda ip: ip.scm.submitJob(ip.scm.saveCalibrationData), self.image_processors))
+        self.ui.addKeyEvent("l", lambda: map(lambda ip: ip.scm.submitJob(ip.scm.loadCalibrationData), self.image_processors))
         self.ui.addKeyEvent("d", lambda: self.tactical.toggleRunningDogTest())
 
     def run(self):
-        self.ui.start(self.main)
+        try:
+            self.ui.start(self.main)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.calibration_monitor is not None:
+            self.calibration_monitor.stop()
+        for image_processor in self.image_processors:
+            image_processor.stopWorker()
+            image_processor.isi.stopCapture()
 
     def main(self):
 